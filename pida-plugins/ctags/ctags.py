@@ -29,15 +29,20 @@ import gtk
 
 # PIDA Imports
 
+from pygtkhelpers.gthreads import AsyncTask
+
 # core
 from pida.core.service import Service
 from pida.core.events import EventsConfig
+from pida.core.projects import REFRESH_PRIORITY
 from pida.core.actions import ActionsConfig, TYPE_NORMAL
 from pida.core.options import OptionsConfig
 from pida.core.languages import (LanguageService, Outliner, Validator,
     Completer, LanguageServiceFeaturesConfig, LanguageInfo, Definer, Documentator)
 
-from pida.utils.languages import LANG_PRIO, OutlineItem
+from pida.utils.languages import LANG_PRIO, OutlineItem, Definition
+
+from .tagdb import TagDatabase, parse_tag_line
 
 # locale
 from pida.core.locale import Locale
@@ -87,6 +92,35 @@ SUPPORTED_LANGS = build_language_list(DOCTYPES)
 #         self.svc.execute_current_document()
 #
 
+# long names of the ctags kinds, see ctags --list-kinds
+KIND_NAMES = {
+    'm': 'member',
+    'c': 'class',
+    'd': 'define',
+    'e': 'enumeration',
+    'f': 'function',
+    'g': 'enumeration_name',
+    'n': 'namespace',
+    'p': 'prototype',
+    's': 'structure',
+    't': 'typedef',
+    'u': 'union',
+    'v': 'variable',
+}
+
+
+def kind_name(kind):
+    """
+    Returns the type for a ctags kind, which is a single letter or
+    already the long name with --fields=+K
+    """
+    if not kind:
+        return ''
+    if len(kind) == 1:
+        return KIND_NAMES.get(kind, 'unknown')
+    return kind
+
+
 class CtagsTokenList(object):
     def __init__(self, *args, **kwargs):
         self._count = 0
@@ -177,6 +211,34 @@ class CtagItem(OutlineItem):
     def __repr__(self):
         return "<CtagItem %s %s %s >" %(self.name, self.parent_name, self.fullname)
 
+
+def make_item(name, filename, line, kind, scope):
+    type_ = kind_name(kind)
+    return CtagItem(name=name,
+                    filename=filename,
+                    linenumber=line,
+                    type=type_,
+                    filter_type=type_,
+                    parent_name=scope)
+
+
+def parent_first(items):
+    """
+    Yields the items so that every parent comes before its children,
+    otherwise the order is kept.  Parents not in items are ignored.
+    """
+    items = list(items)
+    pending = set(id(item) for item in items)
+    for item in items:
+        chain = []
+        while item is not None and id(item) in pending:
+            pending.discard(id(item))
+            chain.append(item)
+            item = item.parent
+        for x in reversed(chain):
+            yield x
+
+
 class CtagsOutliner(Outliner):
 
     priority = LANG_PRIO.GOOD
@@ -187,33 +249,41 @@ class CtagsOutliner(Outliner):
     def run(self):
         if not self.document.filename:
             return
-        try:
-            filename, istmp = self._update_tagfile()
-        except OSError as e:
-            return
-        tags = self._parse_tagfile(filename)
-
-        if self.document.project:
-            self.document.project['ctags_cache'] = tags
-        if istmp:
-            os.unlink(filename)
-        items = list(tags.filter_items(self.document.filename))
-
-        def pop_parent_first(item):
-            p = item.parent
-            if p is not None and p in items:
-                for i in pop_parent_first(p):
-                    yield i
-            else:
-                items.remove(item)
-                yield item
-        while len(items) != 0:
-            item = items[0]
-            for x in pop_parent_first(item):
-                yield x
-
-
-    def _update_tagfile(self, options = ("-n",), temp=False):
+        tags = self._get_database_tags()
+        if tags is None:
+            try:
+                filename, istmp = self._update_tagfile()
+            except OSError as e:
+                return
+            tags = self._parse_tagfile(filename)
+            if istmp:
+                os.unlink(filename)
+        for item in parent_first(tags.filter_items(self.document.filename)):
+            yield item
+
+    def _get_database_tags(self):
+        """
+        Returns the tags of the document from the project tag database,
+        the file is tagged again if it changed since. None if the document
+        is not part of a project
+        """
+        project = self.document.project
+        if self.svc is None or project is None:
+            return None
+        relpath = project.get_relative_path_for(self.document.filename)
+        if not relpath:
+            return None
+        relpath = os.sep.join(relpath)
+        db = self.svc.get_tag_database(project)
+        mtime = db.get_mtime(relpath)
+        if mtime is None or int(mtime) != self.document.modified_time:
+            db.update_file(relpath)
+        rv = CtagsTokenList()
+        for name, path, line, kind, scope in db.get_file_tags(relpath):
+            rv.add(make_item(name, self.document.filename, line, kind, scope))
+        return rv
+
+    def _update_tagfile(self, options=("-n", "--fields=+z"), temp=False):
         """ filestr is a string, could be *.* or explicit paths """
 
         # create tempfile
@@ -238,147 +308,124 @@ class CtagsOutliner(Outliner):
         return (taglib, temp)
 
     def _parse_tagfile(self, tagfile):
-        """ Parse the given document and write the tags to a gtk.TreeModel.
-        
-        The parser uses the ctags command from the shell to create a ctags file,
-        then parses the file, and finally populates a treemodel. """
-        #TODO: the type is language dependent, and tagfile should by parsed 
-        # language dependent.
-
-        # refactoring noise    
-        #doc = self.document
-        #ls = self.model        
-        #ls.clear()
-        #tmpfile = self._generate_tagfile_from_document(doc)
-        #if tmpfile is None: return ls
-        
-        # A list of lists. Matches the order found in tag files.
-        # identifier, path to file, line number, type, and then more magical things
-        tokenlist = [] 
+        """
+        Parse the tag file into a :class:`CtagsTokenList`.
+
+        The file is streamed line by line, kinds and parents are taken from
+        the extension fields.
+        """
         rv = CtagsTokenList()
-        #names = {}
-        h = open(tagfile)
-        for r in h.readlines():
-            tokens = r.strip().split("\t")
-            if tokens[0][:2] == "!_": continue
-
-            # convert line numbers to an int
-            tokens[2] =  int(''.join(x for x in tokens[2] if x in '1234567890'))
-            
-            tokenlist.append(tokens)
-        h.close()
-
-        for tokens in tokenlist:
-        
-            parent_name = self._get_parent(tokens)
-            
-            # escape blanks in file path
-            # FIXME
-            #tokens[1] =  str( gnomevfs.get_uri_from_local_path(tokens[1]) )
-            
-            # make sure tokens[4] contains type code
-            if len(tokens) == 3:
-                tokens.append("")
-            else:
-                tokens[3] = self._get_type(tokens)
-            
-            item = CtagItem(name=tokens[0],
-                            filename=tokens[1],
-                            linenumber=int(tokens[2]),
-                            type=tokens[3],
-                            filter_type=tokens[3],
-                            parent_name=parent_name)
-            rv.add(item)
+        with open(tagfile) as h:
+            for line in h:
+                tag = parse_tag_line(line)
+                if tag is not None:
+                    rv.add(make_item(*tag))
         return rv
 
-    def _get_type(self, tokrow):
-        """ Returns a char representing the token type or False if none were found.
-
-        According to the ctags docs, possible types are:
-        c   class name
-        d   define (from #define XXX)
-        e   enumerator
-        f   function or method name
-        F   file name
-        g   enumeration name
-        m   member (of structure or class data)
-        p   function prototype
-        s   structure name
-        t   typedef
-        u   union name
-        v   variable        
-        """
-        def v2t(i):
-            mapping = {
-                'm': 'member',
-                'c': 'class',
-                'd': 'define',
-                'e': 'enumeration',
-                'f': 'function',
-                'g': 'enumeration_name',
-                'n': 'namespace',
-                'p': 'prototype',
-                's': 'structure',
-                't': 'typedef',
-                'u': 'union',
-                'v': 'variable',
-            }
-            return mapping.get(i, 'unknown')
-
-        if len(tokrow) == 4 and isinstance(tokrow[3], int):
-            return tokrow[3]
-        if len(tokrow) == 3: return
-        for i in tokrow[3:]:
-            if len(i) == 1:
-                return v2t(i)  # most common case: just one char
-            elif i[:4] == "kind":
-                return v2t(i[5:])
-            return 'unknown'
-        return 'unknown'
-
-
-    def _get_container_name(self, tokrow):
-        """ Usually, we can assume that the parent's name is the same
-            as the name of the token. In some cases (typedefs), this
-            doesn't work (see Issue 13) """
-        
-        if self._get_type(tokrow) == "t":
-            try:
-                t = tokrow[4]
-                a = t.split(":")
-                return a[len(a)-1]
-            except:
-                pass
-        return tokrow[0]
-    
-        
-    # def _is_container(self, tokrow):
-    #     """ class, enumerations, structs and unions are considerer containers.
-    #         See Issue 13 for some issues we had with this.
-    #     """
-    #     # XXX: whether it is a container should be decided by whether it has 
-    #     # children, not by type.
-    #     return self._get_type(tokrow) in (
-    #         'class', 'enumeration_name',
-    #         'structure', 'union', 'typedef')
-
-    def _get_parent(self, tokrow):
-        if len(tokrow) <= 3: return
-        # Iterate through all items in the tag.
-        # TODO: Not sure if needed
-        for i in tokrow[4:]:
-            a = i.split(":", 1)
-            # if a[0] in ("class","struct","union","enum"): 
-            #     return a[1]
-            if len(a) == 2:
-                return a[1]
-        return None
+
+_WORD_CHAR = re.compile(r'\w', re.UNICODE)
+
+
+class CtagsDefiner(Definer):
+
+    priority = LANG_PRIO.LOW
+    name = "ctags"
+    plugin = "ctags"
+    description = _("Looks the symbol up in the project tags")
+
+    def run(self, buffer, offset):
+        project = self.document.project
+        if self.svc is None or project is None:
+            return
+        start = end = offset
+        while start > 0 and _WORD_CHAR.match(buffer[start - 1]):
+            start -= 1
+        while end < len(buffer) and _WORD_CHAR.match(buffer[end]):
+            end += 1
+        word = buffer[start:end]
+        if not word:
+            return
+        db = self.svc.get_tag_database(project)
+        return [Definition(file_name=os.path.join(project.source_directory,
+                                                  path),
+                           line=line)
+                for name, path, line, kind, scope in db.find(word)]
+
+
+class CtagsEvents(EventsConfig):
+
+    def subscribe_all_foreign(self):
+        self.subscribe_foreign('buffer', 'document-saved',
+            self.svc.on_document_saved)
+
+
+class CtagsFeatures(LanguageServiceFeaturesConfig):
+
+    def subscribe_all_foreign(self):
+        super(CtagsFeatures, self).subscribe_all_foreign()
+        self.subscribe_foreign('project', 'project_refresh',
+            self.do_refresh)
+
+    def do_refresh(self, project, callback):
+        self.svc.update_tag_database(project)
+        callback()
+
+    do_refresh.priority = REFRESH_PRIORITY.POST_FILECACHE
+    do_refresh.requires = ('filecache',)
 
 
 class Ctags(LanguageService):
 
     language_name = [x.internal for x in SUPPORTED_LANGS]
     outliner_factory = CtagsOutliner
+    definer_factory = CtagsDefiner
+
+    events_config = CtagsEvents
+    features_config = CtagsFeatures
+
+    def pre_start(self):
+        self._tag_databases = {}
+
+    def stop(self):
+        for db in self._tag_databases.values():
+            db.close()
+        super(Ctags, self).stop()
+
+    def get_tag_database(self, project):
+        db = self._tag_databases.get(project)
+        if db is None:
+            db = self._tag_databases[project] = TagDatabase(project)
+        return db
+
+    def is_tagged(self, relpath):
+        """True if ctags knows the language of the file"""
+        doctype = DOCTYPES.type_by_filename(relpath)
+        return doctype is not None and doctype.internal in self.language_name
+
+    def update_tag_database(self, project):
+        """
+        Sync the tag database with the file index of the project
+
+        Files edited in place outside of PIDA are only picked up with the
+        file watcher or a full project refresh, their mtime in the index
+        stays the same otherwise.
+        """
+        files = dict((relpath, mtime) for relpath, mtime in
+                     project.indexer.get_file_mtimes().iteritems()
+                     if self.is_tagged(relpath))
+        changed = self.get_tag_database(project).sync(files)
+        self.log.debug('tags of {project}: {changed} files updated',
+                       project=project.name, changed=changed)
+
+    def on_document_saved(self, document):
+        project = document.project
+        if project is None or document.filename is None:
+            return
+        relpath = project.get_relative_path_for(document.filename)
+        if not relpath or not self.is_tagged(document.filename):
+            return
+        db = self.get_tag_database(project)
+        AsyncTask(db.update_file).start(os.sep.join(relpath))
 
 
 
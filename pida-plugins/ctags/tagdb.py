@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+    Project wide ctags database
+
+    The tags of all project files are kept in a SQLite database in the
+    project meta dir, indexed by file and by name.  It is built once and
+    then only the changed files are tagged again.
+
+    :copyright: 2005-2010 by The PIDA Project
+    :license: GPL 2 or later (see README/COPYING/LICENSE)
+"""
+
+import os
+import sqlite3
+import threading
+import subprocess
+
+from pida.core.log import Log
+
+DATABASE_NAME = 'tags.db'
+DATABASE_VERSION = 1
+
+# files handed to one ctags run
+BATCH_SIZE = 500
+
+# extension fields which don't name the scope of a tag
+NON_SCOPE_FIELDS = frozenset([
+    'kind', 'line', 'file', 'signature', 'access', 'inherits', 'language',
+    'implementation', 'typeref', 'end', 'roles', 'extras', 'nth',
+])
+
+CTAGS_COMMAND = ('ctags', '-n', '--fields=+z', '--langmap=C#:+.vala',
+                 '-f', '-')
+
+SCHEMA = """
+CREATE TABLE files (path TEXT PRIMARY KEY, mtime REAL);
+CREATE TABLE tags (name TEXT, path TEXT, line INTEGER, kind TEXT,
+                   scope TEXT);
+CREATE INDEX tags_name ON tags (name);
+CREATE INDEX tags_path ON tags (path, line);
+"""
+
+
+def parse_tag_line(line):
+    """
+    Parse a line of ctags output into (name, path, line, kind, scope),
+    returns None for comments and broken lines
+    """
+    if line.startswith('!_'):
+        return None
+    fields = line.rstrip('\r\n').split('\t')
+    if len(fields) < 3:
+        return None
+    name, path, address = fields[:3]
+    try:
+        lineno = int(address.split(';', 1)[0])
+    except ValueError:
+        return None
+    kind = scope = None
+    for field in fields[3:]:
+        key, sep, value = field.partition(':')
+        if not sep:
+            # kind without the kind: prefix
+            kind = kind or field
+        elif key == 'kind':
+            kind = value
+        elif key == 'scope':
+            # universal ctags with --fields=+Z: scope:class:Outer
+            scope = value.partition(':')[2] or value
+        elif key not in NON_SCOPE_FIELDS and scope is None:
+            scope = value
+    return name, path, lineno, kind, scope
+
+
+def run_ctags(directory, paths):
+    """
+    Run ctags on paths relative to directory, yields the tags as tuples
+    like :func:`parse_tag_line` returns
+    """
+    proc = subprocess.Popen(CTAGS_COMMAND + ('-L', '-'), cwd=directory,
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    # ctags reads the whole list before it writes anything
+    proc.stdin.write(''.join('%s\n' % path for path in paths))
+    proc.stdin.close()
+    try:
+        for line in proc.stdout:
+            tag = parse_tag_line(line)
+            if tag is not None:
+                yield tag
+    finally:
+        proc.stdout.close()
+        proc.wait()
+
+
+class TagDatabase(Log):
+    """
+    The tags of the files of a project.
+
+    Files are tracked with the mtime they had when they were tagged, like
+    the content index of the grepper.  All paths are relative to the
+    project source directory.
+    """
+
+    def __init__(self, project, path=None):
+        self.project = project
+        if path is None:
+            path = project.get_meta_dir('ctags', filename=DATABASE_NAME)
+        self.path = path
+        self._lock = threading.RLock()
+        self._db = None
+
+    @property
+    def db(self):
+        with self._lock:
+            if self._db is None:
+                self._db = self._open()
+            return self._db
+
+    def _open(self):
+        try:
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            version = db.execute('PRAGMA user_version').fetchone()[0]
+        except sqlite3.DatabaseError as err:
+            self.log.error("can't open tag database {path}: {err}",
+                           path=self.path, err=err)
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            version = 0
+        if version != DATABASE_VERSION:
+            db.executescript(
+                'DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS tags;')
+            db.executescript(SCHEMA)
+            db.execute('PRAGMA user_version = %d' % DATABASE_VERSION)
+            db.commit()
+        return db
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def get_mtimes(self):
+        """Returns a dict of the tagged paths to their mtime"""
+        with self._lock:
+            return dict(self.db.execute('SELECT path, mtime FROM files'))
+
+    def get_mtime(self, relpath):
+        with self._lock:
+            row = self.db.execute('SELECT mtime FROM files WHERE path = ?',
+                                  (relpath,)).fetchone()
+        return row[0] if row is not None else None
+
+    def update_files(self, relpaths):
+        """(Re)tag files, files which vanished get removed, blocks"""
+        directory = self.project.source_directory
+        existing = []
+        mtimes = {}
+        for relpath in relpaths:
+            try:
+                mtimes[relpath] = os.stat(
+                    os.path.join(directory, relpath)).st_mtime
+                existing.append(relpath)
+            except OSError:
+                mtimes[relpath] = None
+        for start in range(0, len(existing), BATCH_SIZE):
+            batch = existing[start:start + BATCH_SIZE]
+            try:
+                tags = list(run_ctags(directory, batch))
+            except OSError as err:
+                self.log.error("can't execute ctags: {err}", err=err)
+                return
+            self._store(batch, mtimes, tags)
+        vanished = [relpath for relpath, mtime in mtimes.iteritems()
+                    if mtime is None]
+        if vanished:
+            self.remove_files(vanished)
+
+    def update_file(self, relpath):
+        self.update_files([relpath])
+
+    def _store(self, relpaths, mtimes, tags):
+        with self._lock:
+            db = self.db
+            with db:
+                db.executemany('DELETE FROM tags WHERE path = ?',
+                               ((relpath,) for relpath in relpaths))
+                db.executemany('INSERT INTO tags VALUES (?, ?, ?, ?, ?)',
+                               (tuple(unicode(field, 'utf-8', 'replace')
+                                      if isinstance(field, str) else field
+                                      for field in tag)
+                                for tag in tags))
+                db.executemany(
+                    'INSERT OR REPLACE INTO files VALUES (?, ?)',
+                    ((relpath, mtimes[relpath]) for relpath in relpaths))
+
+    def remove_files(self, relpaths):
+        with self._lock:
+            db = self.db
+            with db:
+                db.executemany('DELETE FROM tags WHERE path = ?',
+                               ((relpath,) for relpath in relpaths))
+                db.executemany('DELETE FROM files WHERE path = ?',
+                               ((relpath,) for relpath in relpaths))
+
+    def sync(self, files):
+        """
+        Bring the database in line with the project files, blocks.
+
+        :param files: dict of relative paths to mtimes of the files which
+                      should be tagged
+        """
+        known = self.get_mtimes()
+        removed = [relpath for relpath in known if relpath not in files]
+        changed = sorted(relpath for relpath, mtime in files.iteritems()
+                         if known.get(relpath) != mtime)
+        if removed:
+            self.remove_files(removed)
+        if changed:
+            self.update_files(changed)
+        return len(removed) + len(changed)
+
+    def get_file_tags(self, relpath):
+        """Returns the tags of a file ordered by line"""
+        with self._lock:
+            return self.db.execute(
+                'SELECT name, path, line, kind, scope FROM tags '
+                'WHERE path = ? ORDER BY line', (relpath,)).fetchall()
+
+    def find(self, name, limit=None):
+        """Returns the tags with name"""
+        query = 'SELECT name, path, line, kind, scope FROM tags ' \
+                'WHERE name = ? ORDER BY path, line'
+        args = (name,)
+        if limit is not None:
+            query += ' LIMIT ?'
+            args += (limit,)
+        with self._lock:
+            return self.db.execute(query, args).fetchall()
@@ -21,7 +21,7 @@
 #SOFTWARE.
 
 import py
-from ctags import CtagsOutliner, build_language_list
+from ctags import CtagsOutliner, build_language_list, parent_first
 from pida.core.document import Document
 import os
 
@@ -66,5 +66,44 @@ def test_languagemap():
     assert all([x in doctypes.values() for x in lst])
     assert len(lst) > 10
 
+TAGFILE = """\
+!_TAG_FILE_FORMAT\t2\t/extended format/
+!_TAG_FILE_SORTED\t1\t/0=unsorted, 1=sorted, 2=foldcase/
+Inner\ttest.py\t10;"\tkind:c\tclass:Outer
+Outer\ttest.py\t7;"\tkind:c
+helper\ttest.py\t30;"\tkind:f\tfile:
+inner_a\ttest.py\t11;"\tkind:m\tclass:Outer.Inner
+outer_a\ttest.py\t16;"\tkind:m\tclass:Outer
+"""
+
+def test_parse_tagfile(tmpdir):
+    tagfile = tmpdir.join('tags')
+    tagfile.write(TAGFILE)
+    outliner = CtagsOutliner(None, document=None)
+    tags = outliner._parse_tagfile(str(tagfile))
+    lst = list(parent_first(tags.filter_items('test.py')))
+    assert [x.name for x in lst] == ['Outer', 'Inner', 'helper', 'inner_a',
+                                     'outer_a']
+    items = dict((x.name, x) for x in lst)
+    assert items['Outer'].type == 'class'
+    assert items['outer_a'].type == 'member'
+    assert items['outer_a'].parent is items['Outer']
+    assert items['inner_a'].parent is items['Inner']
+    assert items['Inner'].parent is items['Outer']
+    assert items['helper'].parent is None
+    assert items['Outer'].is_parent
+
+def test_parent_first_keeps_order():
+    class Item(object):
+        def __init__(self, name, parent=None):
+            self.name = name
+            self.parent = parent
+    a = Item('a')
+    b = Item('b', a)
+    c = Item('c', b)
+    other = Item('other', Item('not listed'))
+    lst = list(parent_first([c, other, b, a]))
+    assert lst == [a, b, c, other]
+
 
 # vim:set shiftwidth=4 tabstop=4 expandtab textwidth=79:
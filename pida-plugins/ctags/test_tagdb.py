@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import py
+
+import tagdb
+from tagdb import TagDatabase, parse_tag_line
+
+# what ctags -n --fields=+z writes for test/test.py
+TAGS = {
+    'test.py': [
+        'Outer\ttest.py\t1;"\tkind:c\n',
+        'Inner\ttest.py\t3;"\tkind:c\tclass:Outer\n',
+        'inner_method\ttest.py\t5;"\tkind:m\tclass:Outer.Inner\n',
+        'outer_method\ttest.py\t8;"\tkind:m\tclass:Outer\n',
+    ],
+    'other.py': [
+        '!_TAG_FILE_SORTED\t1\t/0=unsorted/\n',
+        'outer_method\tother.py\t2;"\tkind:f\n',
+    ],
+}
+
+
+class FakeProject(object):
+
+    def __init__(self, source_directory):
+        self.source_directory = source_directory
+
+
+def fake_ctags(directory, paths):
+    for path in paths:
+        for line in TAGS[path]:
+            tag = parse_tag_line(line)
+            if tag is not None:
+                yield tag
+
+
+def make_db(tmpdir, monkeypatch):
+    monkeypatch.setattr(tagdb, 'run_ctags', fake_ctags)
+    for name in TAGS:
+        tmpdir.join(name).write('')
+    return TagDatabase(FakeProject(str(tmpdir)),
+                       path=str(tmpdir.join('tags.db')))
+
+
+def test_parse_tag_line():
+    assert parse_tag_line('!_TAG_FILE_FORMAT\t2\t/extended/\n') is None
+    assert parse_tag_line('broken\n') is None
+    assert parse_tag_line('Outer\ttest.py\t1;"\tkind:c\n') == \
+        ('Outer', 'test.py', 1, 'c', None)
+    assert parse_tag_line('x\ta.c\t4;"\tkind:m\tfile:\tstruct:point\n') == \
+        ('x', 'a.c', 4, 'm', 'point')
+    # universal ctags --fields=+Z
+    assert parse_tag_line('f\ta.py\t9;"\tkind:m\tscope:class:A.B\n') == \
+        ('f', 'a.py', 9, 'm', 'A.B')
+    # without --fields=+z
+    assert parse_tag_line('f\ta.py\t9;"\tf\n') == ('f', 'a.py', 9, 'f', None)
+
+
+def test_sync(tmpdir, monkeypatch):
+    db = make_db(tmpdir, monkeypatch)
+    assert db.sync({'test.py': 1, 'other.py': 2}) == 2
+    assert [tag[0] for tag in db.get_file_tags('test.py')] == \
+        ['Outer', 'Inner', 'inner_method', 'outer_method']
+    inner = db.get_file_tags('test.py')[2]
+    assert inner == ('inner_method', 'test.py', 5, 'm', 'Outer.Inner')
+    assert [tag[1] for tag in db.find('outer_method')] == \
+        ['other.py', 'test.py']
+
+
+def test_sync_incremental(tmpdir, monkeypatch):
+    db = make_db(tmpdir, monkeypatch)
+    files = {'test.py': 1, 'other.py': 2}
+    db.sync(files)
+    files = db.get_mtimes()
+    # nothing changed, ctags doesn't run
+    assert db.sync(files) == 0
+    del files['other.py']
+    assert db.sync(files) == 1
+    assert db.find('outer_method') == [
+        ('outer_method', 'test.py', 8, 'm', 'Outer')]
+    assert 'other.py' not in db.get_mtimes()
+
+
+def test_vanished_file(tmpdir, monkeypatch):
+    db = make_db(tmpdir, monkeypatch)
+    db.sync({'test.py': 1, 'other.py': 2})
+    tmpdir.join('other.py').remove()
+    db.update_file('other.py')
+    assert db.get_file_tags('other.py') == []
+    assert db.get_mtime('other.py') is None
+    assert db.get_mtime('test.py') is not None
+
+
+def test_persistent(tmpdir, monkeypatch):
+    db = make_db(tmpdir, monkeypatch)
+    db.sync({'test.py': 1})
+    db.close()
+    db = TagDatabase(FakeProject(str(tmpdir)),
+                     path=str(tmpdir.join('tags.db')))
+    assert len(db.get_file_tags('test.py')) == 4
+
+
+def test_ctags():
+    if not py.path.local.sysfind('ctags'):
+        py.test.skip('ctags missing')
+    directory = os.path.join(os.path.dirname(__file__), 'test')
+    tags = list(tagdb.run_ctags(directory, ['test.py']))
+    names = dict((tag[0], tag) for tag in tags)
+    assert names['Inner'][4] == 'Outer'
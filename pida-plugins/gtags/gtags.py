@@ -29,6 +29,7 @@ language support
 import os
 import gtk
 import re
+from bisect import bisect_left
 from threading import Thread
 
 from pygtkhelpers.ui.objectlist import ObjectList, Column
@@ -46,6 +47,7 @@ import subprocess
 from pida.ui.views import PidaView, WindowConfig
 
 from pida.utils.gthreads import GeneratorSubprocessTask
+from pygtkhelpers.gthreads import AsyncTask
 
 # locale
 from pida.core.locale import Locale
@@ -186,6 +188,58 @@ class GtagsSuggestion(Suggestion):
     pass
 
 
+class GtagsSymbolTable(object):
+    """
+    Sorted list of all symbols of a gtags database, for completion without
+    running global for every request
+    """
+
+    def __init__(self, symbols=()):
+        self.symbols = sorted(set(symbols))
+        self._text = None
+
+    def __len__(self):
+        return len(self.symbols)
+
+    @classmethod
+    def load(cls, directory):
+        """Reads the symbols of the database in directory"""
+        pipe = subprocess.Popen(['global', '-c'], stdout=subprocess.PIPE,
+                                cwd=directory)
+        symbols = [line.strip() for line in pipe.stdout]
+        pipe.wait()
+        return cls(symbol for symbol in symbols if symbol)
+
+    def complete(self, base, limit=None):
+        """
+        Returns the symbols starting with base, followed by those which
+        start with the same character and contain the rest of base in
+        order, case insensitive.
+        """
+        rv = []
+        index = bisect_left(self.symbols, base)
+        while index < len(self.symbols) and \
+              self.symbols[index].startswith(base):
+            if limit is not None and len(rv) >= limit:
+                return rv
+            rv.append(self.symbols[index])
+            index += 1
+        if not base:
+            return rv
+        if self._text is None:
+            self._text = '\n'.join(self.symbols)
+        found = set(rv)
+        fuzzy = re.compile('^' + '[^\n]*?'.join(re.escape(c) for c in base)
+                           + '.*$', re.IGNORECASE | re.MULTILINE)
+        for match in fuzzy.finditer(self._text):
+            if limit is not None and len(rv) >= limit:
+                break
+            symbol = match.group()
+            if symbol not in found:
+                rv.append(symbol)
+        return rv
+
+
 class GtagsCompleter(Completer):
 
     priority = LANG_PRIO.DEFAULT
@@ -201,31 +255,18 @@ class GtagsCompleter(Completer):
         @buffer - document to parse
         @offset - cursor position
         """
-        if self.document.project and \
-           self.svc.have_database(self.document.project):
-            # gtags is no good completer and often returns way to much results
-            # limiting here is a good thing
-            if (not isinstance(base, basestring) and 
-                self.svc.opt("min_filter_length")) or (
-                self.svc.opt("min_filter_length") > len(base)):
-
-                return
-
-            args = ['global', '-c', base and unicode(base) or '']
-            pipe = subprocess.Popen(args, stdout=subprocess.PIPE,
-                                    stdin=None, stderr=None, shell=False,
-                                    universal_newlines=True,
-                                    cwd=self.document.project.source_directory)
-
-            while True:
-                line = pipe.stdout.readline()
-                if not line:
-                    pipe.communicate()
-                    return
-
-                yield GtagsSuggestion(line.strip())
-
-        return
+        project = self.document.project
+        if not project:
+            return
+        table = self.svc.get_symbol_table(project)
+        if table is None:
+            return
+        if not isinstance(base, basestring):
+            base = ''
+        if self.svc.opt("min_filter_length") > len(base):
+            return
+        for symbol in table.complete(base, self.svc.opt("max_completions")):
+            yield GtagsSuggestion(symbol)
 
 
 class GtagsActions(ActionsConfig):
@@ -305,6 +346,7 @@ class GtagsUpdateThread(Thread):
                     else:
                         self.svc.log.info(
                              _('Ran gtags in backgroud successfully'))
+                        self.svc.load_symbol_table(self.project)
                 except OSError, err:
                     self.svc.log.error(
                          _('Error running gtags {err}'), err=err)
@@ -340,6 +382,8 @@ class GtagsFeaturesConfig(LanguageServiceFeaturesConfig):
         self.svc.project_refresh(project, callback)
     
     do_refresh.priority = REFRESH_PRIORITY.PRE_FILECACHE
+    # gtags walks the tree itself
+    do_refresh.requires = ()
 
 class GtagsOptionsConfig(OptionsConfig):
     def create_options(self):
@@ -347,9 +391,16 @@ class GtagsOptionsConfig(OptionsConfig):
             'min_filter_length',
             _('Min filter length'),
             int,
-            3,
+            1,
             _('Minimum characters for completer to start.'))
 
+        self.create_option(
+            'max_completions',
+            _('Max completions'),
+            int,
+            200,
+            _('Maximum number of symbols the completer returns.'))
+
 # Service class
 class Gtags(LanguageService):
     """Fetch gtags list and show an gtags"""
@@ -370,6 +421,8 @@ class Gtags(LanguageService):
                                                'get_current_project'))
         self._ticket = 0
         self._bg_threads = {}
+        self._symbol_tables = {}
+        self._loading = set()
         self._bd_do_updates = False
         self.task = self._task = None
 
@@ -388,9 +441,35 @@ class Gtags(LanguageService):
         if project is None:
             return False
 
-        return os.path.exists(os.path.join(self._project.source_directory, 
+        return os.path.exists(os.path.join(project.source_directory,
                                            'GTAGS'))
 
+    def get_symbol_table(self, project):
+        """
+        Returns the symbol table of project, None if it is not loaded yet.
+
+        The first call starts loading it in the background.
+        """
+        table = self._symbol_tables.get(project)
+        if table is None and project not in self._loading and \
+           self.have_database(project):
+            self._loading.add(project)
+            AsyncTask(self.load_symbol_table).start(project)
+        return table
+
+    def load_symbol_table(self, project):
+        """(Re)load the symbol table of project, blocks"""
+        try:
+            table = GtagsSymbolTable.load(project.source_directory)
+        except OSError, err:
+            self.log.error(_('Error running global {err}'), err=err)
+            return
+        finally:
+            self._loading.discard(project)
+        self._symbol_tables[project] = table
+        self.log.debug(_('Loaded {count} gtags symbols of {project}'),
+                       count=len(table), project=project.name)
+
     def build_args(self, clean=False, quiet=False, project=None):
         """
         Generates the command and cwd the should be run to update database
@@ -435,6 +514,8 @@ class Gtags(LanguageService):
 
     def build_db_finished(self, term, *args):
         self._view.activate(self.have_database())
+        if self.have_database():
+            AsyncTask(self.load_symbol_table).start(self._project)
         self._view._refresh_button.set_sensitive(True)
         self.boss.cmd('notify', 'notify', title=_('Gtags'),
             data=_('Database build complete'))
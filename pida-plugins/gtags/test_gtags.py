@@ -20,11 +20,35 @@
 #OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 #SOFTWARE.
 
+from gtags import GtagsSymbolTable
 
+SYMBOLS = ['main', 'gtk_widget_show', 'gtk_widget_hide', 'GTK_WIDGET',
+           'g_object_ref', 'gtk_window_new', 'main']
 
 
+def test_symbol_table_sorted():
+    table = GtagsSymbolTable(SYMBOLS)
+    assert len(table) == 6
+    assert table.symbols == sorted(set(SYMBOLS))
 
 
+def test_complete_prefix():
+    table = GtagsSymbolTable(SYMBOLS)
+    assert table.complete('gtk_widget_') == ['gtk_widget_hide',
+                                             'gtk_widget_show']
+    assert table.complete('gtk_w', limit=2) == ['gtk_widget_hide',
+                                                'gtk_widget_show']
+    assert table.complete('') == table.symbols
+    assert table.complete('xyz') == []
+
+
+def test_complete_fuzzy():
+    table = GtagsSymbolTable(SYMBOLS)
+    # prefix matches first, then case insensitive subsequence matches
+    assert table.complete('gtk_widget') == ['gtk_widget_hide',
+                                            'gtk_widget_show', 'GTK_WIDGET']
+    assert table.complete('gwn') == ['gtk_window_new']
+    assert table.complete('g.o') == []
 
 
 # vim:set shiftwidth=4 tabstop=4 expandtab textwidth=79:
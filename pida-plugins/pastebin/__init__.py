@@ -1,4 +1,7 @@
 # -*- coding: utf-8 -*- 
 
+# only used through its view, see pida.core.servicemanager.LazyService
+triggers = {'views': ['show_pastes']}
+
 
 # vim:set shiftwidth=4 tabstop=4 expandtab textwidth=79:
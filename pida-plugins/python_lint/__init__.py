@@ -20,11 +20,9 @@
 #OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 #SOFTWARE.
 
-
-
-
-
-
+# only needed for python documents, see
+# pida.core.servicemanager.LazyService
+triggers = {'doctypes': ['Python']}
 
 
 # vim:set shiftwidth=4 tabstop=4 expandtab textwidth=79:
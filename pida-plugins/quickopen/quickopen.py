@@ -6,6 +6,7 @@
 
 # stdlib
 import os.path
+from functools import partial
 
 # gtk
 import gtk, gobject
@@ -24,8 +25,7 @@ from pida.core.actions import (ActionsConfig, TYPE_NORMAL)
 from pida.core.options import OptionsConfig
 from pida.ui.views import PidaView, WindowConfig
 from pida.services.language import DOCTYPES
-from pida.core.indexer import Result
-from pygtkhelpers.gthreads import gcall
+from pygtkhelpers.gthreads import gcall, GeneratorTask
 import time
 
 
@@ -34,6 +34,10 @@ from pida.core.locale import Locale
 locale = Locale('')
 _ = locale.gettext
 
+# results asked for per shown one, some may be dropped as hidden files
+HIDDEN_SLACK = 2
+
+
 class QItem(object):
     name = ''
     path = ''
@@ -49,6 +53,9 @@ class QOpenView(PidaView):
         self.filter.set_model(self._history)
         self.filter.set_text_column(0)
         self.last_entered = 0
+        self._task = None
+        # bumped for every search, results of older ones are dropped
+        self._generation = 0
         self.olist.set_columns(
             [
                 Column('basename', title=_('Name')),
@@ -65,6 +72,10 @@ class QOpenView(PidaView):
     def set_filter(self, text, time_check=None):
         if time_check and self.last_entered > time_check:
             return False
+        if self._task is not None:
+            self._task.stop()
+            self._task = None
+        self._generation += 1
         self._history.insert(0, (text,))
         self.olist.clear()
         tokens = text.split()
@@ -87,33 +98,42 @@ class QOpenView(PidaView):
                 fall.append(tok)
 
         def do_filter(item):
-            if len(self.olist) > 200:
-                Result(abort=True)
             if not len(item.basename) or not len(item.relpath):
-                return
+                return False
             if "/." in item.relpath or item.relpath[0] == ".":
-                return
-            for chk in filters:
-                if not chk(item.basename, item.relpath, ''):
-                    return
+                return False
             if item.is_dir:
-                return
-            if all((x in item.relpath for x in fall)) and \
-               all((x in item.basename for x in fnames)):
-                if len(ftypes):
-                    if item.doctype in ftypes:
-                        return Result(accept=True)
-                else:
-                    return Result(accept=True)
+                return False
+            if not all((x in item.basename for x in fnames)):
+                return False
+            if len(ftypes) and item.doctype not in ftypes:
+                return False
+            return True
 
         project = self.svc.boss.cmd('project', 'get_current_project')
         if not project:
             return
-        for result in project.indexer.query(do_filter):
-            self.olist.append(result)
+        # the results arrive best first, so they can be shown while the
+        # slower subsequence matches are still being ranked
+        # the file hidden checks are left to the main thread, there is
+        # room for the results they drop
+        task = self._task = GeneratorTask(project.indexer.search,
+            partial(self._append, self._generation, list(filters)))
+        # the ranking only yields at its end, so it has to look for itself
+        task.start(" ".join(fall),
+                   limit=self.svc.opt('max_results') * HIDDEN_SLACK,
+                   test=do_filter, is_stopped=lambda: task.is_stopped)
 
         return False
 
+    def _append(self, generation, filters, item):
+        # results of a stopped search may still be queued in the main loop
+        if generation != self._generation or \
+           len(self.olist) >= self.svc.opt('max_results'):
+            return
+        if all(chk(item.basename, item.relpath, '') for chk in filters):
+            self.olist.append(item)
+
     def on_show(self, *args):
         gcall(self.filter.child.grab_focus)
 
@@ -188,6 +208,14 @@ class QopenOptionsConfig(OptionsConfig):
             _('Start search after n milliseconds'),
         )
 
+        self.create_option(
+            'max_results',
+            _('Maximum results'),
+            int,
+            200,
+            _('The maximum number of files listed'),
+        )
+
 
 class QopenActionsConfig(ActionsConfig):
 
@@ -20,11 +20,8 @@
 #OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 #SOFTWARE.
 
-
-
-
-
-
+# only used through its view, see pida.core.servicemanager.LazyService
+triggers = {'views': ['show_rfc']}
 
 
 # vim:set shiftwidth=4 tabstop=4 expandtab textwidth=79:
@@ -1,3 +1,8 @@
 # -*- coding: utf-8 -*-
 
+# only needed for reStructuredText documents, see
+# pida.core.servicemanager.LazyService
+triggers = {'doctypes': ['Rst']}
+
+
 # vim:set shiftwidth=4 tabstop=4 expandtab textwidth=79:
@@ -224,3 +224,63 @@ class ActionsConfig(OptionsConfig):
         """
         for action in self._actions.list_actions():
             yield action
+
+    def describe_actions(self):
+        """
+        Returns a list of (name, label, tooltip, stock_id, toggle, accel)
+        tuples describing the actions, enough to stand in for them with
+        :class:`PlaceholderActions` while the service isn't activated
+        """
+        result = []
+        for action in self.list_actions():
+            name = action.get_name()
+            opt = self._keyboard_options.get(name)
+            result.append((
+                name,
+                action.get_property('label'),
+                action.get_property('tooltip'),
+                action.get_property('stock-id'),
+                isinstance(action, gtk.ToggleAction),
+                opt.value if opt is not None else None,
+            ))
+        return result
+
+
+class PlaceholderActions(object):
+    """
+    Stand-ins for the actions of a service which is activated on first use.
+
+    They get merged into the ui with the ui definition of the service, so
+    the menu entries and keyboard shortcuts are there before the service
+    is imported.  Using one of them calls `callback` with the action, which
+    is expected to activate the service and forward to the real action.
+
+    :param actions: tuples like :meth:`ActionsConfig.describe_actions`
+                    returns
+    """
+
+    def __init__(self, boss, name, package, actions, callback):
+        self.boss = boss
+        self._actions = gtk.ActionGroup(name)
+        for aname, label, tooltip, stock_id, toggle, accel in actions:
+            atype = gtk.ToggleAction if toggle else gtk.Action
+            act = atype(name=aname, label=label, tooltip=tooltip,
+                        stock_id=stock_id)
+            act.connect('activate', callback)
+            if accel:
+                path = '<Actions>/%s' % aname
+                act.set_accel_group(accelerator_group)
+                act.set_accel_path(path)
+                keyval, modmask = gtk.accelerator_parse(accel)
+                gtk.accel_map_change_entry(path, keyval, modmask, True)
+                act.connect_accelerator()
+            self._actions.add_action(act)
+        self.ui_merge_id = boss.add_action_group_and_ui(
+            self._actions, package, 'uidef/%s.xml' % name)
+
+    def remove(self):
+        """Remove the placeholders before the real actions get created"""
+        for act in self._actions.list_actions():
+            if act.get_accel_path() is not None:
+                act.disconnect_accelerator()
+        self.boss.remove_action_group_and_ui(self._actions, self.ui_merge_id)
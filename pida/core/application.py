@@ -13,6 +13,7 @@ import os
 import sys
 import warnings
 import traceback
+import py
 from pida.core.locale import Locale
 
 from pida.core import environment
@@ -74,15 +75,37 @@ except ImportError as e:
     die_gui(_('The pida package could not be found.'), e)
 
 
+def report_startup():
+    from pida.core.startup import tracer
+    tracer.finish()
+    print(tracer.report())
+    if environment.opts.startup_trace_json:
+        path = os.path.abspath(environment.opts.startup_trace_json)
+        try:
+            tracer.save_chrome_trace(py.path.local(path))
+        except EnvironmentError as e:
+            print(_('Could not save the startup trace: %s') % e)
+
+
 def run_pida():
-    from pida.core.boss import Boss
-    b = Boss() #XXX: relocate firstrun
+    from pida.core.startup import tracer
+    trace_startup = environment.opts.startup_trace or \
+                    environment.opts.startup_trace_json
+    if trace_startup:
+        tracer.enable()
+    with tracer.span('create boss', 'phase'):
+        from pida.core.boss import Boss
+        b = Boss() #XXX: relocate firstrun
 
     # handle start params
     try:
         # XXX: this sucks, needs propper errors
         # might raise runtime error
         b.start()
+        if trace_startup:
+            # the first idle call marks the end of the startup
+            from pygtkhelpers.gthreads import gcall
+            gcall(report_startup)
         if environment.opts.files:
             from pygtkhelpers.gthreads import gcall
             gcall(b.cmd, 'buffer', 'open_files', files=environment.opts.files)
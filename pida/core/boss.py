@@ -17,6 +17,7 @@ import pida
 
 from pida.core.environment import (is_firstrun, firstrun_file)
 from pida.core.servicemanager import ServiceManager, ServiceModuleError
+from pida.core.startup import tracer
 from pida.ui.icons import IconRegister
 from pida.ui.window import PidaWindow
 from pida.ui.splash import SplashScreen
@@ -67,22 +68,27 @@ class Boss(object):
             sys.exit() #XXX: errors?
             raise RuntimeError('quit_before_started was set #XXX: better error')
         else:
-            self._icons = IconRegister()
-            self._icons.register_file_icons_for_directory(
-                os.path.abspath(os.path.join(
-                    pida.__path__[0],
-                    'resources/pixmaps'
-                )))
+            with tracer.span('icons', 'phase'):
+                self._icons = IconRegister()
+                self._icons.register_file_icons_for_directory(
+                    os.path.abspath(os.path.join(
+                        pida.__path__[0],
+                        'resources/pixmaps'
+                    )))
             self.servicemanager.activate_services()
             if self.override_editor is not None:
                 self.get_service('editor').set_opt('editor_type',
                     self.override_editor)
             editor_name = self.get_service('editor').opt('editor_type')
             editor_name = self.check_editor(editor_name)
-            self.servicemanager.activate_editor(editor_name)
-            self.window.start()
-            self.servicemanager.start_services()
-            self.servicemanager.start_editor()
+            with tracer.span('activate editor', 'phase'):
+                self.servicemanager.activate_editor(editor_name)
+            with tracer.span('window', 'phase'):
+                self.window.start()
+            with tracer.span('start services', 'phase'):
+                self.servicemanager.start_services()
+            with tracer.span('start editor', 'phase'):
+                self.servicemanager.start_editor()
 
     def stop(self, force=False, kill=False):
         """
@@ -123,8 +129,8 @@ class Boss(object):
     def get_plugins(self):
         return self.servicemanager.get_plugins()
 
-    def start_plugin(self, name):
-        return self.servicemanager.start_plugin(name)
+    def start_plugin(self, name, lazy=False):
+        return self.servicemanager.start_plugin(name, lazy=lazy)
 
     def stop_plugin(self, name):
         return self.servicemanager.stop_plugin(name)
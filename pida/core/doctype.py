@@ -9,9 +9,100 @@
 
 """
 
+import os
+import re
 from glob import fnmatch
 from collections import defaultdict
 
+from pida.utils.lru import LRUCache
+
+# characters making a glob a pattern instead of a plain name
+GLOB_MAGIC = re.compile(r'[*?[]')
+
+# python 2 can't compile regular expressions with more groups
+MAX_GROUPS = 90
+
+
+def _translate(glob):
+    # the anchor and the flags fnmatch adds can't be used inside of an
+    # alternation
+    regex = fnmatch.translate(glob)
+    if regex.endswith('\\Z(?ms)'):
+        regex = regex[:-len('\\Z(?ms)')]
+    return regex
+
+
+class GlobMatcher(object):
+    """
+    Finds the globs matching a file name.
+
+    Globs like `*.py` are looked up by the extensions of the name and plain
+    names like `Makefile` by the name itself.  Only the remaining globs are
+    matched as regular expressions, combined into one for finding the
+    longest match.
+    """
+
+    def __init__(self, globs):
+        self.extensions = {}
+        self.names = set()
+        patterns = []
+        for glob in globs:
+            if glob.startswith('*.') and not GLOB_MAGIC.search(glob[2:]):
+                self.extensions[glob[2:]] = glob
+            elif not GLOB_MAGIC.search(glob):
+                self.names.add(glob)
+            else:
+                patterns.append(glob)
+        # the first matching alternative is taken, so the longest globs
+        # have to come first
+        patterns.sort(key=len, reverse=True)
+        self.patterns = patterns
+        self.regexes = [re.compile(fnmatch.translate(pattern))
+                        for pattern in patterns]
+        self.combined = []
+        for start in range(0, len(patterns), MAX_GROUPS):
+            chunk = patterns[start:start + MAX_GROUPS]
+            regex = '|'.join('(%s)' % _translate(pattern)
+                             for pattern in chunk)
+            self.combined.append(
+                (start, re.compile('(?ms)(?:%s)\\Z' % regex)))
+
+    def _extensions(self, name):
+        # the longest extension comes first
+        pos = name.find('.')
+        while pos != -1:
+            glob = self.extensions.get(name[pos + 1:])
+            if glob is not None:
+                yield glob
+            pos = name.find('.', pos + 1)
+
+    def best(self, name):
+        """Returns the longest glob matching name or None"""
+        candidates = []
+        if name in self.names:
+            candidates.append(name)
+        for glob in self._extensions(name):
+            candidates.append(glob)
+            break
+        for start, regex in self.combined:
+            match = regex.match(name)
+            if match is not None:
+                candidates.append(self.patterns[start + match.lastindex - 1])
+                break
+        if candidates:
+            return max(candidates, key=len)
+
+    def matches(self, name):
+        """Returns all globs matching name"""
+        result = []
+        if name in self.names:
+            result.append(name)
+        result.extend(self._extensions(name))
+        result.extend(pattern for pattern, regex
+                      in zip(self.patterns, self.regexes) if regex.match(name))
+        return result
+
+
 
 class DocType(object):
     """Represents a type of document. Like a python sourcecode file, a xml
@@ -67,6 +158,9 @@ class TypeManager(dict):
     def __init__(self):
         self._globs = defaultdict(list)
         self._mimetypes = defaultdict(list)
+        self._matcher = None
+        # basename -> best doctype
+        self._cache = LRUCache(4096)
 
     def add(self, doctype):
         if doctype.internal in self:
@@ -75,6 +169,14 @@ class TypeManager(dict):
         for ext in doctype.extensions:
             if ext:
                 self._globs[ext].append(doctype)
+        self._matcher = None
+        self._cache.clear()
+
+    def _get_matcher(self):
+        matcher = self._matcher
+        if matcher is None:
+            matcher = self._matcher = GlobMatcher(self._globs)
+        return matcher
 
     def _parse_map(self, lst):
         for intname, data in lst.iteritems():
@@ -97,51 +199,26 @@ class TypeManager(dict):
             # FIXME: return default type
             return []
         rv = []
-        for test in self._globs.keys():
-            if fnmatch.fnmatch(filename, test):
-                rv += self._globs[test]
-
+        for glob in self._get_matcher().matches(os.path.basename(filename)):
+            rv += self._globs[glob]
         return rv
 
     def type_by_filename(self, filename):
-        """Tries to find only one, the best guess for the type."""
+        """
+        Tries to find only one, the best guess for the type.
+
+        That is the first doctype of the longest glob matching the basename.
+        """
         if not filename:
             return None
-        best = None
-        best_glob = ""
-        best_list = []
-        for test in self._globs.keys():
-            if fnmatch.fnmatch(filename, test):
-                if len(test) > len(best_glob):
-                    best_glob = test
-                    best_list += self._globs[test]
-
-        if best_glob == '':
-            return None
-        return self._globs[best_glob][0]
-
-        if len(best_list) > 1:
-            # erks. got more then one result. try different approach
-            # guess the mimetype through the python mimetype lib
-            #import mimetypes
-            gtest = None
-            import subprocess
-            try:
-                gtest = subprocess.Popen(['file', '-bzki', filename], stdout=subprocess.PIPE).communicate()[0].strip()
-                if gtest.find(';') != -1:
-                    gtest = gtest[:gtest.find(';')]
-            except OSError:
-                pass
-            if gtest:
-                for dt in best_list:
-                    if gtest in dt.mimes:
-                        best = dt
-            else:
-                # use the first one as total fallback :(
-                best = best_list[0]
-        elif len(best_list):
-            best = best_list[0]
-
+        name = os.path.basename(filename)
+        try:
+            return self._cache[name]
+        except KeyError:
+            pass
+        glob = self._get_matcher().best(name)
+        best = self._globs[glob][0] if glob is not None else None
+        self._cache[name] = best
         return best
 
     def get_fuzzy(self, pattern):
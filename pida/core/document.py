@@ -19,6 +19,9 @@ from pida.utils.descriptors import cached_property
 
 new_file_counter = itertools.count(1)
 
+# marks the project of a document as not looked up yet
+_unknown = object()
+
 
 class Document(object):
     """
@@ -32,7 +35,20 @@ class Document(object):
     usage = 0
     last_opened = 0
 
-    editor_buffer_id = None
+    _filename = None
+    _editor_buffer_id = None
+
+    # seconds a stat is used without an event telling the file changed,
+    # the file watcher doesn't see files outside of the current project
+    STAT_CACHE_TIME = 1.0
+
+    _stat = None
+    _stat_time = 0
+    _project_and_path = _unknown
+
+    # called with the document, the name and the old value when filename
+    # or editor_buffer_id change, the buffer service indexes by them
+    key_changed = None
 
     def __init__(self, boss, filename=None, project=None):
         """
@@ -54,11 +70,49 @@ class Document(object):
         self.creation_time = time.time()
         self._project = project
 
+    def _set_key(self, name, value):
+        attr = '_' + name
+        old = getattr(self, attr)
+        setattr(self, attr, value)
+        if self.key_changed is not None and old != value:
+            self.key_changed(self, name, old)
+
+    def _get_filename(self):
+        return self._filename
+
+    def _set_filename(self, filename):
+        self.invalidate()
+        self.__dict__.pop('mimetype', None)
+        self._set_key('filename', filename)
+
+    filename = property(_get_filename, _set_filename)
+
+    def _get_editor_buffer_id(self):
+        return self._editor_buffer_id
+
+    def _set_editor_buffer_id(self, editor_buffer_id):
+        self._set_key('editor_buffer_id', editor_buffer_id)
+
+    editor_buffer_id = property(_get_editor_buffer_id,
+                                _set_editor_buffer_id)
+
+    def invalidate(self):
+        """
+        Forget the cached stat and project of the file, called when it was
+        saved, renamed or changed on disk, or when projects changed
+        """
+        self._stat = None
+        self._project_and_path = _unknown
+
     def project_and_path(self):
         if self.filename is None:
             return None, None
-        if self.boss is not None:
-            return self.boss.cmd('project', 'get_project_for_document', document=self)
+        if self._project_and_path is _unknown:
+            if self.boss is None:
+                return None
+            self._project_and_path = self.boss.cmd(
+                'project', 'get_project_for_document', document=self)
+        return self._project_and_path
 
     @property
     def project(self):
@@ -66,7 +120,6 @@ class Document(object):
             return self._project
         pp = self.project_and_path()
         if pp is not None:
-            self._project = pp[0]
             return pp[0]
 
     @property
@@ -100,12 +153,17 @@ class Document(object):
     @property
     def stat(self):
         """
-        Returns the stat of the current file
+        Returns the stat of the current file, it's cached until
+        :meth:`invalidate` is called or for STAT_CACHE_TIME seconds
         """
-        try:
-            return os.stat(self.filename)
-        except (OSError, TypeError):
-            return (0,) * 10
+        now = time.time()
+        if self._stat is None or now - self._stat_time > self.STAT_CACHE_TIME:
+            try:
+                self._stat = os.stat(self.filename)
+            except (OSError, TypeError):
+                self._stat = (0,) * 10
+            self._stat_time = now
+        return self._stat
 
     @cached_property
     def mimetype(self):
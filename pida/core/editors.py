@@ -168,6 +168,9 @@ class EditorCommandsConfig(CommandsConfig):
     def insert_text(self, text):
         self.svc.insert_text(text)
 
+    def check_reload(self, document):
+        return self.svc.check_reload(document)
+
 
 class EditorService(Service):
 
@@ -197,6 +200,15 @@ class EditorService(Service):
         documents_c = documents[:]
         gobject.timeout_add(100, self._open_single, documents_c)
 
+    def check_reload(self, document):
+        """
+        Called for open documents changed on disk by other programs.
+
+        Editors reload the document unless it has unsaved changes and
+        return True, with False the user is told about the change.
+        """
+        return False
+
     @classmethod
     def get_sanity_errors(cls):
         return []
@@ -40,7 +40,7 @@ def add_global_base(service_path):
     service_path = py.path.local(service_path)
     for kind in 'uidef', 'pixmaps', 'data':
         path = service_path/kind
-        if path.check(dir=True):
+        if path.check(dir=True) and path not in resources[kind]:
             resources[kind].append(path)
 
 
@@ -102,6 +102,16 @@ parser.add_argument(
 parser.add_argument(
     '--safe_mode', action='store_true',
     help=_('Starts PIDA in safe mode. Useful when PIDA doesn\'t start anymore'))
+parser.add_argument(
+    '--eager', action='store_true',
+    help=_('Activate all services at startup instead of on first use.'))
+parser.add_argument(
+    '--trace-startup', dest='startup_trace', action='store_true',
+    help=_('Print how long the startup of each service took.'))
+parser.add_argument(
+    '--trace-startup-json', dest='startup_trace_json', metavar='PATH',
+    help=_('Save a trace of the startup for chrome://tracing to PATH, '
+           'implies --trace-startup.'))
 parser.add_argument(
     '-P', '--profile', dest="profile_path",
     help=_('Generate profile data on path.'))
@@ -151,6 +161,10 @@ def is_safe_mode():
     return opts.safe_mode
 
 
+def is_lazy_activation():
+    return not opts.eager
+
+
 def workspace_name():
     if not opts.workspace:
         return "default"
@@ -16,6 +16,7 @@ class EventsConfig(SubscriberConfig):
     foreign_name = 'events'
 
     def emit(self, event, **kw):
-        for callback in self[event]:
+        # callbacks may (un)subscribe while the event is dispatched
+        for callback in list(self[event]):
             callback(**kw)
 
@@ -1,16 +1,129 @@
 
 import os
+import sys
+import stat
 import fnmatch
+import marshal
+import heapq
+import threading
 from collections import defaultdict
 from itertools import chain
+from operator import itemgetter
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
 try:
-    import cPickle as pickle
+    from os import scandir
 except ImportError:
-    import pickle
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
 
 from pida.core.log import Log
+from pida.utils.search import TrigramIndex, fuzzy_score, fuzzy_regex
 
 CACHE_NAME = "FILECACHE"
+JOURNAL_NAME = "FILECACHE.journal"
+
+# the on disk format is a marshaled header followed by a sorted snapshot of
+# records. every save after that only appends the changed records to the
+# journal, which gets folded back into the snapshot once it grows too big
+CACHE_MAGIC = "pida-filecache"
+CACHE_VERSION = 2
+# compact when the journal holds more than 1/COMPACT_RATIO of the snapshot
+COMPACT_RATIO = 4
+COMPACT_MIN = 1000
+
+ADD = "+"
+REMOVE = "-"
+
+# subtrees of the indexed directory are walked in parallel
+MAX_WORKERS = 4
+
+# a search looks if it got stopped after this many entries
+SEARCH_CHECK_INTERVAL = 1000
+# subsequence candidates verified once there are enough matches, broad
+# queries show the best of these, narrower ones verify all candidates
+FUZZY_VERIFY_LIMIT = 20000
+
+
+def _readable(st, mode, uid, gids):
+    """Check the permission bits of a stat result like os.access"""
+    if uid == 0:
+        return True
+    if st.st_uid == uid:
+        mode <<= 6
+    elif st.st_gid in gids:
+        mode <<= 3
+    return st.st_mode & mode == mode
+
+
+def _listdir(path):
+    """
+    Yield (name, stat, is_link) for the entries of path.
+
+    Uses the directory entry types where scandir is available, so every
+    entry costs exactly one stat.
+    """
+    if scandir is not None:
+        for entry in scandir(path):
+            try:
+                yield entry.name, entry.stat(), entry.is_symlink()
+            except OSError:
+                continue
+        return
+    for name in os.listdir(path):
+        full = os.path.join(path, name)
+        try:
+            st = os.lstat(full)
+            is_link = stat.S_ISLNK(st.st_mode)
+            if is_link:
+                st = os.stat(full)
+        except OSError:
+            continue
+        yield name, st, is_link
+
+
+def scan_tree(top, reltop, recursive=True):
+    """
+    Walk top and return the records of all readable entries below it
+    together with the listing of every scanned directory.
+
+    Symlinked directories are indexed but not descended into, like
+    os.walk does.
+
+    :param top: absolute path of the directory
+    :param reltop: path of top relative to the project root
+    :returns: (records, {relative dirname: set of child names})
+    """
+    from pida.services.language import DOCTYPES
+    records = []
+    listings = {}
+    pending = [(top, reltop)]
+    R_OK, X_OK = stat.S_IROTH, stat.S_IXOTH
+    uid, gids = os.geteuid(), set(os.getgroups() + [os.getegid()])
+    while pending:
+        path, relpath = pending.pop()
+        names = set()
+        try:
+            entries = list(_listdir(path))
+        except OSError:
+            continue
+        for name, st, is_link in entries:
+            is_dir = stat.S_ISDIR(st.st_mode)
+            if not _readable(st, is_dir and R_OK | X_OK or R_OK, uid, gids):
+                continue
+            full = os.path.join(path, name)
+            rel = os.path.join(relpath, name)
+            doctype = DOCTYPES.type_by_filename(full)
+            records.append((rel, is_dir, stat.S_ISREG(st.st_mode),
+                            st.st_mtime, doctype and doctype.internal or None))
+            names.add(name)
+            if is_dir and recursive and not is_link:
+                pending.append((full, rel))
+        listings[relpath] = names
+    return records, listings
 
 
 class Result(object):
@@ -22,58 +135,300 @@ class Result(object):
         self.abort = abort
 
 
+def _intern(value):
+    """Share equal strings between entries where python allows it"""
+    try:
+        return intern(value)
+    except TypeError:
+        # unicode can't be interned
+        return value
+
+
 class FileInfo(object):
+    """
+    A single entry of the file index.
+
+    There are hundreds of thousands of them in big projects, so they use
+    slots, share their dirname/ext/doctype strings and only directories
+    carry a children dict.
+    """
+    __slots__ = ("relpath", "basename", "dirname", "ext", "doctype",
+                 "is_dir", "is_file", "mtime", "children")
+
     def __init__(self, path, relpath):
-        self.relpath = relpath
-        self.basename = os.path.basename(relpath)
-        self.dirname = os.path.dirname(relpath)
-        self.ext = os.path.splitext(self.basename)[1]
+        self._set_path(relpath)
+        st = os.stat(path)
         self.doctype = None
-        self.is_dir = os.path.isdir(path)
-        self.is_file = os.path.isfile(path)
-        self.mtime = os.path.getmtime(path)
-        self.children = {}
+        self.is_dir = stat.S_ISDIR(st.st_mode)
+        self.is_file = stat.S_ISREG(st.st_mode)
+        self.mtime = st.st_mtime
+        self.children = {} if self.is_dir else None
+
+    def _set_path(self, relpath):
+        self.relpath = relpath
+        dirname, basename = os.path.split(relpath)
+        self.dirname = _intern(dirname)
+        self.basename = _intern(basename)
+        self.ext = _intern(os.path.splitext(basename)[1])
+
+    @classmethod
+    def from_record(cls, record):
+        """
+        Create a FileInfo from a record of the on disk cache without
+        touching the filesystem
+        """
+        relpath, is_dir, is_file, mtime, doctype = record
+        info = cls.__new__(cls)
+        info._set_path(relpath)
+        info.doctype = doctype and _intern(doctype)
+        info.is_dir = is_dir
+        info.is_file = is_file
+        info.mtime = mtime
+        info.children = {} if is_dir else None
+        return info
+
+    def update(self, record):
+        """
+        Update from a fresh record, returns True if something changed
+        """
+        relpath, is_dir, is_file, mtime, doctype = record
+        if (self.is_dir, self.is_file, self.mtime, self.doctype) == \
+           (is_dir, is_file, mtime, doctype):
+            return False
+        self.is_dir = is_dir
+        self.is_file = is_file
+        self.mtime = mtime
+        self.doctype = doctype and _intern(doctype)
+        if not is_dir:
+            self.children = None
+        elif self.children is None:
+            self.children = {}
+        return True
+
+    def to_record(self):
+        return (self.relpath, self.is_dir, self.is_file, self.mtime,
+                self.doctype)
 
     def __repr__(self):
         return "<FileInfo %s >" % self.relpath
 
 
+class IndexDelta(object):
+    """The relative paths added, removed and modified by an index run"""
+    __slots__ = "added", "removed", "modified"
+
+    def __init__(self):
+        self.added = set()
+        self.removed = set()
+        self.modified = set()
+
+    def __nonzero__(self):
+        return bool(self.added or self.removed or self.modified)
+
+    def __repr__(self):
+        return "<IndexDelta +%d -%d ~%d>" % (
+            len(self.added), len(self.removed), len(self.modified))
+
+
 class Indexer(Log):
-    def __init__(self, project):
+    def __init__(self, project, workers=None):
         self.project = project
+        self.workers = workers or min(MAX_WORKERS, cpu_count())
+        # guards the cache against concurrent index runs and single
+        # updates, like saved documents, from the main thread
+        self._lock = threading.RLock()
+        # a loaded cache misses the files created since it got saved, the
+        # index is only complete after a whole tree run in this session
+        self.refreshed = False
         self.reset_cache()
 
     def reset_cache(self):
-        self.cache = {
+        self._cache = {
                 "paths": {},
                 "dirs": {},
                 "files": {},
                 "filenames": defaultdict(list),
                 "dirnames": defaultdict(list),
                }
+        # built on first use by search_index
+        self._search_index = None
+        # None means the snapshot on disk is outdated and has to be rewritten
+        self._journal = None
+        self._journal_size = 0
+        self._pending_load = False
+
+    @property
+    def cache(self):
+        if self._pending_load:
+            with self._lock:
+                if self._pending_load:
+                    self._pending_load = False
+                    self._read_cache()
+        return self._cache
+
+    @property
+    def search_index(self):
+        """The :class:`TrigramIndex` over the relative paths"""
+        with self._lock:
+            if self._search_index is None:
+                index = TrigramIndex(chars=True)
+                for relpath in self.cache['paths']:
+                    index.add(relpath, relpath)
+                self._search_index = index
+            return self._search_index
+
+    def _added(self, info):
+        if self._search_index is not None:
+            self._search_index.add(info.relpath, info.relpath)
+
+    def _removed(self, relpath):
+        if self._search_index is not None:
+            self._search_index.remove(relpath)
+
+    def _log_change(self, *record):
+        if self._journal is not None:
+            self._journal.append(record)
 
     def save_cache(self):
-        path = self.project.get_meta_dir(filename=CACHE_NAME)
+        """
+        Write the changes since the last save to disk.
+
+        Only the journal of changed records is appended, unless the snapshot
+        is outdated or the journal grew big enough to be compacted.
+        """
+        if self._pending_load:
+            # never loaded, so nothing can have changed
+            return
         try:
-            with open(path, "w") as fp:
-                pickle.dump(self.cache, fp)
-        except OSError as err:
+            limit = max(COMPACT_MIN, len(self._cache['paths']) // COMPACT_RATIO)
+            if self._journal is None or \
+               self._journal_size + len(self._journal) > limit:
+                self._write_snapshot()
+            elif self._journal:
+                self._append_journal()
+        except (IOError, OSError) as err:
             self.log.error("can't save cache: {err}", err=err)
 
+    def _write_snapshot(self):
+        path = self.project.get_meta_dir(filename=CACHE_NAME)
+        records = [info.to_record() for key, info in
+                   sorted(self._cache['paths'].iteritems())]
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as fp:
+            marshal.dump((CACHE_MAGIC, CACHE_VERSION), fp)
+            marshal.dump(records, fp)
+        os.rename(tmp, path)
+        journal = self.project.get_meta_dir(filename=JOURNAL_NAME)
+        if os.path.exists(journal):
+            os.unlink(journal)
+        self._journal = []
+        self._journal_size = 0
+
+    def _append_journal(self):
+        path = self.project.get_meta_dir(filename=JOURNAL_NAME)
+        with open(path, "ab") as fp:
+            for record in self._journal:
+                marshal.dump(record, fp)
+        self._journal_size += len(self._journal)
+        self._journal = []
+
     def load_cache(self):
+        """
+        Check for a usable cache on disk.
+
+        The records themselves are read on the first access of :attr:`cache`
+        """
         path = self.project.get_meta_dir(filename=CACHE_NAME)
         if os.path.isfile(path):
             try:
-                with open(path) as fp:
-                    self.cache = pickle.load(fp)
+                with open(path, "rb") as fp:
+                    header = marshal.load(fp)
+                if header != (CACHE_MAGIC, CACHE_VERSION):
+                    raise ValueError("unknown cache format %r" % (header,))
+                self.reset_cache()
+                self._pending_load = True
                 return True
             except Exception as err:
-                self.log.error("can't load cache of {indexer!r}", indexer=self)
-                os.unlink(path)
+                self.log.error("can't load cache of {indexer!r}: {err}",
+                               indexer=self, err=err)
+                self._remove_cache_files()
         return False
 
+    def _remove_cache_files(self):
+        for name in (CACHE_NAME, JOURNAL_NAME):
+            path = self.project.get_meta_dir(filename=name)
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def _read_cache(self):
+        records = {}
+        try:
+            path = self.project.get_meta_dir(filename=CACHE_NAME)
+            with open(path, "rb") as fp:
+                marshal.load(fp)
+                for record in marshal.load(fp):
+                    records[record[0]] = record
+            journal = self.project.get_meta_dir(filename=JOURNAL_NAME)
+            if os.path.isfile(journal):
+                with open(journal, "rb") as fp:
+                    while True:
+                        try:
+                            entry = marshal.load(fp)
+                        except EOFError:
+                            break
+                        self._journal_size += 1
+                        if entry[0] == ADD:
+                            records[entry[1]] = entry[1:]
+                        else:
+                            records.pop(entry[1], None)
+        except Exception as err:
+            self.log.error("can't load cache of {indexer!r}: {err}",
+                           indexer=self, err=err)
+            self._remove_cache_files()
+            self._journal = None
+            return
+
+        paths = self._cache['paths']
+        for relpath, record in records.iteritems():
+            paths[relpath] = FileInfo.from_record(record)
+        for info in paths.itervalues():
+            parent = paths.get(info.dirname)
+            if info.dirname != info.basename and parent and parent.is_dir:
+                parent.children[info.basename] = info
+        self.rebuild_shortcuts()
+        self._journal = []
+
+    def memory_usage(self):
+        """
+        Estimate the memory held by the index.
+
+        Returns a tuple of (entries, total bytes, bytes per entry).  Shared
+        strings are only counted once.
+        """
+        getsizeof = sys.getsizeof
+        seen = set()
+        total = 0
+        for name, cache in self.cache.iteritems():
+            total += getsizeof(cache)
+            if name in ("filenames", "dirnames"):
+                total += sum(getsizeof(lst) for lst in cache.itervalues())
+        for info in self.cache["paths"].itervalues():
+            total += getsizeof(info)
+            if info.children is not None:
+                total += getsizeof(info.children)
+            for value in (info.relpath, info.basename, info.dirname,
+                          info.ext, info.mtime):
+                if id(value) not in seen:
+                    seen.add(id(value))
+                    total += getsizeof(value)
+        entries = len(self.cache["paths"])
+        return entries, total, entries and total // entries
 
     def rebuild_shortcuts(self):
+        with self._lock:
+            self._rebuild_shortcuts()
+
+    def _rebuild_shortcuts(self):
         self.cache["dirs"] = {}
         self.cache["files"] = {}
         self.cache["filenames"] = defaultdict(list)
@@ -93,6 +448,10 @@ class Indexer(Log):
 
         @path is an absolute path
         """
+        with self._lock:
+            return self._index_path(path, update_shortcuts)
+
+    def _index_path(self, path, update_shortcuts):
         from pida.services.language import DOCTYPES
         doctype = DOCTYPES.type_by_filename(path)
         rel = self.project.get_relative_path_for(path)
@@ -103,16 +462,24 @@ class Indexer(Log):
         if rpath is None:
             #document outside of project
             return
-        if rpath in self.cache['paths']:
-            info = self.cache['paths'][rpath]
+        try:
+            fresh = FileInfo(path, rpath)
+        except OSError as err:
+            self.log.info(_("Error indexing {path}:{err}"), path=path, err=err)
+            return
+        fresh.doctype = doctype and doctype.internal or None
+        info = self.cache['paths'].get(rpath)
+        if info is None:
+            info = fresh
+            self.cache["paths"][info.relpath] = info
+            self._added(info)
+            self._log_change(ADD, *info.to_record())
         else:
-            try:
-                info = FileInfo(path, rpath)
-            except OSError as err:
-                self.log.info(_("Error indexing {path}:{err}"), path=path, err=err)
-                return
-        info.doctype = doctype and doctype.internal or None
-        self.cache["paths"][info.relpath] = info
+            was_dir = info.is_dir
+            if self._update_info(info, fresh.to_record()):
+                self._log_change(ADD, *info.to_record())
+                if was_dir and not info.is_dir and update_shortcuts:
+                    self._rebuild_shortcuts()
 
         if update_shortcuts:
             if info.is_dir:
@@ -132,24 +499,48 @@ class Indexer(Log):
 
         return info
 
-    def _del_info(self, info):
+    def _del_info(self, info, delta=None):
         """Delete info and all children if any recrusivly"""
         #raise Exception()
-        if info.dirname:
-            parent = self.cache['paths'][info.dirname]
-            if info in parent.children:
+        if info.relpath:
+            parent = self.cache['paths'].get(info.dirname)
+            if parent is not None and info.basename in (parent.children or ()):
                 del parent.children[info.basename]
 
         if info.is_dir:
-            match = "%s%s" % (info.relpath, os.path.sep)
-            todel = []
-            for key in self.cache['paths'].iterkeys():
-                if key[:len(match)] == match:
-                    todel.append(key)
-            for key in todel:
-                del self.cache['paths'][key]
+            self._del_children(info, delta)
 
         del self.cache['paths'][info.relpath]
+        self._removed(info.relpath)
+        self._log_change(REMOVE, info.relpath)
+        if delta is not None:
+            delta.removed.add(info.relpath)
+
+    def _del_children(self, info, delta=None):
+        """Delete everything below the directory info"""
+        match = "%s%s" % (info.relpath, os.path.sep)
+        todel = []
+        for key in self.cache['paths'].iterkeys():
+            if key[:len(match)] == match:
+                todel.append(key)
+        for key in todel:
+            del self.cache['paths'][key]
+            self._removed(key)
+            self._log_change(REMOVE, key)
+        if delta is not None:
+            delta.removed.update(todel)
+        if info.children:
+            info.children.clear()
+
+    def _update_info(self, info, record, delta=None):
+        """
+        Update info from a fresh record, returns True if something changed
+
+        A directory replaced by a file takes its old contents along.
+        """
+        if info.is_dir and not record[1]:
+            self._del_children(info, delta)
+        return info.update(record)
 
     def index(self, path="", recrusive=False, rebuild=False):
         """
@@ -160,10 +551,11 @@ class Indexer(Log):
         """
 
         if path == "" and rebuild:
-            self.reset_cache()
+            with self._lock:
+                self.reset_cache()
 
         if os.path.isabs(path):
-            rpath = self.project.get_relative_path_for(path)
+            rpath = path
         else:
             rpath = os.path.join(self.project.source_directory, path)
 
@@ -171,41 +563,209 @@ class Indexer(Log):
             return self.index_path(rpath)
 
         #creat the root node
-        self.index_path(rpath, update_shortcuts=False)
-
-        for dirpath, dirs, files in os.walk(rpath):
-            current = self.cache['paths'][
-                             os.sep.join(self.project.get_relative_path_for(dirpath))]
-            if not recrusive:
-                del dirs[:]
-            for file_ in files:
-                if os.access(os.path.join(dirpath, file_), os.R_OK):
-                    self.index_path(os.path.join(dirpath, file_),
-                                    update_shortcuts=False)
-            for dir_ in dirs:
-                if os.access(os.path.join(dirpath, dir_), os.R_OK | os.X_OK):
-                    self.index_path(os.path.join(dirpath, dir_),
-                                    update_shortcuts=False)
-
-            # delete not existing nodes
-            #print current.children, files+dirs
-            for old in [x for x in current.children if x not in files + dirs]:
-                self._del_info(current.children[old])
-            #match = "%s%s" %(current.relpath, os.path.sep)
-            #for key, item in self._cache['paths'].iteritems():
-            #    print key, match, key[:len(match)]
-            #    if key[:len(match)] == match:
-            #      if item.basename not in dirs and item.basename not in files:
-                        #print "dell", key
-                        #del self._cache[key]
+        root = self.index_path(rpath, update_shortcuts=False)
+        if root is None or not root.is_dir:
+            return
+
+        # the top level gets scanned right here, its subdirectories are
+        # fanned out to the workers and merged as they come in
+        results = [scan_tree(rpath, root.relpath, recursive=False)]
+        if recrusive:
+            results.extend(self._scan_subtrees(
+                [rec[0] for rec in results[0][0] if rec[1]]))
+        with self._lock:
+            for records, listings in results:
+                self._merge(records, listings)
+            self._rebuild_shortcuts()
+        if recrusive and root.relpath == "":
+            self.refreshed = True
+
+    def refresh(self, dirs=None, rescan=False):
+        """
+        Bring the whole index up to date and return an :class:`IndexDelta`.
+
+        Every known directory gets a single stat, only those whose mtime
+        changed since the last run are listed again.  New directories are
+        scanned completely.  Files changed in place don't touch the mtime
+        of their directory, they are picked up through :meth:`index_path`
+        when saved, by the file watcher or by a rescan.
+
+        :param dirs: only list these project relative directories again
+                     instead of walking the whole tree, subdirectories are
+                     only visited if their mtime changed
+        :param rescan: list every directory again, so files changed in place
+                     are reported as modified as well
+        """
+        source = self.project.source_directory
+        delta = IndexDelta()
+        paths = self.cache['paths']
+        if '' not in paths:
+            if self.index_path(source) is None:
+                return delta
+            forced = set([''])
+            dirs = None
+        else:
+            forced = set()
+        recursive = dirs is None
+
+        new_dirs = []
+        if recursive:
+            pending = ['']
+        else:
+            pending = list(dirs)
+            forced.update(pending)
+        while pending:
+            relpath = pending.pop()
+            with self._lock:
+                info = paths.get(relpath)
+                if info is None or info.children is None:
+                    continue
+                known_mtime = info.mtime
+                subdirs = [child.relpath for child in
+                           info.children.itervalues() if child.is_dir]
+            full = os.path.join(source, relpath)
+            try:
+                st = os.lstat(full)
+            except OSError:
+                # vanished, the listing of the parent takes care of it
+                continue
+            if stat.S_ISLNK(st.st_mode) and relpath:
+                continue
+            if st.st_mtime == known_mtime and relpath not in forced and \
+               not rescan:
+                if recursive:
+                    pending.extend(subdirs)
+                continue
+
+            records, listings = scan_tree(full, relpath, recursive=False)
+            with self._lock:
+                if info.update((relpath, True, False, st.st_mtime,
+                                info.doctype)):
+                    self._log_change(ADD, *info.to_record())
+                for record in records:
+                    if not record[1]:
+                        continue
+                    known = paths.get(record[0])
+                    if known is None:
+                        new_dirs.append(record[0])
+                        continue
+                    # merging updates the mtime, remember the change
+                    if known.mtime != record[3]:
+                        forced.add(record[0])
+                    elif not recursive:
+                        continue
+                    pending.append(record[0])
+                self._merge(records, listings, delta)
+
+        results = self._scan_subtrees(new_dirs)
+        with self._lock:
+            for records, listings in results:
+                self._merge(records, listings, delta)
+            if delta:
+                self._rebuild_shortcuts()
+        if recursive:
+            self.refreshed = True
+        return delta
+
+    def update_paths(self, paths):
+        """
+        Update the index for changed absolute paths, as reported by a file
+        system watcher, and return an :class:`IndexDelta`.
+
+        Known files which still exist are indexed on their own, for all
+        other paths the parent directory is listed again.
+        """
+        delta = IndexDelta()
+        dirs = set()
+        cache = self.cache['paths']
+        for path in paths:
+            rel = self.project.get_relative_path_for(path)
+            if rel is None:
+                continue
+            relpath = os.sep.join(rel)
+            with self._lock:
+                info = cache.get(relpath)
+                if info is not None and info.is_file and \
+                   os.path.isfile(path):
+                    mtime = info.mtime
+                    self._index_path(path, False)
+                    if info.mtime != mtime:
+                        delta.modified.add(relpath)
+                    continue
+            if info is not None and info.is_dir:
+                dirs.add(relpath)
+            if relpath:
+                dirs.add(os.path.dirname(relpath))
+        if dirs:
+            listed = self.refresh(dirs)
+            delta.added.update(listed.added)
+            delta.removed.update(listed.removed)
+            delta.modified.update(listed.modified)
+        return delta
+
+    def _scan_subtrees(self, subdirs):
+        """
+        Scan the project relative directories recursively on the worker
+        pool.  Symlinked directories are skipped like :func:`scan_tree` does.
+        """
+        source = self.project.source_directory
+        subdirs = [rel for rel in subdirs
+                   if not os.path.islink(os.path.join(source, rel))]
+        if not subdirs:
+            return []
+        pool = ThreadPool(min(self.workers, len(subdirs)))
         try:
-            self.rebuild_shortcuts()
-        except RuntimeError:
-            # this happens when a index process is running while a file
-            # is saved in the project of a non indexed directory which will
-            # index the directory and a dictionary changed size during iteration
-            # will most likely raise. they are harmless
-            pass
+            return pool.map(
+                lambda rel: scan_tree(os.path.join(source, rel), rel),
+                subdirs)
+        finally:
+            pool.close()
+
+    def _merge(self, records, listings, delta=None):
+        """Merge the result of a :func:`scan_tree` run into the cache"""
+        paths = self.cache['paths']
+        for record in records:
+            info = paths.get(record[0])
+            if info is None:
+                info = FileInfo.from_record(record)
+                paths[info.relpath] = info
+                self._added(info)
+                self._log_change(ADD, *record)
+                if delta is not None:
+                    delta.added.add(info.relpath)
+            elif self._update_info(info, record, delta):
+                self._log_change(ADD, *record)
+                if delta is not None and info.is_file:
+                    delta.modified.add(info.relpath)
+            parent = paths.get(info.dirname)
+            if parent is not None and parent.children is not None:
+                parent.children[info.basename] = info
+
+        # delete not existing nodes
+        for relpath, names in listings.iteritems():
+            current = paths.get(relpath)
+            if current is None or current.children is None:
+                continue
+            for old in [x for x in current.children if x not in names]:
+                self._del_info(current.children[old], delta)
+
+    def get_files(self, prefix=""):
+        """Returns the sorted relative paths of all files below prefix"""
+        with self._lock:
+            return sorted(path for path in self.cache['files']
+                          if path.startswith(prefix))
+
+    def get_file_mtimes(self, prefix=""):
+        """
+        Returns a dict of the relative paths below prefix to their mtime
+
+        The mtimes of files changed in place outside of PIDA are only
+        current with the file watcher or after :meth:`refresh` with rescan.
+        """
+        with self._lock:
+            return dict((path, info.mtime) for path, info in
+                        self.cache['files'].iteritems()
+                        if path.startswith(prefix))
 
     def query(self, test):
         """
@@ -216,12 +776,16 @@ class Indexer(Log):
             callable which gets a FileInfo object passed
             and returns a :class:`Result` object
         """
-        paths = sorted(self.cache['paths'])
+        with self._lock:
+            paths = sorted(self.cache['paths'])
         skip = None
         for path in paths:
             if skip and path[:len(skip)] == skip:
                 continue
-            item = self.cache['paths'][path]
+            item = self.cache['paths'].get(path)
+            if item is None:
+                # removed by a concurrent index run
+                continue
             res = test(item)
             if res is None:
                 # asume not accepted, but recurse on no result
@@ -235,6 +799,128 @@ class Indexer(Log):
             if res.abort:
                 break
 
+    def search(self, text, limit=200, test=None, is_stopped=None):
+        """
+        Yield the entries best matching text, at most limit of them.
+
+        Every whitespace separated token of text has to match the relative
+        path case insensitively, either as substring or as subsequence.
+        Substring matches are narrowed down through the trigrams of
+        :attr:`search_index` and yielded first, subsequence matches follow
+        if there is room left.  Those are narrowed down to the paths
+        containing all characters of the tokens.  Both groups are ordered
+        by :func:`fuzzy_score`.
+
+        Once limit subsequence matches are found, at most
+        ``FUZZY_VERIFY_LIMIT`` candidates are verified, so queries matching
+        large parts of the tree stay fast.
+
+        :param test:
+            optional callable which gets a FileInfo object passed,
+            entries it returns False for are skipped
+        :param is_stopped:
+            optional callable, the search ends early once it returns True
+        """
+        tokens = [token.lower() for token in text.split()]
+        paths = self.cache['paths']
+        with self._lock:
+            if not tokens:
+                infos = paths.values()
+            else:
+                infos = self._search_candidates(
+                    self.search_index.candidates, tokens)
+
+        def score(info):
+            start = len(info.relpath) - len(info.basename)
+            total = 0
+            for token in tokens:
+                value = fuzzy_score(token, info.relpath, start)
+                if value is None:
+                    return None
+                total += value
+            return total
+
+        def stopped(position):
+            return is_stopped is not None and \
+                   position % SEARCH_CHECK_INTERVAL == 0 and is_stopped()
+
+        if not tokens:
+            matches = []
+            for position, info in enumerate(infos):
+                if stopped(position):
+                    return
+                if test is None or test(info):
+                    matches.append(info.relpath)
+            matches.sort()
+            for relpath in matches[:limit]:
+                yield paths[relpath]
+            return
+
+        found = []
+        for position, info in enumerate(infos):
+            if stopped(position):
+                return
+            relpath = info.relpath.lower()
+            if all(token in relpath for token in tokens) and \
+               (test is None or test(info)):
+                found.append((score(info), info))
+        # equal scores keep the paths in order
+        found.sort(key=lambda item: item[1].relpath)
+        found = heapq.nlargest(limit, found, key=itemgetter(0))
+        for value, info in found:
+            yield info
+
+        limit -= len(found)
+        if limit <= 0:
+            return
+        regexes = [fuzzy_regex(token) for token in tokens]
+        with self._lock:
+            infos = self._search_candidates(
+                self.search_index.subsequence_candidates, tokens)
+        # a heap of the best limit matches, the negated position keeps
+        # earlier paths first on equal scores
+        best = []
+        for position, info in enumerate(infos):
+            if stopped(position):
+                return
+            if len(best) == limit and position >= FUZZY_VERIFY_LIMIT:
+                break
+            relpath = info.relpath
+            if not all(regex.search(relpath) for regex in regexes):
+                continue
+            lower = relpath.lower()
+            if all(token in lower for token in tokens):
+                # already yielded as substring match
+                continue
+            if test is None or test(info):
+                item = (score(info), -position, info)
+                if len(best) < limit:
+                    heapq.heappush(best, item)
+                elif item > best[0]:
+                    heapq.heapreplace(best, item)
+        for value, position, info in sorted(best, reverse=True):
+            yield info
+
+    def _search_candidates(self, lookup, tokens):
+        """
+        Returns the entries lookup on the :attr:`search_index` leaves for
+        all tokens, all entries if it can't narrow down any of them
+        """
+        paths = self.cache['paths']
+        candidates = None
+        for token in tokens:
+            found = lookup(token)
+            if found is None:
+                continue
+            if candidates is None:
+                candidates = found
+            else:
+                found = set(found)
+                candidates = [key for key in candidates if key in found]
+        if candidates is None:
+            return paths.values()
+        return [paths[key] for key in candidates if key in paths]
+
     def query_basename(self, filename, glob=False, files=True, dirs=False,
                        case=False):
         """
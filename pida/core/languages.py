@@ -7,9 +7,14 @@ Language Support Superclasses
 :copyright: 2008 the Pida Project
 """
 from functools import partial
+from collections import deque
 from weakref import WeakKeyDictionary
 import abc
+import time
 import string
+import sys
+import threading
+from Queue import Queue, Empty, Full
 import gobject
 
 from pida.core.document import Document
@@ -329,34 +334,132 @@ class SnippetTemplate(object):
         return []
 
 
+def _produce(iterator, queue, stopped):
+    """Puts the items of iterator into queue until stopped is set"""
+    def put(entry):
+        while not stopped.is_set():
+            try:
+                queue.put(entry, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+    try:
+        for item in iterator:
+            if not put(('item', item)):
+                return
+    except Exception:
+        put(('error', sys.exc_info()))
+    else:
+        put(('end', None))
+
+
+class ResultBatcher(object):
+    """
+    Collects the results of a generator into batches in the external process
+
+    A batch is complete once it holds batch_size items or flush_interval
+    seconds passed since its first item, so slow plugins still deliver
+    their first results early.  The generator runs on its own thread, so
+    a batch is also flushed while the plugin computes the next result.
+    """
+
+    def __init__(self, iterator, batch_size=50, flush_interval=0.05):
+        self.iterator = iter(iterator)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.error = None
+        self._queue = None
+        self._stopped = threading.Event()
+        self._done = False
+
+    def _start(self):
+        self._queue = Queue(self.batch_size)
+        # the thread must not keep the batcher alive, see close
+        thread = threading.Thread(target=_produce, args=(
+            self.iterator, self._queue, self._stopped))
+        thread.daemon = True
+        thread.start()
+        self.iterator = None
+
+    def next_batch(self):
+        """Returns the next list of results, an empty list at the end"""
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error[0], error[1], error[2]
+        batch = []
+        if self._done:
+            return batch
+        if self._queue is None:
+            self._start()
+        deadline = None
+        while len(batch) < self.batch_size:
+            try:
+                if deadline is None:
+                    kind, value = self._queue.get()
+                else:
+                    timeout = deadline - time.time()
+                    if timeout <= 0:
+                        break
+                    kind, value = self._queue.get(timeout=timeout)
+            except Empty:
+                break
+            if kind == 'item':
+                batch.append(value)
+                if deadline is None:
+                    deadline = time.time() + self.flush_interval
+                continue
+            self._done = True
+            if kind == 'error':
+                if not batch:
+                    raise value[0], value[1], value[2]
+                # deliver what we have, raise on the next call
+                self.error = value
+            break
+        return batch
+
+    def close(self):
+        """Stop the generator thread, it's done when the proxy goes away"""
+        self._stopped.set()
+
+    __del__ = close
+
+
 # Proxy type for generator objects
 class GeneratorProxy(BaseProxy):
     """
     Proxies iterators over multiprocessing
+
+    Results are fetched in batches from a ResultBatcher, so there is one
+    round trip per batch instead of one per item.
     """
-    _exposed_ = ('next', '__next__')
+    _exposed_ = ('next_batch',)
+    _buffer = None
+
     def __iter__(self):
         return self
+
     def next(self):
-        try:
-            return self._callmethod('next')
-        except (RemoteError, EOFError):
-            if getattr(self._manager, 'is_shutdown', False):
+        buffer_ = self._buffer
+        if not buffer_:
+            buffer_ = self._buffer = deque(self._fetch())
+            if not buffer_:
                 raise StopIteration
-            else:
-                raise
+        return buffer_.popleft()
+
+    __next__ = next
 
-    def __next__(self):
+    def _fetch(self):
         try:
-            return self._callmethod('__next__')
+            return self._callmethod('next_batch')
         except (RemoteError, EOFError):
             if getattr(self._manager, 'is_shutdown', False):
-                raise StopIteration
+                return ()
             else:
                 raise
 
-def run(x, *k, **kw):
-    return x.run(*k, **kw)
+def run(x, batch_size, flush_interval, *k, **kw):
+    return ResultBatcher(x.run(*k, **kw), batch_size, flush_interval)
 
 
 class ExternalMeta(type):
@@ -411,6 +514,12 @@ class External(SyncManager):
     definer = None
     completer = None
 
+    # results of run are sent back in batches of batch_size items or
+    # whatever was collected after flush_interval seconds, the JobServer
+    # may be configured differently
+    batch_size = 50
+    flush_interval = 0.05
+
     @staticmethod
     def run(instance):
         for i in instance.run():
@@ -525,53 +634,167 @@ class MergeCompleter(Completer, Merger):
                 results.add(res)
                 yield res
 
-def safe_remote(func):
-    import functools
-    @functools.wraps(func)
-    def safe(self, *args, **kwargs):
+class Job(object):
+    """
+    A single run of a language plugin in an external process.
+
+    Cancelled jobs stop fetching results, so the external process stops
+    working on them as well.
+    """
+
+    def __init__(self, process, proxy):
+        self.process = process
+        self.proxy = proxy
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class ExternalProcess(object):
+    """
+    An External manager process of the JobServer and its bookkeeping
+    """
+
+    def __init__(self, external):
+        self.manager = external()
+        # instances of the language plugins by document
+        self.instances = {}
+        # affinity keys dispatched to this process
+        self.keys = set()
+        self.running = 0
+        self.done = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    def start(self):
+        self.manager.start()
+
+    @property
+    def pid(self):
+        process = getattr(self.manager, '_process', None)
+        return process.pid if process is not None else None
+
+    def is_alive(self):
+        process = getattr(self.manager, '_process', None)
+        return process is not None and process.is_alive()
+
+    @property
+    def load(self):
+        return self.running, len(self.keys)
+
+    def get_stats(self):
+        return {
+            'pid': self.pid,
+            'alive': self.is_alive(),
+            'running': self.running,
+            'done': self.done,
+            'failed': self.failed,
+            'cancelled': self.cancelled,
+            'keys': len(self.keys),
+        }
+
+    def shutdown(self):
+        self.manager.is_shutdown = True
         try:
-            for i in func(self, *args, **kwargs):
-                yield i
-        except RuntimeError as e:
-            self.log.warning(_("problems running external plugin: {err}"),
-                             err=e)
-            self.restart()
-            return
-        except:
-            if self.stopped:
-                return
-            raise
-    return safe
+            self.manager.shutdown()
+        except Exception:
+            # the process is gone already
+            pass
+        # drop the proxies once the manager is marked as shut down, they
+        # would wait for the connection timeout of a dead one otherwise
+        self.instances.clear()
 
 
 class JobServer(Log):
     """
     The Jobserver dispatches language plugin jobs to external processes it
     manages.
+
+    Jobs of the same project (or document outside of projects) and plugin
+    type always go to the same process, so the caches of the plugins stay
+    warm.  New keys are dispatched to the least loaded process, at most
+    max_processes are started.
+
+    Results are streamed back in batches of batch_size items or whatever
+    was collected after flush_interval seconds.  They default to the
+    values of the External class.
     """
-    def __init__(self, svc, external, max_processes=2):
+    def __init__(self, svc, external, max_processes=2, batch_size=None,
+                 flush_interval=None):
         self.svc = svc
-        self.max_processes = max_processes
         self.stopped = False
-        # we have to map the proxy objects to
         self._external = external
+        self._lock = threading.RLock()
+        self.configure(max_processes, batch_size, flush_interval)
         self._processes = []
+        self._affinity = {}
         self._proxy_map = WeakKeyDictionary()
-        self._instances = {}
+        self._jobs = WeakKeyDictionary()
+
+    @staticmethod
+    def get_affinity_key(proxy):
+        """
+        Returns the key jobs of proxy are dispatched by
+        """
+        document = proxy.document
+        project = getattr(document, 'project', None)
+        if project is not None:
+            return project.source_directory, proxy.mytype
+        return id(document), proxy.mytype
+
+    def _start_process(self):
+        process = ExternalProcess(self._external)
+        process.start()
+        self._processes.append(process)
+        return process
+
+    def _drop_process(self, process):
+        with self._lock:
+            if process not in self._processes:
+                return
+            self._processes.remove(process)
+            for key in process.keys:
+                self._affinity.pop(key, None)
+            for proxy, other in self._proxy_map.items():
+                if other is process:
+                    del self._proxy_map[proxy]
+        process.shutdown()
 
     def get_process(self, proxy=None):
         """
-        Returns a Extern instance.
-        It tries to use the same instance for proxy so it does not need to
+        Returns the ExternalProcess jobs of proxy are run in.
+
+        It tries to use the same process for proxy so it does not need to
         be recreated and can make best use of caching
         """
-        # FIXME needs some better management of processes and dispatching
-        if not self._processes:
-            np = self._external()
-            np.start()
-            self._instances[np] = {} #np.dict()
-            self._processes.append(np)
-        return self._processes[0]
+        with self._lock:
+            if proxy is not None:
+                key = self.get_affinity_key(proxy)
+                process = self._proxy_map.get(proxy)
+                if process is None:
+                    process = self._affinity.get(key)
+            else:
+                key = process = None
+            if process is not None and not process.is_alive():
+                self.log.warning(_("external process {pid} died"),
+                                 pid=process.pid)
+                self._drop_process(process)
+                process = None
+            if process is None:
+                idle = [p for p in self._processes if p.load == (0, 0)]
+                if idle:
+                    process = idle[0]
+                elif len(self._processes) < self.max_processes:
+                    process = self._start_process()
+                else:
+                    process = min(self._processes, key=lambda p: p.load)
+                if key is not None:
+                    self._affinity[key] = process
+                    process.keys.add(key)
+            if proxy is not None:
+                self._proxy_map[proxy] = process
+            return process
 
     def get_instance(self, proxy):
         """
@@ -580,38 +803,149 @@ class JobServer(Log):
 
         Everything called on this objects are done in the external process
         """
-        manager = self._proxy_map.get(proxy, None)
-        if not manager:
-            manager = self.get_process(proxy)
-            self._proxy_map[proxy] = manager
-        instances = self._instances[manager]
+        process = self.get_process(proxy)
+        return process.manager, self._get_instance(process, proxy)
+
+    def _get_instance(self, process, proxy):
+        manager = process.manager
+        instances = process.instances
         if id(proxy.document) not in instances:
             instances[id(proxy.document)] = manager.dict()
         if proxy.mytype not in instances[id(proxy.document)]:
-            #no = getattr(manager, type_)(manager)(None, proxy.document)
-            instances[id(proxy.document)][proxy.mytype] = getattr(manager, proxy.mytype)(None, proxy.get_external_document())
-        return manager, instances[id(proxy.document)][proxy.mytype]
+            instances[id(proxy.document)][proxy.mytype] = getattr(
+                manager, proxy.mytype)(None, proxy.get_external_document())
+        return instances[id(proxy.document)][proxy.mytype]
+
+    def _start_job(self, proxy):
+        process = self.get_process(proxy)
+        with self._lock:
+            # a new run of the same proxy makes the old results useless
+            old = self._jobs.get(proxy)
+            if old is not None:
+                old.cancel()
+            job = self._jobs[proxy] = Job(process, proxy)
+        return job
+
+    def _finish_job(self, job, failed=False):
+        with self._lock:
+            process = job.process
+            process.running -= 1
+            if failed:
+                process.failed += 1
+            elif job.cancelled:
+                process.cancelled += 1
+            else:
+                process.done += 1
+            if self._jobs.get(job.proxy) is job:
+                del self._jobs[job.proxy]
 
-    @safe_remote
     def run(self, proxy, *k, **kw):
         """Forwards to the external process"""
-        manager, instance = self.get_instance(proxy)
-        return manager.run(instance, *k, **kw)
+        # the job is registered right away, so it supersedes older runs
+        # even if they are iterated later
+        return self._run(self._start_job(proxy), *k, **kw)
+
+    def _run(self, job, *k, **kw):
+        if job.cancelled:
+            return
+        with self._lock:
+            job.process.running += 1
+        failed = False
+        try:
+            instance = self._get_instance(job.process, job.proxy)
+            results = job.process.manager.run(
+                instance, self.batch_size, self.flush_interval, *k, **kw)
+            for item in results:
+                if job.cancelled:
+                    return
+                yield item
+        except (RuntimeError, EOFError, IOError) as e:
+            failed = True
+            if self.stopped:
+                return
+            self.log.warning(_("problems running external plugin: {err}"),
+                             err=e)
+            self._drop_process(job.process)
+        except GeneratorExit:
+            # the consumer lost interest, that's no fault of the process
+            job.cancel()
+            raise
+        except:
+            failed = True
+            if self.stopped or job.cancelled:
+                return
+            raise
+        finally:
+            self._finish_job(job, failed)
+
+    def cancel(self, proxy=None):
+        """
+        Cancel the running job of proxy or all jobs if proxy is None
+        """
+        with self._lock:
+            if proxy is None:
+                jobs = self._jobs.values()
+            else:
+                jobs = [self._jobs.get(proxy)]
+            for job in jobs:
+                if job is not None:
+                    job.cancel()
 
+    def configure(self, max_processes=2, batch_size=None,
+                  flush_interval=None):
+        """
+        Changes the settings of the jobserver
+
+        They apply to the following jobs.  If max_processes shrinks,
+        processes above the limit are kept until the next restart.
+        """
+        if flush_interval is None:
+            flush_interval = self._external.flush_interval
+        with self._lock:
+            self.max_processes = max(1, max_processes)
+            self.batch_size = batch_size or self._external.batch_size
+            self.flush_interval = flush_interval
+
+    def forget(self, document=None, project=None):
+        """
+        Drops the affinity keys and plugin instances of a closed document or
+        a removed project, so they don't count as load anymore
+        """
+        names = set()
+        if document is not None:
+            names.add(id(document))
+        if project is not None:
+            names.add(project.source_directory)
+        with self._lock:
+            for key in [key for key in self._affinity if key[0] in names]:
+                self._affinity.pop(key).keys.discard(key)
+            if document is not None:
+                for process in self._processes:
+                    process.instances.pop(id(document), None)
+
+    def get_stats(self):
+        """
+        Returns a list of dicts with the health and load of each process
+        """
+        with self._lock:
+            return [process.get_stats() for process in self._processes]
 
     def stop(self):
+        self.log.debug('external processes: {stats}', stats=self.get_stats())
         self.stopped = True
-        for i in self._processes:
-            i.is_shutdown = True
-            i.shutdown()
+        self.cancel()
+        for process in self._processes:
+            process.shutdown()
 
     def restart(self):
         self.log.info(_("restart jobserver"))
         self.stop()
         self.stopped = False
-        self._processes = []
-        self._proxy_map = WeakKeyDictionary()
-        self._instances = {}
+        with self._lock:
+            self._processes = []
+            self._affinity = {}
+            self._proxy_map = WeakKeyDictionary()
+            self._jobs = WeakKeyDictionary()
 
 
 class LanguageService(Service):
@@ -629,6 +963,11 @@ class LanguageService(Service):
 
     external = None
     jobserver_factory = JobServer
+    # number of external processes the jobserver may start
+    external_processes = 2
+    # batching of external results, None uses the values of external
+    external_batch_size = None
+    external_flush_interval = None
 
     features_config = LanguageServiceFeaturesConfig
 
@@ -668,10 +1007,37 @@ class LanguageService(Service):
 
         self.boss = boss
         if self.external is not None and multiprocessing:
-            self.jobserver = self.jobserver_factory(self, self.external)
+            self.jobserver = self.jobserver_factory(
+                self, self.external, **self.get_jobserver_settings())
         else:
             self.jobserver = None
 
+    def get_jobserver_settings(self):
+        """
+        Returns the keyword arguments the jobserver is configured with
+
+        The options of the language service override the defaults of this
+        class, options set to 0 keep them.
+        """
+        settings = {
+            'max_processes': self.external_processes,
+            'batch_size': self.external_batch_size,
+            'flush_interval': self.external_flush_interval,
+        }
+        try:
+            opt = self.boss.get_service('language').opt
+            overrides = {
+                'max_processes': opt('external_processes'),
+                'batch_size': opt('external_batch_size'),
+                'flush_interval': opt('external_flush_interval') / 1000.0,
+            }
+        except (AttributeError, KeyError):
+            # no language service to ask, e.g. while testing
+            return settings
+        settings.update((name, value)
+                        for name, value in overrides.iteritems() if value)
+        return settings
+
     def stop(self):
         if self.jobserver:
             self.jobserver.stop()
@@ -158,6 +158,11 @@ class OptionsConfig(BaseConfig):
             return
         if option.callback:
             option.callback(option)
+        # the options editor reads all values once it gets activated
+        servicemanager = getattr(self.svc.boss, 'servicemanager', None)
+        if (servicemanager is not None and
+                not servicemanager.is_activated('optionsmanager')):
+            return
         optionsmanager = self.svc.boss.get_service('optionsmanager')
         if hasattr(optionsmanager, 'events'):
             optionsmanager.emit('option_changed', option=option)
@@ -12,6 +12,8 @@ import sys
 
 from pida.core.service import Service
 from pida.core import environment
+from pida.core.startup import tracer
+from pida.utils import json
 
 # log
 import logbook
@@ -53,6 +55,9 @@ class ServiceLoader(object):
             if name.startswith(del_name):
                 del sys.modules[name]
 
+    def get_names(self):
+        return sorted(self._find_all())
+
     def get_all(self):
         classes = []
         for name in self._find_all():
@@ -80,6 +85,25 @@ class ServiceLoader(object):
         except AttributeError as e:
             raise (ServiceModuleError(module.__name__), None, None)
 
+    def get_triggers(self, name):
+        """
+        Returns the activation triggers declared in the package of a
+        service or None if it has to be activated at startup
+
+        Only the package is imported, not the service module.
+        """
+        package = '.'.join([self._name, name])
+        try:
+            module = __import__(package, fromlist=['*'], level=0)
+        except ImportError as e:
+            log.exception(e)
+            return None
+        triggers = getattr(module, 'triggers', None)
+        if triggers is not None:
+            # the placeholders need the pixmaps and uidefs
+            self._register_service_env(module)
+        return triggers
+
     def get_all_service_files(self):
         for base in self._path:
             for name in self._find_of_dir(base):
@@ -106,9 +130,53 @@ class ServiceLoader(object):
         environment.add_global_base(service_path)
 
 
+class LazyService(object):
+    """
+    A service which is activated on first use.
+
+    The package of the service declares what triggers the activation in a
+    `triggers` dict, the service module is only imported once one of them
+    fires:
+
+    `events`
+        list of (service, event) tuples, the service is activated by the
+        first emission and the callbacks it subscribes get that event
+    `views`
+        names of remembered toggle actions, if one of them was active when
+        the window state got saved the view is restored
+    `doctypes`
+        internal names of doctypes, activates the service once a document
+        of one of them gets current
+
+    Using a command of the service or anything else going through
+    :meth:`ServiceManager.get_service` activates it as well, just like the
+    placeholders of its menu entries do.
+    """
+
+    def __init__(self, name, loader, triggers, is_plugin=False):
+        self.name = name
+        self.loader = loader
+        self.triggers = triggers
+        self.is_plugin = is_plugin
+        self.package = '.'.join([loader.package.__name__, name])
+        # (config, point, callback) of the trigger subscriptions
+        self.subscriptions = []
+        self.placeholders = None
+
+    def get_name(self):
+        return self.name
+
+    def __repr__(self):
+        return '<LazyService: %s>' % self.name
+
+
+def actions_cache_file():
+    return environment.settings_dir()/'lazy_actions.json'
+
+
 class ServiceManager(object):
 
-    def __init__(self, boss, update_progress=None):
+    def __init__(self, boss, update_progress=None, lazy=None):
         from pida import plugins, services, editors
         if update_progress is not None:
             self.update_progress = update_progress
@@ -118,9 +186,32 @@ class ServiceManager(object):
         self._plugins = ServiceLoader(plugins)
         self._editors = ServiceLoader(editors, '__init__.py')
         self._reg = {}
+        self._lazy = {}
+        self._starting = False
+        if lazy is None:
+            lazy = environment.is_lazy_activation()
+        self.lazy = lazy
+        self._actions_cache = None
+        # lazy services started eagerly as their menu entries are unknown
+        self._uncached = set()
 
     def get_service(self, name):
-        return self._reg[name]
+        try:
+            return self._reg[name]
+        except KeyError:
+            if name not in self._lazy:
+                raise
+        return self.activate(name)
+
+    def is_activated(self, name):
+        return name in self._reg
+
+    def get_lazy_names(self):
+        return sorted(self._lazy)
+
+    def get_lazy_plugins(self):
+        return sorted(name for name, lazy in self._lazy.iteritems()
+                      if lazy.is_plugin)
 
     def __iter__(self):
         return self._reg.itervalues()
@@ -138,19 +229,191 @@ class ServiceManager(object):
         return [s for s in self if s.__module__.startswith('pida.services')]
 
     def activate_services(self):
-        self._register_services()
-        self._create_services()
-        self._subscribe_services()
-        self._pre_start_services()
+        with tracer.span('register services', 'phase'):
+            self._register_services()
+        with tracer.span('create services', 'phase'):
+            self._create_services()
+        with tracer.span('subscribe services', 'phase'):
+            self._subscribe_services()
+        with tracer.span('pre start services', 'phase'):
+            self._pre_start_services()
+        with tracer.span('lazy triggers', 'phase'):
+            for lazy in self._lazy.values():
+                self._add_triggers(lazy)
+
+    def activate(self, name):
+        """
+        Activate the lazy service `name` and return it
 
-    def start_plugin(self, name):
-        plugin_class = self._plugins.get_one(name)
+        :raises ServiceLoadingError: if the service can't be activated
+        """
+        lazy = self._lazy.pop(name)
+        log.debug('Activating {name}', name=name)
+        self._remove_triggers(lazy)
+        try:
+            with tracer.span(name, 'activate', name):
+                svc = lazy.loader.get_one(name)(self._boss)
+                svc.started = False
+                self._register(svc)
+                try:
+                    svc.create_all()
+                    svc.subscribe_all()
+                    svc.pre_start()
+                    if self._starting or self.started:
+                        svc.start()
+                        svc.started = True
+                except:
+                    del self._reg[name]
+                    raise
+        except Exception:
+            log.exception('Could not activate {name}', name=name)
+            raise ServiceLoadingError(name)
+        self._cache_actions(svc)
+        if lazy.is_plugin:
+            self.get_service('plugins').emit('plugin_started', plugin=svc)
+        return svc
+
+    def activate_views(self, state):
+        """
+        Activate the lazy services whose views were open
+
+        :param state: mapping of service names to the active state of
+                      their remembered actions, as the window saves it
+        """
+        for name, lazy in self._lazy.items():
+            actions = state.get(name, {})
+            if any(actions.get(view) for view in lazy.triggers.get('views', ())):
+                try:
+                    self.activate(name)
+                except ServiceLoadingError:
+                    pass
+
+    def _get_triggers(self, loader, name):
+        if not self.lazy:
+            return None
+        triggers = loader.get_triggers(name)
+        if triggers is None:
+            return None
+        if name not in self._get_actions_cache():
+            # activate it once to learn about the menu entries
+            self._uncached.add(name)
+            return None
+        return triggers
+
+    def _get_actions_cache(self):
+        if self._actions_cache is None:
+            self._actions_cache = json.load(actions_cache_file(), fallback={})
+        return self._actions_cache
+
+    def _cache_actions(self, svc):
+        if not self.lazy:
+            return
+        actions = getattr(svc, 'actions', None)
+        if actions is not None:
+            description = [list(item) for item in actions.describe_actions()]
+        else:
+            description = []
+        cache = self._get_actions_cache()
+        if cache.get(svc.get_name()) == description:
+            return
+        cache[svc.get_name()] = description
+        try:
+            json.dump(cache, actions_cache_file())
+        except EnvironmentError as e:
+            log.warning("Can't save the actions cache: {err}", err=e)
+
+    def _add_triggers(self, lazy):
+        for service, event in lazy.triggers.get('events', ()):
+            self._add_trigger(lazy, service, event)
+        doctypes = lazy.triggers.get('doctypes')
+        if doctypes:
+            for event in ('document-changed', 'document-typchanged'):
+                self._add_trigger(lazy, 'buffer', event, set(doctypes))
+        actions = self._get_actions_cache().get(lazy.name)
+        if actions and self._boss is not None:
+            from pida.core.actions import PlaceholderActions
+            lazy.placeholders = PlaceholderActions(
+                self._boss, lazy.name, lazy.package, actions,
+                self._on_placeholder_activate)
+
+    def _add_trigger(self, lazy, service, event, doctypes=None):
+        source = self._reg.get(service)
+        if source is None:
+            log.warning("{name} can't be triggered by {event} of {service}",
+                        name=lazy.name, event=event, service=service)
+            return
+
+        def trigger(**kw):
+            if doctypes is not None:
+                doctype = getattr(kw.get('document'), 'doctype', None)
+                if doctype is None or doctype.internal not in doctypes:
+                    return
+            try:
+                svc = self.activate(lazy.name)
+            except ServiceLoadingError:
+                return
+            # the service subscribed too late for this emission
+            for fservice, point, data in svc.events.foreign_subscriptions:
+                if fservice == service and point == event:
+                    data[0](**kw)
+
+        source.events.subscribe(event, trigger)
+        lazy.subscriptions.append((source.events, event, trigger))
+
+    def _remove_triggers(self, lazy):
+        for config, point, callback in lazy.subscriptions:
+            try:
+                config.unsubscribe(point, callback)
+            except KeyError:
+                pass
+        lazy.subscriptions = []
+        if lazy.placeholders is not None:
+            lazy.placeholders.remove()
+            lazy.placeholders = None
+
+    def _on_placeholder_activate(self, action):
+        name = action.get_action_group().get_name()
+        try:
+            svc = self.get_service(name)
+        except ServiceLoadingError:
+            return
+        real = svc.get_action(action.get_name())
+        if real is None:
+            return
+        if hasattr(action, 'get_active'):
+            real.set_active(action.get_active())
+        else:
+            real.activate()
+
+    def start_plugin(self, name, lazy=False):
+        """
+        Start the plugin `name` and return it
+
+        :param lazy: only prepare its activation if the plugin declares
+                     triggers, returns None in that case
+        """
+        triggers = self._get_triggers(self._plugins, name) if lazy else None
+        if triggers is not None:
+            placeholder = LazyService(name, self._plugins, triggers,
+                                      is_plugin=True)
+            self._lazy[name] = placeholder
+            self._add_triggers(placeholder)
+            tracer.mark_lazy(name)
+            return None
+
+        with tracer.span(name, 'plugin'):
+            return self._start_plugin(name)
+
+    def _start_plugin(self, name):
+        with tracer.span(name, 'import', name):
+            plugin_class = self._plugins.get_one(name)
         if plugin_class is None:
             log.error('Unable to load plugin {name}', name=name)
             return
 
         # XXX: test this more roughly
-        plugin = plugin_class(self._boss)
+        with tracer.span(name, 'register', name):
+            plugin = plugin_class(self._boss)
         try:
             if hasattr(plugin, 'started'):
                 log.warning("plugin.started shouldn't be set by {plugin!r}",
@@ -165,14 +428,20 @@ class ServiceManager(object):
             self._register(plugin)
             try:
                 try:
-                    plugin.create_all()
+                    with tracer.span(name, 'create', name):
+                        plugin.create_all()
+                    if name in self._uncached:
+                        self._cache_actions(plugin)
 
                     # stop_components will handle
-                    plugin.subscribe_all()
+                    with tracer.span(name, 'subscribe', name):
+                        plugin.subscribe_all()
 
                     # XXX: what to do with unrolling those
-                    plugin.pre_start()
-                    plugin.start()
+                    with tracer.span(name, 'pre_start', name):
+                        plugin.pre_start()
+                    with tracer.span(name, 'start', name):
+                        plugin.start()
                     assert plugin.started is False # this shouldn't change
                     plugin.started = True
                     return plugin
@@ -206,10 +475,24 @@ class ServiceManager(object):
 
     def _register_services(self):
         # len of self is not yet available
-        classes = self._services.get_all()
+        classes = []
+        for name in self._services.get_names():
+            triggers = self._get_triggers(self._services, name)
+            if triggers is not None:
+                self._lazy[name] = LazyService(name, self._services, triggers)
+                tracer.mark_lazy(name)
+                continue
+            try:
+                with tracer.span(name, 'import', name):
+                    classes.append(self._services.get_one(name))
+            except ImportError as e:
+                log.exception(e)
+        classes.sort(key=Service.sort_key)
         pp = 20.0 / len(classes)
         for i, service in enumerate(classes):
-            service_instance = service(self._boss)
+            with tracer.span(service.get_name(), 'register',
+                             service.get_name()):
+                service_instance = service(self._boss)
             # XXX: check for started
             service.started = False
             self._register(service_instance)
@@ -222,28 +505,38 @@ class ServiceManager(object):
         pp = 10.0 / len(self)
         for i, svc in enumerate(self.get_services()):
             svc.log.debug('Creating Service')
-            svc.create_all()
+            with tracer.span(svc.get_name(), 'create', svc.get_name()):
+                svc.create_all()
+            if svc.get_name() in self._uncached:
+                # remember the menu entries for the next start
+                self._cache_actions(svc)
             self.update_progress(20 + (i + 1) * pp, _("Creating Components"))
 
     def _subscribe_services(self):
         pp = 10.0 / len(self)
         for i, svc in enumerate(self.get_services()):
             svc.log.debug('Subscribing Service')
-            svc.subscribe_all()
+            with tracer.span(svc.get_name(), 'subscribe', svc.get_name()):
+                svc.subscribe_all()
             self.update_progress(30 + (i + 1) * pp, _("Subscribing Components"))
 
     def _pre_start_services(self):
         pp = 20.0 / len(self)
         for i, svc in enumerate(self.get_services()):
             svc.log.debug('Pre Starting Service')
-            svc.pre_start()
+            with tracer.span(svc.get_name(), 'pre_start', svc.get_name()):
+                svc.pre_start()
             self.update_progress(40 + (i + 1) * pp, _("Prepare Components"))
 
     def start_services(self):
-        pp = 40.0 / len(self)
-        for i, svc in enumerate(self.get_services()):
+        # services activated meanwhile are started right away
+        self._starting = True
+        services = self.get_services()
+        pp = 40.0 / len(services)
+        for i, svc in enumerate(services):
             svc.log.debug('Starting Service')
-            svc.start()
+            with tracer.span(svc.get_name(), 'start', svc.get_name()):
+                svc.start()
             # XXX: check if its acceptable here
             svc.started = True
             self.update_progress(60 + (i + 1) * pp, _("Start Components"))
@@ -257,20 +550,27 @@ class ServiceManager(object):
 
     def activate_editor(self, name):
         self.load_editor(name)
-        self.editor.create_all()
-        self.editor.subscribe_all()
-        self.editor.pre_start()
+        with tracer.span(name, 'create', name):
+            self.editor.create_all()
+        with tracer.span(name, 'subscribe', name):
+            self.editor.subscribe_all()
+        with tracer.span(name, 'pre_start', name):
+            self.editor.pre_start()
 
     def start_editor(self):
         self._register(self.editor)
-        self.editor.start()
+        with tracer.span(self.editor.get_name(), 'start',
+                         self.editor.get_name()):
+            self.editor.start()
         self.editor.started = True
         self.update_progress(98, _("Start Editor"))
 
     def load_editor(self, name):
         assert not hasattr(self, 'editor'), "can't load a second editor"
-        editor = self._editors.get_one(name)
-        self.editor = editor(self._boss)
+        with tracer.span(name, 'import', name):
+            editor = self._editors.get_one(name)
+        with tracer.span(name, 'register', name):
+            self.editor = editor(self._boss)
         self.editor.started = False
         self._reg[name] = self.editor
         return self.editor
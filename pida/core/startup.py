@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+    Startup tracer
+
+    Records how long the phases of the startup take and what each service
+    spends in them, see the --trace-startup command line option.
+
+    :copyright: 2005-2010 by The PIDA Project
+    :license: GPL 2 or later (see README/COPYING/LICENSE)
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+from pida.utils import json
+
+# categories of the spans per service, in the order of the startup
+SERVICE_STEPS = ('import', 'register', 'create', 'subscribe', 'pre_start',
+                 'start', 'activate')
+
+
+class Span(object):
+    """A timed section of the startup"""
+
+    __slots__ = ('name', 'category', 'service', 'start', 'duration',
+                 'thread')
+
+    def __init__(self, name, category, service, start, duration, thread):
+        self.name = name
+        self.category = category
+        self.service = service
+        self.start = start
+        self.duration = duration
+        self.thread = thread
+
+    def __repr__(self):
+        return '<Span %s %s %.3fs>' % (self.category, self.name,
+                                       self.duration)
+
+
+@contextmanager
+def _nothing():
+    yield
+
+
+class StartupTracer(object):
+    """
+    Collects the spans of the startup.
+
+    Until :meth:`enable` is called :meth:`span` does nothing, so the
+    tracing points can stay in place.  Import times are only exact for the
+    first import of a module, everything a service module pulls in is
+    accounted to the service which imports it first.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.enabled = False
+        self.spans = []
+        # services and plugins left for activation on first use
+        self.lazy = []
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+        self.started = self.clock()
+
+    def span(self, name, category, service=None):
+        """
+        Returns a context manager timing its block
+
+        :param service: name of the service the time is spent for
+        """
+        if not self.enabled:
+            return _nothing()
+        return self._span(name, category, service)
+
+    @contextmanager
+    def _span(self, name, category, service):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            span = Span(name, category, service, start,
+                        self.clock() - start, threading.current_thread().name)
+            with self._lock:
+                self.spans.append(span)
+
+    def mark_lazy(self, service):
+        """Record that service is not started but waits for its first use"""
+        if self.enabled:
+            with self._lock:
+                self.lazy.append(service)
+
+    def finish(self):
+        """Mark the end of the startup, spans are still recorded"""
+        if self.enabled and self.finished is None:
+            self.finished = self.clock()
+
+    @property
+    def total(self):
+        end = self.finished if self.finished is not None else self.clock()
+        return end - self.started
+
+    def get_spans(self, category):
+        """Returns a list of (name, duration) of the spans of category"""
+        return [(span.name, span.duration) for span in self.spans
+                if span.category == category]
+
+    def get_services(self):
+        """
+        Returns a list of (service, {step: duration}) sorted by the total
+        time, slowest first
+        """
+        services = {}
+        for span in self.spans:
+            if span.service is None:
+                continue
+            steps = services.setdefault(span.service, {})
+            steps[span.category] = steps.get(span.category, 0) + span.duration
+        return sorted(services.items(),
+                      key=lambda item: sum(item[1].values()), reverse=True)
+
+    def report(self):
+        """Returns the report as text"""
+        lines = ['Startup took %.3fs' % self.total]
+        for category, title in (('phase', 'Phases:'), ('plugin', 'Plugins:')):
+            spans = self.get_spans(category)
+            if spans:
+                lines.extend(['', title])
+                lines.extend('  %-30s %8.3fs' % span for span in spans)
+        lines.extend(['', 'Services (seconds):'])
+        services = self.get_services()
+        steps = [step for step in SERVICE_STEPS
+                 if any(step in times for name, times in services)]
+        lines.append('  %-20s' % 'service' +
+                     ''.join('%10s' % step for step in steps) +
+                     '%10s' % 'total')
+        for service, times in services:
+            lines.append('  %-20s' % service +
+                         ''.join('%10.3f' % times[step] if step in times
+                                 else '%10s' % '-' for step in steps) +
+                         '%10.3f' % sum(times.values()))
+        activated = set(name for name, times in services
+                        if 'activate' in times)
+        eager = [name for name, times in services if name not in activated]
+        lines.extend(['', 'Started eagerly: %d, lazily: %d (%d activated)' % (
+            len(eager), len(self.lazy), len(activated))])
+        if self.lazy:
+            lines.append('  lazy: ' + ', '.join(
+                name + ('*' if name in activated else '')
+                for name in sorted(self.lazy)))
+        return '\n'.join(lines)
+
+    def chrome_trace(self):
+        """
+        Returns the spans in the trace event format of chrome://tracing
+        """
+        pid = os.getpid()
+        events = []
+        threads = {}
+        for span in self.spans:
+            if span.thread not in threads:
+                threads[span.thread] = len(threads)
+                events.append({
+                    'name': 'thread_name',
+                    'ph': 'M',
+                    'pid': pid,
+                    'tid': threads[span.thread],
+                    'args': {'name': span.thread},
+                })
+            args = {}
+            if span.service is not None:
+                args['service'] = span.service
+            events.append({
+                'name': span.name,
+                'cat': span.category,
+                'ph': 'X',
+                'ts': int((span.start - self.started) * 1e6),
+                'dur': int(span.duration * 1e6),
+                'pid': pid,
+                'tid': threads[span.thread],
+                'args': args,
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save_chrome_trace(self, path):
+        json.dump(self.chrome_trace(), path, indent=None)
+
+
+tracer = StartupTracer()
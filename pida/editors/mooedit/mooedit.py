@@ -1309,6 +1309,15 @@ class Mooedit(EditorService):
         self._current = self._embed.get_nth_page(page_num)
         self.boss.cmd('buffer', 'open_file', document=self._current.document)
 
+    def check_reload(self, document):
+        view = self._documents.get(document.unique_id)
+        if view is None:
+            return False
+        if view.editor.get_status() & moo.edit.EDIT_MODIFIED:
+            return False
+        self.reload_document(document)
+        return True
+
     def reload_document(self, document):
         """
         Reloads a document from disc
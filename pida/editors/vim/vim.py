@@ -189,6 +189,14 @@ class Vim(EditorService):
                                       **_ignore)
         return True
 
+    def check_reload(self, document):
+        if document.editor_buffer_id is None:
+            return False
+        # vim reloads the buffer and asks first if it has unsaved changes
+        self._com.command('checktime %d' % document.editor_buffer_id,
+                          **_ignore)
+        return True
+
     def close_all():
         """Close all the documents"""
 
@@ -23,6 +23,8 @@ from pida.core.document import Document, DocumentException
 
 from pygtkhelpers.gthreads import gcall
 
+from pida.services.filewatcher.watcher import CHANGE
+
 # locale
 from pida.core.locale import Locale
 locale = Locale('buffer')
@@ -196,13 +198,17 @@ class BufferEventsConfig(EventsConfig):
     def create(self):
         self.publish('document-saved', 'document-changed', 
             'document-typchanged', 'document-closed', 'document-opened', 
-            'document-goto')
+            'document-goto', 'document-changed-on-disk')
         self.subscribe('document-saved', self.on_document_change)
         self.subscribe('document-changed', self.on_document_change)
         self.subscribe('document-typchanged', self.on_document_change)
 
     def subscribe_all_foreign(self):
         self.subscribe_foreign('editor', 'started', self.on_editor_started)
+        self.subscribe_foreign('filewatcher', 'files_changed',
+                               self.svc.on_files_changed)
+        self.subscribe_foreign('project', 'loaded', self.on_projects_changed)
+        self.subscribe_foreign('project', 'removed', self.on_projects_changed)
 
     def on_editor_started(self, *k, **kw):
 
@@ -216,6 +222,11 @@ class BufferEventsConfig(EventsConfig):
         except Exception as e:
             self.svc.log.exception(e)
 
+    def on_projects_changed(self, project):
+        # documents may belong to another project now
+        for document in self.svc.get_documents().itervalues():
+            document.invalidate()
+
     def on_document_change(self, *args, **kwargs):
         # we have to update the document buffer when one doc changes as
         # the list should be sorted all the time
@@ -338,9 +349,16 @@ class Buffer(Service):
     dbus_config = BufferDbusConfig
     options_config = BufferOptionsConfig
 
+    # changes of a file this many seconds after we saved it are our own
+    SAVE_GRACE_TIME = 2
+
     def pre_start(self):
         self._documents = {}
+        # indexes of the documents by filename and editor buffer id
+        self._filenames = {}
+        self._editor_ids = {}
         self._current = None
+        self._saved_times = {}
         #XXX hideous hack for vim
         self._last_added_document = None
         self._view = BufferListView(self)
@@ -393,14 +411,26 @@ class Buffer(Service):
 
 
     def open_files(self, files):
+        """
+        Open many files at once, the buffer list is only updated once.
+        Files which are already open are skipped.
+        """
         if not files:
             # empty list
             return
         docs = []
         for file_name in files:
+            file_name = os.path.realpath(file_name)
+            if self._get_document_for_filename(file_name) is not None:
+                continue
             document = Document(self.boss, file_name)
-            self._add_document(document)
+            self._index_document(document)
             docs.append(document)
+        if not docs:
+            return
+        self._last_added_document = docs[-1]
+        self._view.add_documents(docs)
+        self._refresh_buffer_action_sensitivities()
         self.boss.editor.cmd('open_list', documents=docs)
         for document in docs:
             self.emit('document-opened', document=document)
@@ -455,25 +485,46 @@ class Buffer(Service):
                 break
 
     def _get_document_for_filename(self, file_name):
-        for uid, doc in self._documents.iteritems():
-            if doc.filename == file_name:
-                return doc
+        return self._filenames.get(file_name)
 
     def _get_document_for_editor_id(self, bufid):
-        for uid, doc in self._documents.iteritems():
-            if doc.editor_buffer_id == bufid:
-                return doc
+        return self._editor_ids.get(bufid)
 
+    def _index_document(self, document):
+        self._documents[id(document)] = document
+        for name, index in (('filename', self._filenames),
+                            ('editor_buffer_id', self._editor_ids)):
+            key = getattr(document, name)
+            if key is not None:
+                index.setdefault(key, document)
+        document.key_changed = self._on_document_key_changed
+
+    def _on_document_key_changed(self, document, name, old):
+        """The editor renamed a document or tagged it with its buffer id"""
+        if name == 'filename':
+            index = self._filenames
+        else:
+            index = self._editor_ids
+        if old is not None and index.get(old) is document:
+            del index[old]
+        key = getattr(document, name)
+        if key is not None:
+            index[key] = document
 
     def _add_document(self, document):
         self._last_added_document = document
-        self._documents[id(document)] = document
+        self._index_document(document)
         self._view.add_document(document)
         self._refresh_buffer_action_sensitivities()
 
     def _remove_document(self, document):
-        "_remove_doc", document
         del self._documents[id(document)]
+        document.key_changed = None
+        for name, index in (('filename', self._filenames),
+                            ('editor_buffer_id', self._editor_ids)):
+            key = getattr(document, name)
+            if index.get(key) is document:
+                del index[key]
         self._view.remove_document(document)
         self._refresh_buffer_action_sensitivities()
 
@@ -503,8 +554,46 @@ class Buffer(Service):
         self.get_action('close').set_sensitive(document is not None)
 
     def file_saved(self):
+        if self._current is not None and self._current.filename:
+            now = time.time()
+            self._prune_saved_times(now)
+            self._saved_times[self._current.filename] = now
+            self._current.invalidate()
         self.emit('document-saved', document=self._current)
 
+    def _prune_saved_times(self, now):
+        for filename, saved in self._saved_times.items():
+            if now - saved >= self.SAVE_GRACE_TIME:
+                del self._saved_times[filename]
+
+    def on_files_changed(self, changes):
+        """
+        Let the editor reload open documents changed by other programs,
+        tell about those it doesn't reload and deleted ones
+        """
+        now = time.time()
+        self._prune_saved_times(now)
+        for change in changes:
+            if change.is_dir:
+                continue
+            document = self._get_document_for_filename(change.path)
+            if document is None:
+                continue
+            document.invalidate()
+            if change.path in self._saved_times:
+                continue
+            self._view.buffers_ol.update(document)
+            self.emit('document-changed-on-disk', document=document,
+                      kind=change.kind)
+            if change.kind == CHANGE.DELETED:
+                title = _('File deleted on disk')
+            elif self.boss.editor.cmd('check_reload', document=document):
+                continue
+            else:
+                title = _('File changed on disk')
+            self.boss.cmd('notify', 'notify', title=title,
+                          data=document.filename)
+
     def get_current(self):
         return self._current
 
@@ -1,5 +1,7 @@
 from pida.services.buffer.buffer import Buffer, BufferOptionsConfig
+from pida.core.document import Document
 from pida.utils.testing.mock import Mock
+from pida.services.filewatcher.watcher import FileChange, CHANGE
 
 def test_recover_loading_error():
     boss = Mock()
@@ -20,3 +22,73 @@ def test_open_files_storage():
     
     #XXX too stupid
     assert options.get_option('open_files').workspace
+
+def make_buffer():
+    boss = Mock()
+    svc = Buffer(boss)
+    svc._documents = {}
+    svc._filenames = {}
+    svc._editor_ids = {}
+    svc._view = Mock()
+    svc._refresh_buffer_action_sensitivities = Mock()
+    svc.emit = Mock()
+    return svc
+
+def test_document_indexes():
+    svc = make_buffer()
+    doc = Document(None, '/tmp/a.py')
+    svc._add_document(doc)
+    assert svc._get_document_for_filename('/tmp/a.py') is doc
+    assert svc._get_document_for_editor_id(1) is None
+    # the editor tags it later
+    doc.editor_buffer_id = 1
+    assert svc._get_document_for_editor_id(1) is doc
+    # and renames it on save as
+    doc.filename = '/tmp/b.py'
+    assert svc._get_document_for_filename('/tmp/a.py') is None
+    assert svc._get_document_for_filename('/tmp/b.py') is doc
+    svc._remove_document(doc)
+    assert svc._get_document_for_filename('/tmp/b.py') is None
+    assert svc._get_document_for_editor_id(1) is None
+    # removed documents don't touch the indexes anymore
+    doc.filename = '/tmp/c.py'
+    assert svc._filenames == {}
+
+def test_open_files():
+    svc = make_buffer()
+    svc.open_files(['/tmp/a.py', '/tmp/b.py'])
+    assert len(svc._documents) == 2
+    assert svc._view.add_documents.call_count == 1
+    assert svc.boss.editor.cmd.call_count == 1
+    # already open files are skipped
+    svc.open_files(['/tmp/b.py', '/tmp/c.py', '/tmp/c.py'])
+    assert len(svc._documents) == 3
+    docs = svc.boss.editor.cmd.call_args[1]['documents']
+    assert [doc.filename for doc in docs] == ['/tmp/c.py']
+    assert svc.emit.call_count == 3
+
+def test_files_changed():
+    svc = make_buffer()
+    svc._saved_times = {}
+    doc = Document(None, '/tmp/a.py')
+    other = Document(None, '/tmp/b.py')
+    svc._add_document(doc)
+    svc._add_document(other)
+    svc._current = doc
+    svc.file_saved()
+    # our own save is skipped, the editor reloads the other one
+    svc.boss.editor.cmd.return_value = True
+    svc.on_files_changed([FileChange('/tmp/a.py', CHANGE.CHANGED),
+                          FileChange('/tmp/b.py', CHANGE.CHANGED)])
+    assert svc.boss.editor.cmd.call_count == 1
+    assert svc.boss.editor.cmd.call_args == (('check_reload',),
+                                             {'document': other})
+    assert not svc.boss.cmd.called
+    # documents the editor doesn't reload are notified about
+    svc.boss.editor.cmd.return_value = False
+    svc.on_files_changed([FileChange('/tmp/b.py', CHANGE.CHANGED)])
+    assert svc.boss.cmd.call_count == 1
+    # saves are forgotten after the grace time
+    svc._saved_times['/tmp/a.py'] -= svc.SAVE_GRACE_TIME
+    svc.on_files_changed([])
+    assert svc._saved_times == {}
@@ -122,6 +122,18 @@ class BufferListView(PidaView):
     def add_document(self, document):
         self.buffers_ol.append(document)
 
+    def add_documents(self, documents):
+        # detach the model, so the view is updated once and not per row
+        selected = self.buffers_ol.selected_item
+        model = self.buffers_ol.get_model()
+        self.buffers_ol.set_model(None)
+        try:
+            self.buffers_ol.extend(documents)
+        finally:
+            self.buffers_ol.set_model(model)
+        if selected is not None:
+            self.buffers_ol.selected_item = selected
+
     def remove_document(self, document):
         self.buffers_ol.remove(document)
 
@@ -40,6 +40,7 @@ from pygtkhelpers.ui.objectlist import Column, ObjectList
 from pygtkhelpers.ui import dialogs
 
 import filehiddencheck
+from pida.services.filewatcher.watcher import CHANGE
 
 # locale
 from pida.core.locale import Locale
@@ -134,7 +135,7 @@ class FileEntry(object):
 
     @property
     def icon_stock_id(self):
-        if path.isdir(self.path):
+        if self.is_dir:
             return 'stock_folder'
         else:
             #TODO: get a real mimetype icon
@@ -175,6 +176,9 @@ class FilemanagerView(PidaView):
     icon_name = 'file-manager'
     key = 'filemanager.list'
 
+    # entries added to the list at once while populating it
+    POPULATE_BATCH = 500
+
     def create_ui(self):
         self._vbox = gtk.VBox()
         self._vbox.show()
@@ -187,6 +191,7 @@ class FilemanagerView(PidaView):
         self.add_main_widget(self._vbox)
 
     def create_file_list(self):
+        self._populate_task = None
         self.file_list = ObjectList()
         self.file_list.set_headers_visible(False)
 
@@ -249,20 +254,27 @@ class FilemanagerView(PidaView):
 
         self.show_or_hide(entry, select=select)
 
-    def show_or_hide(self, entry, select=False):
-        def check(checker):
-            if (checker.identifier in self._file_hidden_check_actions) and \
-               (self._file_hidden_check_actions[checker.identifier].get_active()):
-                return checker(name=entry.name, path=entry.parent_path,
-                    state=entry.state, )
-            else:
-                return True
+    def get_hidden_checks(self):
+        """
+        Returns the active file hidden checks, an empty list if hidden
+        files are shown
+        """
+        if self.svc.opt('show_hidden'):
+            return []
+        actions = self._file_hidden_check_actions
+        return [checker for checker in self.svc.features['file_hidden_check']
+                if checker.identifier in actions and
+                   actions[checker.identifier].get_active()]
+
+    def is_visible(self, entry, checks):
+        if entry.parent_link:
+            return True
+        return all(checker(name=entry.name, path=entry.parent_path,
+                           state=entry.state)
+                   for checker in checks)
 
-        if self.svc.opt('show_hidden') or entry.parent_link:
-            show = True
-        else:
-            show = all(check(x)
-                        for x in self.svc.features['file_hidden_check'])
+    def show_or_hide(self, entry, select=False):
+        show = self.is_visible(entry, self.get_hidden_checks())
 
         entry.visible = show
         if entry not in self.file_list:
@@ -289,33 +301,74 @@ class FilemanagerView(PidaView):
                                         'normal', parent_link=True)
 
         def work(basepath):
-            dir_content = listdir(basepath)
-            # add all files from vcs and remove the corresponding items 
-            # from dir_content
-            for item in self.svc.boss.cmd('versioncontrol', 'list_file_states',
-              path=self.path):
-                if (item[1] == self.path):
-                    try:
-                        dir_content.remove(item[0])
-                    except:
-                        pass
-                    yield item
-            # handle remaining files
-            for filename in dir_content:
-                if (path.isdir(path.join(basepath, filename))):
-                    state = 'normal'
-                else:
-                    state = 'unknown'
-                yield filename, basepath, state
-
-        # wrap add_or_update_file to set select accordingly
-        def _add_or_update_file(name, basepath, state):
-            self.add_or_update_file(name, basepath, state, select=(name==select))
-
-        GeneratorTask(work, _add_or_update_file).start(self.path)
+            # merge the vcs states into the listing by name
+            states = {}
+            for name, dirname, state in self.svc.boss.cmd(
+                    'versioncontrol', 'list_file_states', path=basepath):
+                if dirname == basepath:
+                    states[name] = state
+            try:
+                names = set(listdir(basepath))
+            except OSError:
+                names = set()
+            # vcs knows about removed and missing files too
+            names.update(states)
+            batch = []
+            for name in names:
+                entry = FileEntry(name, basepath, self)
+                state = states.get(name)
+                if state is None:
+                    state = 'normal' if entry.is_dir else 'unknown'
+                entry.state = state
+                batch.append(entry)
+                if len(batch) >= self.POPULATE_BATCH:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+        def add_entries(entries):
+            self.add_entries(entries, select=select)
+
+        if self._populate_task is not None:
+            self._populate_task.stop()
+        self._populate_task = GeneratorTask(work, add_entries)
+        self._populate_task.start(self.path)
 
         self.create_ancest_tree()
 
+    def add_entries(self, entries, select=None):
+        """
+        Add a batch of entries of the current directory at once.
+
+        The model is detached from the view while the entries are added, so
+        the view is updated once per batch instead of once per entry.  The
+        file hidden checks run here, they are not safe to call from the
+        threads listing the directories.
+        """
+        entries = [entry for entry in entries
+                   if entry.parent_path == self.path and
+                      entry.name not in self.entries]
+        if not entries:
+            return
+        checks = self.get_hidden_checks()
+        for entry in entries:
+            entry.visible = self.is_visible(entry, checks)
+            self.entries[entry.name] = entry
+        file_list = self.file_list
+        model = file_list.get_model()
+        position = file_list.props.vadjustment.get_value()
+        file_list.set_model(None)
+        try:
+            file_list.extend(entries)
+        finally:
+            file_list.set_model(model)
+            file_list.props.vadjustment.set_value(position)
+        if select is not None:
+            entry = self.entries.get(select)
+            if entry in entries and entry.visible:
+                file_list.selected_item = entry
+
     def update_single_file(self, name, basepath, select=False):
         if basepath != self.path:
             return
@@ -324,9 +377,29 @@ class FilemanagerView(PidaView):
 
     def update_removed_file(self, filename):
         entry = self.entries.pop(filename, None)
-        if entry is not None and entry.visible:
+        if entry is not None and entry in self.file_list:
             self.file_list.remove(entry)
 
+    def apply_changes(self, changes):
+        """Update the list for the changes the filewatcher reported"""
+        added = []
+        for change in changes:
+            if change.path == self.path and change.is_dir:
+                # the watcher lost track, list everything again
+                self.update_to_path()
+                return
+            if change.dirname != self.path:
+                continue
+            name = change.basename
+            if change.kind == CHANGE.DELETED:
+                self.update_removed_file(name)
+            elif name not in self.entries:
+                entry = FileEntry(name, self.path, self)
+                entry.state = 'normal' if entry.is_dir else 'unknown'
+                added.append(entry)
+        if added:
+            self.add_entries(added)
+
     def create_dir(self, name=None):
         if not name:
             #XXX: inputdialog or filechooser
@@ -530,6 +603,8 @@ class FilemanagerEvents(EventsConfig):
     def subscribe_all_foreign(self):
         self.subscribe_foreign('project', 'project_switched',
                                      self.svc.on_project_switched)
+        self.subscribe_foreign('filewatcher', 'files_changed',
+                                     self.svc.on_files_changed)
         self.subscribe_foreign('plugins', 'plugin_started',
             self.on_plugin_started)
         self.subscribe_foreign('plugins', 'plugin_stopped',
@@ -1020,6 +1095,10 @@ class Filemanager(Service):
         if self.file_view:
             self.file_view.refresh_file_hidden_check()
 
+    def on_files_changed(self, changes):
+        if self.file_view:
+            self.file_view.apply_changes(changes)
+
 # Required Service attribute for service loading
 Service = Filemanager
 
@@ -42,3 +42,20 @@ def test_delete_file(view, tmpdir, monkeypatch):
 
 
 
+def test_batched_listing(view, tmpdir, monkeypatch):
+    browse = tmpdir.join('browse')
+    for i in range(25):
+        browse.ensure('file%s.txt' % i)
+    monkeypatch.setattr(view, 'POPULATE_BATCH', 10)
+    view.svc.boss.cmd.return_value = [
+        ('test.py', str(browse), 'modified'),
+        ('gone.py', str(browse), 'removed'),
+    ]
+    view.update_to_path()
+    refresh_gui()
+    states = dict((entry.name, entry.state) for entry in view.file_list
+                  if not entry.parent_link)
+    assert len(states) == 27
+    assert states['test.py'] == 'modified'
+    assert states['gone.py'] == 'removed'
+    assert states['file0.txt'] == 'unknown'
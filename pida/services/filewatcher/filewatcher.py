@@ -4,31 +4,33 @@
     :license: GPL 2 or later (see README/COPYING/LICENSE)
 """
 
-import gobject
 import os
 
-from os.path import exists, isdir, isfile
-
 # PIDA Imports
 from pida.core.service import Service
-from pida.core.features import FeaturesConfig
-from pida.core.commands import CommandsConfig
 from pida.core.events import EventsConfig
-from pida.core.actions import ActionsConfig
 from pida.core.options import OptionsConfig
 
+from pygtkhelpers.gthreads import gcall
+
+from .watcher import Watcher
+
 # locale
 from pida.core.locale import Locale
 locale = Locale('filewatcher')
 _ = locale.gettext
 
-import gio
 
 class FilewatcherEvents(EventsConfig):
 
+    def create(self):
+        self.publish('files_changed')
+
     def subscribe_all_foreign(self):
         self.subscribe_foreign('filemanager', 'browsed_path_changed',
                                self.svc.on_browsed_path_changed)
+        self.subscribe_foreign('project', 'project_switched',
+                               self.svc.on_project_switched)
 
 class FileWatcherOptions(OptionsConfig):
 
@@ -42,93 +44,106 @@ class FileWatcherOptions(OptionsConfig):
             self.on_enabled_changed,
             safe=False
         )
+        self.create_option(
+            'poll_interval',
+            _('Polling interval'),
+            int,
+            5,
+            _('Seconds between two scans if the directories have to be '
+              'polled because inotify is not available'),
+        )
 
     def on_enabled_changed(self, option):
         if option.value:
-            self.svc.start_giofilemon()
+            self.svc.start_watching()
         else:
-            self.svc.stop_giofilemon()
+            self.svc.stop_watching()
 
 # Service class
 class FileWatcher(Service):
-    """the pyinotify File watcher service"""
+    """
+    Watches the current project recursively and the browsed directory,
+    changes are published as lists of FileChange with the files_changed
+    event
+    """
 
     events_config = FilewatcherEvents
     options_config = FileWatcherOptions
 
-    def callcmd(self, cmd, name):
-
-        self.boss.cmd('filemanager', command,
-                filename=os.path.basename(name),
-                dirname=self.dir)
-
-    def add_path(self, path):
-        if path is None or not exists(path):
-            return
-        f = gio.File(path)
-        if isdir(path):
-            monitor=f.monitor_directory( gio.FILE_MONITOR_NONE)
-        elif isfile(path):
-            monitor=f.monitor_file(gio.FILE_MONITOR_NONE)
-        else:
-            return #XXX: unknown type?
-        monitor.connect("changed", self.on_changed)
-        self.monitors[path] = monitor
-
-
-    def on_changed(self, mon, file, otherfile, event): 
-        #print file, otherfile, event
-
-        # ['FILE_MONITOR_EVENT_ATTRIBUTE_CHANGED', 'FILE_MONITOR_EVENT_CHANGED', 'FILE_MONITOR_EVENT_CHANGES_DONE_HINT', 'FILE_MONITOR_EVENT_CREATED', 'FILE_MONITOR_EVENT_DELETED', 'FILE_MONITOR_EVENT_PRE_UNMOUNT', 'FILE_MONITOR_EVENT_UNMOUNTED', 'FILE_MONITOR_NONE', 'FILE_MONITOR_WATCH_MOUNTS']
-        #XXX: store events, act on hints
-        if event in (gio.FILE_MONITOR_EVENT_DELETED,):
-            self.callcmd('update_removed_file', file.get_path())
-        elif event in (gio.FILE_MONITOR_EVENT_CHANGED,
-                       gio.FILE_MONITOR_EVENT_CREATED,
-                       gio.FILE_MONITOR_EVENT_ATTRIBUTE_CHANGED):
-            self.callcmd('update_file', file.get_path())
-
-        
     def pre_start(self):
-        self.monitors = {}
+        self.watchers = {}
         self.dir = None
+        self.project_root = None
         self.started = False
 
     def start(self):
         if self.opt('enable_filemon'):
-            self.start_giofilemon()
-
-    def start_giofilemon(self):
-            self.started = True
-            #gtk.main() #start
-            #gobject.timeout_add(1000, self._period_check)
-    
-    def stop_giofilemon(self):
+            self.start_watching()
+
+    def start_watching(self):
+        self.started = True
+        self._update_watchers()
+
+    def stop_watching(self):
         self.started = False
-        self.monitors.clear()
-        
-    def stop(self):
-        self.stop_giofilemon()
+        self._update_watchers()
 
+    def stop(self):
+        self.stop_watching()
+
+    def _wanted(self):
+        """Returns a dict of the watched paths to if they are recursive"""
+        wanted = {}
+        if not self.started:
+            return wanted
+        if self.project_root is not None:
+            wanted[self.project_root] = True
+        if self.dir is not None and not self.is_watched(self.dir):
+            wanted[self.dir] = False
+        return wanted
+
+    def is_watched(self, path):
+        """If path is part of the watched project"""
+        root = self.project_root
+        return root is not None and (path == root or
+                                     path.startswith(root + os.sep))
+
+    def _update_watchers(self):
+        wanted = self._wanted()
+        for path, watcher in self.watchers.items():
+            if wanted.get(path) != watcher.recursive:
+                watcher.stop()
+                del self.watchers[path]
+        for path, recursive in wanted.iteritems():
+            if path in self.watchers or not os.path.isdir(path):
+                continue
+            # the watcher sets up its watches in its own thread
+            watcher = Watcher(path, self._on_changes, recursive=recursive,
+                              poll_interval=self.opt('poll_interval'))
+            watcher.start()
+            self.watchers[path] = watcher
+
+    def _on_changes(self, changes):
+        # called in the watcher threads
+        gcall(self.emit, 'files_changed', changes=changes)
 
     def on_browsed_path_changed(self, path):
         self.set_directory(path)
-    
-    def stop_watch(self, path):
-        del self.monitors[path]
 
+    def on_project_switched(self, project):
+        if project is None:
+            self.project_root = None
+        else:
+            self.project_root = os.path.normpath(project.source_directory)
+        self._update_watchers()
 
     def set_directory(self, dir):
-        # stop watching old directory
-        if self.dir is not None and self.dir != dir:
-            self.stop_watch(self.dir)
-            self.add_path(dir)
-        # setting new directory
-            self.dir = dir
-
-
-
-
+        if dir is not None:
+            dir = os.path.normpath(dir)
+        if dir == self.dir:
+            return
+        self.dir = dir
+        self._update_watchers()
 
 
 # Required Service attribute for service loading
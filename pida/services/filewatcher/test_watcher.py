@@ -0,0 +1,115 @@
+import time
+
+import py
+
+from .watcher import (Watcher, ChangeCollector, FileChange, InotifyBackend,
+                      PollingBackend, WatchLimitError, CHANGE)
+
+
+def start_watcher(tmpdir, **kw):
+    changes = []
+    watcher = Watcher(str(tmpdir), changes.extend, debounce=0.1,
+                      poll_interval=0.2, **kw)
+    watcher.start()
+    assert watcher.ready.wait(5)
+    return watcher, changes
+
+
+def wait_for(changes, tmpdir, expected, timeout=3):
+    """Wait until the relative (path, kind) pairs in expected were seen"""
+    root = len(str(tmpdir)) + 1
+    end = time.time() + timeout
+    while time.time() < end:
+        seen = set((change.path[root:], change.kind) for change in changes)
+        if expected <= seen:
+            break
+        time.sleep(0.05)
+    return seen
+
+
+def check_watcher(tmpdir, **kw):
+    tmpdir.ensure('a/b/old.txt')
+    watcher, changes = start_watcher(tmpdir, **kw)
+    try:
+        tmpdir.ensure('a/b/new.txt')
+        tmpdir.ensure('x/y/z.txt')
+        tmpdir.join('a/b/old.txt').remove()
+        tmpdir.ensure('.hg/store/data')
+        expected = set([
+            ('a/b/new.txt', CHANGE.CREATED),
+            ('x/y/z.txt', CHANGE.CREATED),
+            ('a/b/old.txt', CHANGE.DELETED),
+            ('.hg', CHANGE.CREATED),
+        ])
+        seen = wait_for(changes, tmpdir, expected)
+        assert expected <= seen
+        # vcs metadata isn't watched
+        assert not [path for path, kind in seen if path.startswith('.hg/')]
+
+        del changes[:]
+        tmpdir.join('x').move(tmpdir.join('moved'))
+        tmpdir.ensure('moved/y/after.txt')
+        expected = set([
+            ('x', CHANGE.DELETED),
+            ('moved/y/after.txt', CHANGE.CREATED),
+        ])
+        assert expected <= wait_for(changes, tmpdir, expected)
+    finally:
+        watcher.stop()
+
+
+def test_inotify(tmpdir):
+    if not InotifyBackend.available():
+        py.test.skip('inotify is not available')
+    check_watcher(tmpdir)
+
+
+def test_polling(tmpdir):
+    check_watcher(tmpdir, use_inotify=False)
+
+
+def test_collector():
+    collector = ChangeCollector(debounce=1, max_delay=5)
+    collector.add('/a', CHANGE.CREATED, now=0)
+    collector.add('/a', CHANGE.CHANGED, now=0.5)
+    collector.add('/b', CHANGE.CREATED, now=0.5)
+    collector.add('/b', CHANGE.DELETED, now=0.9)
+    collector.add('/c', CHANGE.DELETED, now=0.9)
+    collector.add('/c', CHANGE.CREATED, now=0.9)
+    assert not collector.is_due(now=1.5)
+    assert collector.is_due(now=2)
+    assert collector.pop() == [
+        FileChange('/a', CHANGE.CREATED),
+        FileChange('/c', CHANGE.CHANGED),
+    ]
+    assert not collector.is_due(now=10)
+
+
+def test_collector_max_delay():
+    collector = ChangeCollector(debounce=1, max_delay=2)
+    for i in range(5):
+        collector.add('/a', CHANGE.CHANGED, now=i * 0.5)
+    assert collector.is_due(now=2)
+
+
+def test_watch_limit_fallback(tmpdir, monkeypatch):
+    reads = []
+
+    def read(self, timeout):
+        if not reads:
+            reads.append(self)
+            raise WatchLimitError(str(tmpdir))
+        return []
+    monkeypatch.setattr(PollingBackend, 'read', read)
+    watcher, changes = start_watcher(tmpdir, use_inotify=False)
+    try:
+        root = str(tmpdir)
+        end = time.time() + 3
+        while not changes and time.time() < end:
+            time.sleep(0.05)
+        assert changes == [FileChange(root, CHANGE.CHANGED, True)]
+        # a new backend took over and the thread keeps going
+        assert watcher.backend is not reads[0]
+        assert watcher._thread.is_alive()
+    finally:
+        watcher.stop()
@@ -0,0 +1,470 @@
+# -*- coding: utf-8 -*-
+"""
+    Recursive file system watcher
+
+    Changes are read from inotify where available and found by polling the
+    tree otherwise.  Bursts of changes are coalesced and handed to the
+    callback once the tree was quiet for a moment.
+
+    :copyright: 2005-2010 by The PIDA Project
+    :license: GPL 2 or later (see README/COPYING/LICENSE)
+"""
+
+import os
+import sys
+import stat
+import time
+import errno
+import select
+import struct
+import threading
+
+from pida.core.log import Log
+from pida.utils.addtypes import Enumeration
+
+CHANGE = Enumeration('CHANGE', ('CREATED', 'CHANGED', 'DELETED'))
+
+# directories which are never watched, their own appearance is reported
+IGNORED_DIRS = frozenset(['.git', '.hg', '.svn', '.bzr', '_darcs', 'CVS',
+                          '.pida-metadata'])
+
+
+class FileChange(object):
+    """A change of a single path"""
+    __slots__ = 'path', 'kind', 'is_dir'
+
+    def __init__(self, path, kind, is_dir=False):
+        self.path = path
+        self.kind = kind
+        self.is_dir = is_dir
+
+    @property
+    def dirname(self):
+        return os.path.dirname(self.path)
+
+    @property
+    def basename(self):
+        return os.path.basename(self.path)
+
+    def __eq__(self, other):
+        return isinstance(other, FileChange) and \
+            (self.path, self.kind, self.is_dir) == \
+            (other.path, other.kind, other.is_dir)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<FileChange %s %r>' % (CHANGE.whatis(self.kind), self.path)
+
+
+def merge_kind(old, new):
+    """
+    Returns the kind of change describing old followed by new, None if
+    they cancel each other out
+    """
+    if old == CHANGE.CREATED:
+        if new == CHANGE.DELETED:
+            return None
+        return CHANGE.CREATED
+    if old == CHANGE.DELETED and new == CHANGE.CREATED:
+        return CHANGE.CHANGED
+    return new
+
+
+class ChangeCollector(object):
+    """
+    Coalesces changes by path.
+
+    The collected changes are due once no change arrived for debounce
+    seconds or the oldest one waits for max_delay seconds.
+    """
+
+    def __init__(self, debounce=0.2, max_delay=2.0):
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self._changes = {}
+        self._first = self._last = None
+
+    def __len__(self):
+        return len(self._changes)
+
+    def add(self, path, kind, is_dir=False, now=None):
+        if now is None:
+            now = time.time()
+        if self._first is None:
+            self._first = now
+        self._last = now
+        old = self._changes.get(path)
+        if old is not None:
+            kind = merge_kind(old.kind, kind)
+            if kind is None:
+                del self._changes[path]
+                return
+            is_dir = is_dir or old.is_dir
+        self._changes[path] = FileChange(path, kind, is_dir)
+
+    def is_due(self, now=None):
+        if self._first is None:
+            return False
+        if now is None:
+            now = time.time()
+        return (now - self._last >= self.debounce or
+                now - self._first >= self.max_delay)
+
+    def pop(self):
+        """Returns the changes sorted by path and forgets them"""
+        changes = sorted(self._changes.itervalues(),
+                         key=lambda change: change.path)
+        self._changes = {}
+        self._first = self._last = None
+        return changes
+
+
+def walk_dirs(root, recursive=True, ignored=IGNORED_DIRS):
+    """Yield root and, if recursive, all directories below it"""
+    yield root
+    if not recursive:
+        return
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [name for name in dirnames if name not in ignored and
+                       not os.path.islink(os.path.join(dirpath, name))]
+        for name in dirnames:
+            yield os.path.join(dirpath, name)
+
+
+class WatchLimitError(Exception):
+    """The backend can't watch any more directories"""
+
+
+class PollingBackend(object):
+    """
+    Finds changes by comparing snapshots of the stat of all paths
+    """
+
+    def __init__(self, root, recursive=True, ignored=IGNORED_DIRS,
+                 interval=5.0):
+        self.root = root
+        self.recursive = recursive
+        self.ignored = ignored
+        self.interval = interval
+        self._snapshot = {}
+        self._next_poll = 0
+
+    def start(self):
+        self._snapshot = self._scan()
+        self._next_poll = time.time() + self.interval
+
+    def _scan(self):
+        snapshot = {}
+        for dirpath in walk_dirs(self.root, self.recursive, self.ignored):
+            try:
+                names = os.listdir(dirpath)
+            except OSError:
+                continue
+            for name in names:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.lstat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (st.st_mtime, st.st_size,
+                                  stat.S_ISDIR(st.st_mode))
+        return snapshot
+
+    def read(self, timeout):
+        """Returns a list of (path, kind, is_dir) tuples"""
+        now = time.time()
+        if now < self._next_poll:
+            time.sleep(min(timeout, self._next_poll - now))
+            if time.time() < self._next_poll:
+                return []
+        old, new = self._snapshot, self._scan()
+        self._snapshot = new
+        self._next_poll = time.time() + self.interval
+        changes = []
+        for path, info in new.iteritems():
+            known = old.get(path)
+            if known is None:
+                changes.append((path, CHANGE.CREATED, info[2]))
+            elif known != info and not info[2]:
+                # the mtime of directories changes with their listing, which
+                # is reported through the entries already
+                changes.append((path, CHANGE.CHANGED, info[2]))
+        for path, info in old.iteritems():
+            if path not in new:
+                changes.append((path, CHANGE.DELETED, info[2]))
+        return changes
+
+    def close(self):
+        self._snapshot = {}
+
+
+class InotifyBackend(object):
+    """
+    Reads changes from the Linux inotify interface, every directory of the
+    tree gets its own watch
+    """
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0x00000800
+    IN_CLOEXEC = 0x00080000
+
+    MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+            IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR)
+
+    _HEADER = struct.Struct('iIII')
+
+    _libc = None
+
+    @classmethod
+    def available(cls):
+        if not sys.platform.startswith('linux'):
+            return False
+        if cls._libc is None:
+            try:
+                import ctypes
+                import ctypes.util
+                libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                                   use_errno=True)
+                libc.inotify_init1
+                libc.inotify_add_watch.argtypes = [
+                    ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+                libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+            except (ImportError, OSError, AttributeError):
+                cls._libc = False
+            else:
+                cls._libc = libc
+        return bool(cls._libc)
+
+    def __init__(self, root, recursive=True, ignored=IGNORED_DIRS):
+        self.root = root
+        self.recursive = recursive
+        self.ignored = ignored
+        self.fd = None
+        self._paths = {}
+        self._watches = {}
+
+    def start(self):
+        import ctypes
+        fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.fd = fd
+        for path in walk_dirs(self.root, self.recursive, self.ignored):
+            self._add_watch(path)
+
+    def _add_watch(self, path):
+        import ctypes
+        if isinstance(path, unicode):
+            path = path.encode(sys.getfilesystemencoding() or 'utf-8')
+        wd = self._libc.inotify_add_watch(self.fd, path, self.MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise WatchLimitError(path)
+            # vanished or not accessible
+            return
+        self._paths[wd] = path
+        self._watches[path] = wd
+
+    def _watch_new_dir(self, path, changes):
+        """
+        Watch a new directory and report what got created in it before the
+        watch was in place
+        """
+        for dirpath in walk_dirs(path, True, self.ignored):
+            self._add_watch(dirpath)
+            try:
+                names = os.listdir(dirpath)
+            except OSError:
+                continue
+            for name in names:
+                child = os.path.join(dirpath, name)
+                changes.append((child, CHANGE.CREATED, os.path.isdir(child)))
+
+    def _forget(self, path):
+        prefix = path + os.sep
+        for watched in [p for p in self._watches
+                        if p == path or p.startswith(prefix)]:
+            wd = self._watches.pop(watched)
+            del self._paths[wd]
+            self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout):
+        """Returns a list of (path, kind, is_dir) tuples"""
+        try:
+            readable, _w, _x = select.select([self.fd], [], [], timeout)
+        except select.error as err:
+            if err.args[0] == errno.EINTR:
+                return []
+            raise
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except OSError as err:
+            if err.errno in (errno.EAGAIN, errno.EINTR):
+                return []
+            raise
+        changes = []
+        header = self._HEADER
+        offset = 0
+        while offset + header.size <= len(data):
+            wd, mask, cookie, length = header.unpack_from(data, offset)
+            offset += header.size
+            name = data[offset:offset + length].rstrip('\0')
+            offset += length
+            if mask & self.IN_Q_OVERFLOW:
+                # events got lost, report a change of the whole tree
+                changes.append((self.root, CHANGE.CHANGED, True))
+                continue
+            dirpath = self._paths.get(wd)
+            if dirpath is None:
+                continue
+            if mask & self.IN_IGNORED:
+                del self._paths[wd]
+                self._watches.pop(dirpath, None)
+                continue
+            if mask & self.IN_DELETE_SELF:
+                continue
+            path = os.path.join(dirpath, name) if name else dirpath
+            is_dir = bool(mask & self.IN_ISDIR)
+            if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                changes.append((path, CHANGE.CREATED, is_dir))
+                if is_dir and self.recursive and name not in self.ignored:
+                    self._watch_new_dir(path, changes)
+            elif mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                changes.append((path, CHANGE.DELETED, is_dir))
+                if is_dir and mask & self.IN_MOVED_FROM:
+                    # the watches moved along with the directory
+                    self._forget(path)
+            elif name:
+                changes.append((path, CHANGE.CHANGED, is_dir))
+        return changes
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        self._paths.clear()
+        self._watches.clear()
+
+
+class Watcher(Log):
+    """
+    Watches a directory, recursively by default, and calls callback with
+    lists of :class:`FileChange` from its own thread.
+
+    inotify is used if available, the tree is polled every poll_interval
+    seconds otherwise or if the inotify watch limit is reached.
+
+    The watches are set up in the watcher thread too, :attr:`ready` is set
+    once they are in place.
+    """
+
+    def __init__(self, root, callback, recursive=True, ignored=IGNORED_DIRS,
+                 debounce=0.2, max_delay=2.0, poll_interval=5.0,
+                 use_inotify=True):
+        self.root = os.path.normpath(root)
+        self.callback = callback
+        self.recursive = recursive
+        self.ignored = ignored
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.collector = ChangeCollector(debounce, max_delay)
+        self.backend = None
+        self.ready = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _create_backend(self):
+        if self.use_inotify and InotifyBackend.available():
+            backend = InotifyBackend(self.root, self.recursive, self.ignored)
+            try:
+                backend.start()
+                return backend
+            except WatchLimitError:
+                backend.close()
+                self.log.warning(
+                    "inotify watch limit reached, polling {root}",
+                    root=self.root)
+            except OSError as err:
+                backend.close()
+                self.log.warning("can't use inotify for {root}: {err}",
+                                 root=self.root, err=err)
+        return self._create_polling_backend()
+
+    def _create_polling_backend(self):
+        backend = PollingBackend(self.root, self.recursive, self.ignored,
+                                 self.poll_interval)
+        backend.start()
+        return backend
+
+    def start(self):
+        """Start the watcher thread, which sets up the watches"""
+        self._thread = threading.Thread(target=self._run,
+                                        name='Watcher %s' % self.root)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        try:
+            self.backend = self._create_backend()
+        except Exception as err:
+            self.log.error("can't watch {root}: {err}",
+                           root=self.root, err=err)
+            return
+        finally:
+            self.ready.set()
+        try:
+            self._watch()
+        finally:
+            self.backend.close()
+
+    def _watch(self):
+        collector = self.collector
+        while not self._stopped.is_set():
+            try:
+                changes = self.backend.read(collector.debounce)
+            except WatchLimitError:
+                # a new directory couldn't be watched
+                self.backend.close()
+                self.log.warning(
+                    "inotify watch limit reached, polling {root}",
+                    root=self.root)
+                self.backend = self._create_polling_backend()
+                # changes since the last read are lost
+                changes = [(self.root, CHANGE.CHANGED, True)]
+            except Exception as err:
+                if self._stopped.is_set():
+                    break
+                self.log.error("watching {root} failed: {err}",
+                               root=self.root, err=err)
+                break
+            for path, kind, is_dir in changes:
+                collector.add(path, kind, is_dir)
+            if collector.is_due() and not self._stopped.is_set():
+                try:
+                    self.callback(collector.pop())
+                except Exception as err:
+                    self.log.exception(err)
+
+    def stop(self):
+        """Stop the thread, it closes the backend when it finishes"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(1)
+            self._thread = None
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+    Persistent content index of the grepper service
+
+    Maps the trigrams of every project file to the files containing them,
+    so a search only has to read the files which may match.
+
+    :copyright: 2005-2010 by The PIDA Project
+    :license: GPL 2 or later (see README/COPYING/LICENSE)
+"""
+
+import os
+import marshal
+import threading
+
+from pida.core.log import Log
+from pida.utils.search import TrigramIndex
+
+INDEX_NAME = "contentindex"
+INDEX_VERSION = 1
+
+# bigger files aren't indexed and are always searched
+MAX_FILE_SIZE = 1024 * 1024
+
+
+class ContentIndex(Log):
+    """
+    Trigram index over the content of the files of a project.
+
+    Files are tracked with the mtime they had when they were read, any
+    file whose mtime in the project index differs is treated as a
+    candidate for every search until it gets indexed again.  Searches
+    never touch the filesystem, the index is kept current by
+    :meth:`update` with the changes of the project index, by
+    :meth:`update_file` on saves and by :meth:`sync` on project refreshes.
+    """
+
+    def __init__(self, project):
+        self.project = project
+        self.path = project.get_meta_dir('grepper', filename=INDEX_NAME)
+        self._lock = threading.RLock()
+        self.index = TrigramIndex()
+        self.mtimes = {}
+        self.dirty = False
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            return False
+        try:
+            with open(self.path, 'rb') as fp:
+                version, mtimes, state = marshal.load(fp)
+            if version != INDEX_VERSION:
+                raise ValueError('unknown version %r' % version)
+        except Exception as err:
+            self.log.error("can't load content index {path}: {err}",
+                           path=self.path, err=err)
+            return False
+        with self._lock:
+            self.index = TrigramIndex.from_state(state)
+            self.mtimes = mtimes
+            self.dirty = False
+        return True
+
+    def save(self):
+        with self._lock:
+            if not self.dirty:
+                return
+            data = INDEX_VERSION, self.mtimes, self.index.get_state()
+            # changes while writing make it dirty again
+            self.dirty = False
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'wb') as fp:
+                marshal.dump(data, fp)
+            os.rename(tmp, self.path)
+        except (IOError, OSError) as err:
+            self.log.error("can't save content index: {err}", err=err)
+            # try again on the next save
+            with self._lock:
+                self.dirty = True
+
+    def update_file(self, relpath):
+        """(Re)index a single file, removes it if it is gone"""
+        path = os.path.join(self.project.source_directory, relpath)
+        try:
+            st = os.stat(path)
+            if st.st_size > MAX_FILE_SIZE:
+                text = None
+            else:
+                with open(path, 'rb') as fp:
+                    text = fp.read()
+        except (IOError, OSError):
+            self.remove_file(relpath)
+            return
+        with self._lock:
+            self.dirty = True
+            if text is None:
+                self.index.remove(relpath)
+                self.mtimes.pop(relpath, None)
+                return
+            if '\0' in text[:4096]:
+                # binaries are never searched, index them as empty
+                text = ''
+            self.index.add(relpath, text)
+            self.mtimes[relpath] = st.st_mtime
+
+    def remove_file(self, relpath):
+        with self._lock:
+            if relpath in self.mtimes:
+                self.dirty = True
+                self.index.remove(relpath)
+                del self.mtimes[relpath]
+
+    def update(self, delta):
+        """Apply an :class:`IndexDelta` of the project index"""
+        for relpath in delta.removed:
+            self.remove_file(relpath)
+        for relpath in delta.added | delta.modified:
+            # directories are gone for update_file, like deleted files
+            self.update_file(relpath)
+
+    def sync(self, files, check_disk=False):
+        """
+        Bring the index in line with the project files.
+
+        :param files: dict of relative paths to mtimes, like
+                      :meth:`Indexer.get_file_mtimes` returns
+        :param check_disk: stat the files the project index considers
+                           unchanged as well, files changed in place
+                           outside of PIDA keep their mtime there
+        """
+        with self._lock:
+            removed = [relpath for relpath in self.mtimes
+                       if relpath not in files]
+            changed = [relpath for relpath, mtime in files.iteritems()
+                       if self.mtimes.get(relpath) != mtime]
+            if check_disk:
+                unchanged = [(relpath, mtime) for relpath, mtime
+                             in self.mtimes.iteritems()
+                             if files.get(relpath) == mtime]
+        if check_disk:
+            source = self.project.source_directory
+            for relpath, mtime in unchanged:
+                try:
+                    st = os.stat(os.path.join(source, relpath))
+                except OSError:
+                    continue
+                if st.st_mtime != mtime:
+                    changed.append(relpath)
+        for relpath in removed:
+            self.remove_file(relpath)
+        for relpath in changed:
+            self.update_file(relpath)
+        return len(removed) + len(changed)
+
+    def candidates(self, literal, files):
+        """
+        Returns the set of relative paths which may contain literal, case
+        insensitive, or None if the literal is too short.
+
+        :param files: dict of relative paths to mtimes, files which aren't
+                      indexed with this mtime are always candidates
+        """
+        with self._lock:
+            found = self.index.candidates(literal)
+            if found is None:
+                return None
+            result = set(found)
+            result.update(relpath for relpath, mtime in files.iteritems()
+                          if self.mtimes.get(relpath) != mtime)
+        return result
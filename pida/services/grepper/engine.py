@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+    Grep engine of the grepper service
+
+    The files are spread in chunks over a pool of worker processes, matches
+    come back as plain tuples and are turned into GrepperItems by the
+    service.
+
+    :copyright: 2005-2010 by The PIDA Project
+    :license: GPL 2 or later (see README/COPYING/LICENSE)
+"""
+
+import re
+import mmap
+import threading
+import sre_parse
+import sre_constants
+import multiprocessing
+from collections import deque
+from itertools import chain, islice
+
+# files handed to a worker at once
+CHUNK_SIZE = 64
+
+
+def required_literal(pattern, flags=0, ignore_case=False):
+    """
+    Returns the longest literal string every match of pattern contains or
+    None if there is none.
+
+    :param ignore_case: also return the literal for case insensitive
+                        patterns, the caller has to compare accordingly
+    """
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except (sre_constants.error, ValueError):
+        return None
+    if parsed.pattern.flags & re.IGNORECASE and not ignore_case:
+        return None
+    best = []
+    current = []
+    # only the top level sequence is required as a whole
+    for op, av in parsed:
+        if op == sre_constants.LITERAL:
+            current.append(av)
+            continue
+        if len(current) > len(best):
+            best = current
+        current = []
+    if len(current) > len(best):
+        best = current
+    if isinstance(pattern, unicode) and any(char > 127 for char in best):
+        # a unicode pattern is matched against the raw bytes of the files,
+        # there is no single encoding of the literal to look for
+        return None
+    return ''.join(map(chr, best)) or None
+
+
+class Pattern(object):
+    """
+    A regex prepared for scanning whole files.
+
+    Besides the regex itself it keeps a multiline variant, used to find
+    candidate lines in the whole file at once, and the literal all matches
+    contain, used to skip files without any match.
+    """
+
+    def __init__(self, regex):
+        self.regex = regex
+        self.multiline = re.compile(regex.pattern, regex.flags | re.MULTILINE)
+        self.literal = required_literal(regex.pattern, regex.flags)
+
+
+def grep_file(filename, pattern, limit=None):
+    """
+    Grep a file.
+
+    Returns a list of (filename, linenumber, line, matches) tuples for at
+    most limit matching lines.
+
+    The file is memory mapped and searched as a whole, line numbers are
+    only computed for lines with matches.  The matches are taken from the
+    single line, so the results are the same as grepping line by line.
+    """
+    if not isinstance(pattern, Pattern):
+        pattern = Pattern(pattern)
+    results = []
+    try:
+        with open(filename, 'rb') as fp:
+            data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    except (EnvironmentError, ValueError):
+        # unreadable or empty files
+        return results
+    try:
+        # simple guess for binaries
+        if data.find('\0', 0, 4096) != -1:
+            return results
+        if pattern.literal is not None and data.find(pattern.literal) == -1:
+            return results
+        search = pattern.multiline.search
+        findall = pattern.regex.findall
+        size = len(data)
+        pos = counted = 0
+        linenumber = 1
+        while pos < size:
+            match = search(data, pos)
+            if match is None:
+                break
+            start = data.rfind('\n', 0, match.start()) + 1
+            end = data.find('\n', match.start())
+            end = size if end == -1 else end + 1
+            linenumber += data[counted:start].count('\n')
+            counted = start
+            line = data[start:end]
+            line_matches = findall(line)
+            if line_matches:
+                results.append((filename, linenumber, line, line_matches))
+                if limit is not None and len(results) >= limit:
+                    break
+            # empty matches at the line start would loop forever otherwise
+            pos = max(end, pos + 1)
+    finally:
+        data.close()
+    return results
+
+
+def grep_files(args):
+    """Grep a chunk of files in a worker, stops after limit matches"""
+    filenames, regex, limit = args
+    results = []
+    for filename in filenames:
+        results.extend(grep_file(filename, regex, limit - len(results)))
+        if len(results) >= limit:
+            break
+    return results
+
+
+def chunked(iterable, size=CHUNK_SIZE):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class GrepEngine(object):
+    """
+    Greps files on a pool of worker processes.
+
+    The pool lives as long as the engine, :meth:`start` has to be called
+    from the main thread, forking from a worker thread would copy the locks
+    other threads hold.  Without a pool the files are searched in the
+    calling thread.
+
+    :param processes: number of workers, defaults to the number of cpus
+    """
+
+    def __init__(self, processes=None, chunk_size=CHUNK_SIZE):
+        self.processes = processes or multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+        self._pool = None
+        # no chunks are handed to a pool while it gets closed
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the worker processes"""
+        if self._pool is None and self.processes > 1:
+            self._pool = multiprocessing.Pool(self.processes)
+
+    def close(self):
+        """Let the workers exit once the chunks handed to them are done"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+
+    def terminate(self):
+        """Stop the workers right away"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    def run(self, filenames, regex, limit, is_stopped=None):
+        """
+        Yield lists of (filename, linenumber, line, matches) tuples.
+
+        The lists arrive in the order of the chunks of filenames.  At most
+        limit matches are returned in total.
+
+        :param filenames: iterable of absolute paths, consumed lazily
+        :param is_stopped: callable to check if the caller lost interest
+        """
+        if not isinstance(regex, Pattern):
+            regex = Pattern(regex)
+        tasks = ((chunk, regex, limit)
+                 for chunk in chunked(filenames, self.chunk_size))
+        first = next(tasks, None)
+        if first is None:
+            return
+        tasks = chain([first], tasks)
+        pool = self._pool
+        if pool is None:
+            results = (grep_files(task) for task in tasks)
+        else:
+            results = self._run_pool(pool, tasks)
+
+        count = 0
+        try:
+            for result in results:
+                if is_stopped is not None and is_stopped():
+                    return
+                if not result:
+                    continue
+                result = result[:limit - count]
+                count += len(result)
+                yield result
+                if count >= limit:
+                    return
+        finally:
+            results.close()
+
+    def _run_pool(self, pool, tasks):
+        # only a few chunks are handed out ahead, so a search that gets
+        # stopped leaves little work behind in the shared pool
+        window = self.processes * 2
+        pending = deque()
+        for task in tasks:
+            with self._lock:
+                if self._pool is pool:
+                    pending.append(pool.apply_async(grep_files, (task,)))
+                else:
+                    # the pool got closed for a new one, finish right here
+                    tasks = chain([task], tasks)
+                    break
+            if len(pending) >= window:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+        for task in tasks:
+            yield grep_files(task)
@@ -17,7 +17,12 @@ from pida.core.events import EventsConfig
 from pida.core.options import OptionsConfig
 from pida.core.features import FeaturesConfig
 from pida.core.actions import ActionsConfig
-from pygtkhelpers.gthreads import GeneratorTask
+from pygtkhelpers.gthreads import GeneratorTask, AsyncTask
+
+from pida.core.projects import REFRESH_PRIORITY
+
+from .engine import GrepEngine, required_literal
+from .contentindex import ContentIndex
 
 # locale
 from pida.core.locale import Locale
@@ -175,10 +180,12 @@ class GrepperView(PidaView):
                                                  line=item.linenumber)
         self.svc.boss.editor.cmd('grab_focus')
 
-    def append_to_matches_list(self, grepper_item):
+    def append_to_matches_list(self, grepper_items):
         # select the first item (slight hack)
-        select = not len(self.matches_list)
-        self.matches_list.append(grepper_item, select=select)
+        if not len(self.matches_list):
+            self.matches_list.append(grepper_items[0], select=True)
+            grepper_items = grepper_items[1:]
+        self.matches_list.extend(grepper_items)
 
     def on_find_button__clicked(self, button):
         if self.running:
@@ -298,17 +305,52 @@ class GrepperOptions(OptionsConfig):
             _('The maximum number of results to find (approx).'),
         )
 
+        self.create_option(
+            'processes',
+            _('Worker processes'),
+            int,
+            0,
+            _('The number of processes searching in parallel '
+              '(0 means one per cpu).'),
+            self.on_processes_changed,
+        )
+
+        self.create_option(
+            'content_index',
+            _('Content index'),
+            bool,
+            False,
+            _('Keep an index of the content of the project files to '
+              'speed up searches in projects.'),
+        )
+
+    def on_processes_changed(self, option):
+        self.svc.start_engine()
+
 class GrepperEvents(EventsConfig):
 
     def subscribe_all_foreign(self):
         self.subscribe_foreign('project', 'project_switched',
             self.svc.set_current_project)
+        self.subscribe_foreign('buffer', 'document-saved',
+            self.svc.on_document_saved)
+        self.subscribe_foreign('project', 'index_updated',
+            self.svc.on_index_updated)
 
 class GrepperFeatures(FeaturesConfig):
 
     def subscribe_all_foreign(self):
         self.subscribe_foreign('contexts', 'dir-menu',
             (self.svc, 'grepper-dir-menu.xml'))
+        self.subscribe_foreign('project', 'project_refresh',
+            self.do_refresh)
+
+    def do_refresh(self, project, callback):
+        self.svc.update_content_index(project)
+        callback()
+
+    do_refresh.priority = REFRESH_PRIORITY.POST_FILECACHE
+    do_refresh.requires = ('filecache',)
 
 
 
@@ -326,8 +368,24 @@ class Grepper(Service):
     features_config = GrepperFeatures
 
     def pre_start(self):
+        self.current_project = None
         self.current_project_source_directory = None
         self._views = []
+        self._content_indexes = {}
+        self._engine = None
+
+    def start(self):
+        self.start_engine()
+
+    def start_engine(self):
+        """
+        Start the worker processes used by all searches, a running search
+        finishes on the old ones
+        """
+        if self._engine is not None:
+            self._engine.close()
+        self._engine = GrepEngine(self.opt('processes') or None)
+        self._engine.start()
 
     def show_grepper_in_project_source_directory(self):
         if self.current_project_source_directory is None:
@@ -354,83 +412,143 @@ class Grepper(Service):
     def grep(self, top, regex, recursive=False, show_hidden=False,
              generator_task=None):
         """
-        grep is a wrapper around _grep_file_list and _grep_file.
+        Grep the files below top, yielding lists of GrepperItems.
+
+        The files are searched in parallel by the :class:`GrepEngine` of
+        the service.
         """
-        self._result_count = 0
-        if os.path.isfile(top):
-            file_results = self._grep_file(top, regex)
-            for result in file_results:
-                yield result
-        elif recursive:
-            for root, dirs, files in os.walk(top):
-                if generator_task.is_stopped:
-                    return
-                # Remove hidden directories
-                if os.path.basename(root).startswith('.') and not show_hidden:
-                    del dirs[:]
-                    continue
-                for matches in self._grep_file_list(files, root, regex,
-                                                generator_task=generator_task,
-                                                show_hidden=show_hidden):
-                    yield matches
+        engine = self._engine
+        if generator_task is not None:
+            is_stopped = lambda: generator_task.is_stopped
         else:
-            for matches in self._grep_file_list(os.listdir(top), top, regex,
-                                                generator_task=generator_task,
-                                                show_hidden=show_hidden):
-                yield matches
-
-    def _grep_file_list(self, file_list, root, regex, show_hidden=False,
-                                               generator_task=None):
+            is_stopped = None
+        filenames = self._list_files(top, regex, recursive, show_hidden,
+                                     is_stopped)
+        for matches in engine.run(filenames, regex,
+                                  self.opt('maximum_results'), is_stopped):
+            yield [GrepperItem(filename, self, linenumber, line, line_matches)
+                   for filename, linenumber, line, line_matches in matches]
+
+    def _list_files(self, top, regex, recursive, show_hidden,
+                    is_stopped=None):
         """
-        Grep for a list of files.
-
-        takes as it's arguments a list of files to grep, the directory
-        containing that list, and a regular expression to search for in them
-        (optionaly whether or not to search hidden files).
+        Yield the files to grep.
 
-        _grep_file_list itterates over that file list, and calls _grep_file on
-        each of them with the supplied arguments.
+        Recursive searches inside of the current project take the file list
+        from the project's index instead of walking the filesystem and
+        narrow it down with the content index if there is one.  That is
+        only done while the index is known to be complete, see
+        :meth:`index_is_current`.
         """
-        for file in file_list:
-            if generator_task and generator_task.is_stopped:
+        if os.path.isfile(top):
+            yield top
+            return
+        if not recursive:
+            for file in os.listdir(top):
+                filename = os.path.join(top, file)
+                if (show_hidden or not file.startswith('.')) and \
+                   os.path.isfile(filename):
+                    yield filename
+            return
+
+        project = self.current_project
+        if project is not None and self.index_is_current(project):
+            relpath = project.get_relative_path_for(top)
+        else:
+            relpath = None
+        if relpath is not None:
+            prefix = os.sep.join(relpath)
+            if prefix:
+                prefix += os.sep
+            source = project.source_directory
+            files = project.indexer.get_file_mtimes(prefix)
+            candidates = None
+            index = self.get_content_index(project)
+            literal = required_literal(regex.pattern, regex.flags,
+                                       ignore_case=True)
+            if index is not None and literal is not None:
+                candidates = index.candidates(literal, files)
+            for path in sorted(files):
+                if candidates is not None and path not in candidates:
+                    continue
+                if not show_hidden and any(part.startswith('.') for part in
+                                   path[len(prefix):].split(os.sep)):
+                    continue
+                yield os.path.join(source, path)
+            return
+
+        for root, dirs, files in os.walk(top):
+            if is_stopped is not None and is_stopped():
                 return
-            if self._result_count > self.opt('maximum_results'):
-                break
-            if file.startswith(".") and not show_hidden:
+            # Remove hidden directories
+            if os.path.basename(root).startswith('.') and not show_hidden:
+                del dirs[:]
                 continue
-            # never do this, always use os.path.join
-            # filename = "%s/%s" % (root, file,)
-            filename = os.path.join(root, file)
-            file_results = self._grep_file(filename, regex)
-            for result in file_results:
-                yield result
-
-    def _grep_file(self, filename, regex):
-        """
-        Grep a file.
+            for file in files:
+                if file.startswith(".") and not show_hidden:
+                    continue
+                # never do this, always use os.path.join
+                # filename = "%s/%s" % (root, file,)
+                yield os.path.join(root, file)
 
-        Takes as it's arguments a full path to a file, and a regular expression
-        to search for. It returns a generator that yields a GrepperItem for
-        each cycle, that contains the path, line number and matches data.
+    def index_is_current(self, project):
+        """
+        If the file index of project has all files, that is after it got
+        refreshed in this session or while the file watcher feeds it
         """
+        if project.indexer.refreshed:
+            return True
         try:
-            with open(filename) as fp:
-                # simple guess for binaries
-                if '\0' in fp.read(4096):
-                    return
-                fp.seek(0)
-                for linenumber, line in enumerate(fp):
-
-                    line_matches = regex.findall(line)
-
-                    if line_matches:
-                        self._result_count += 1
-                        # enumerate is 0 based, line numbers are 1 based
-                        yield GrepperItem(filename, self, linenumber+1, line, line_matches)
-        except IOError:
-            pass
+            watcher = self.boss.get_service('filewatcher')
+        except KeyError:
+            return False
+        source = os.path.normpath(project.source_directory)
+        return watcher.started and watcher.is_watched(source)
+
+    def get_content_index(self, project):
+        """
+        Returns the content index of project, None if they are disabled
+        """
+        if not self.opt('content_index'):
+            return None
+        index = self._content_indexes.get(project)
+        if index is None:
+            index = self._content_indexes[project] = ContentIndex(project)
+            index.load()
+        return index
+
+    def update_content_index(self, project):
+        """
+        Sync the content index with the file index of the project
+
+        Files changed in place are looked for on disk here, so searches
+        don't have to.
+        """
+        index = self.get_content_index(project)
+        if index is None:
+            return
+        changed = index.sync(project.indexer.get_file_mtimes(),
+                             check_disk=True)
+        index.save()
+        self.log.debug('content index of {project}: {changed} files updated',
+                       project=project.name, changed=changed)
+
+    def on_document_saved(self, document):
+        project = self.current_project
+        if project is None:
+            return
+        relpath = project.get_relative_path_for(document.filename)
+        index = self.get_content_index(project)
+        if index is not None and relpath is not None:
+            index.update_file(os.sep.join(relpath))
+
+    def on_index_updated(self, project, delta):
+        index = self.get_content_index(project)
+        if index is not None:
+            AsyncTask(index.update).start(delta)
 
     def set_current_project(self, project):
+        self.current_project = project
         self.current_project_source_directory = project.source_directory
         #self.set_view_location(project.source_directory)
 
@@ -440,6 +558,10 @@ class Grepper(Service):
     def stop(self):
         for view in self._views:
             view.stop()
+        for index in self._content_indexes.itervalues():
+            index.save()
+        if self._engine is not None:
+            self._engine.terminate()
 
 
 Service = Grepper
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+    :copyright: 2005-2010 by The PIDA Project
+    :license: GPL 2 or later (see README/COPYING/LICENSE)
+"""
+import os
+import re
+
+from pida.core.projects import Project
+from .contentindex import ContentIndex
+from .engine import GrepEngine
+
+
+def make_project(tmpdir):
+    tmpdir.join('a.py').write('def foo():\n    return bar\n')
+    tmpdir.join('b.py').write('import os\n')
+    tmpdir.ensure('src', dir=True).join('c.txt').write('FOO and baz\n')
+    tmpdir.join('d.bin').write('foo\0')
+    Project.create_blank_project_file('test', str(tmpdir))
+    project = Project(str(tmpdir))
+    project.indexer.index(recrusive=True)
+    return project
+
+
+def test_sync_and_candidates(tmpdir):
+    project = make_project(tmpdir)
+    index = ContentIndex(project)
+    files = project.indexer.get_file_mtimes()
+    assert index.sync(files) == len(files)
+    assert index.sync(files) == 0
+
+    assert index.candidates('foo', files) == set(['a.py', 'src/c.txt'])
+    assert index.candidates('import', files) == set(['b.py'])
+    assert index.candidates('fo', files) is None
+
+    # files changed since they were indexed are always candidates
+    files['b.py'] += 1
+    assert index.candidates('foo', files) == set(['a.py', 'src/c.txt',
+                                                  'b.py'])
+
+
+def test_persistence(tmpdir):
+    project = make_project(tmpdir)
+    index = ContentIndex(project)
+    index.sync(project.indexer.get_file_mtimes())
+    index.save()
+
+    loaded = ContentIndex(project)
+    assert loaded.load()
+    files = project.indexer.get_file_mtimes()
+    assert loaded.candidates('baz', files) == set(['src/c.txt'])
+
+    tmpdir.join('a.py').remove()
+    loaded.update_file('a.py')
+    tmpdir.join('b.py').write('foo = 1\n')
+    loaded.update_file('b.py')
+    assert loaded.candidates('foo', {}) == set(['b.py', 'src/c.txt'])
+
+
+def test_save_failed(tmpdir):
+    project = make_project(tmpdir)
+    index = ContentIndex(project)
+    index.sync(project.indexer.get_file_mtimes())
+    path = index.path
+    index.path = str(tmpdir.join('missing', 'index'))
+    index.save()
+    assert index.dirty
+    index.path = path
+    index.save()
+    assert not index.dirty
+    assert ContentIndex(project).load()
+
+
+def test_update(tmpdir):
+    project = make_project(tmpdir)
+    index = ContentIndex(project)
+    index.sync(project.indexer.get_file_mtimes())
+    tmpdir.join('a.py').remove()
+    tmpdir.join('b.py').write('foo = 1\n')
+    tmpdir.join('b.py').setmtime(index.mtimes['b.py'] + 10)
+    tmpdir.join('src', 'e.txt').write('more foo\n')
+    delta = project.indexer.update_paths([
+        str(tmpdir.join('a.py')),
+        str(tmpdir.join('b.py')),
+        str(tmpdir.join('src', 'e.txt')),
+    ])
+    index.update(delta)
+    files = project.indexer.get_file_mtimes()
+    assert index.candidates('foo', files) == set(['b.py', 'src/c.txt',
+                                                  'src/e.txt'])
+
+
+def test_changed_in_place(tmpdir):
+    project = make_project(tmpdir)
+    index = ContentIndex(project)
+    index.sync(project.indexer.get_file_mtimes())
+    path = tmpdir.join('b.py')
+    path.write('import sys\n')
+    mtime = index.mtimes['b.py'] + 10
+    os.utime(str(path), (mtime, mtime))
+    # the directory mtime didn't change, the project index misses it
+    project.indexer.refresh()
+    files = project.indexer.get_file_mtimes()
+    assert files['b.py'] == index.mtimes['b.py']
+    assert index.candidates('sys', files) == set()
+
+    # searches don't stat, the refresh does
+    assert index.sync(files) == 0
+    assert index.sync(files, check_disk=True) == 1
+    candidates = index.candidates('sys', files)
+    assert candidates == set(['b.py'])
+    filenames = [str(tmpdir.join(relpath)) for relpath in candidates]
+    results = [match for matches in
+               GrepEngine(1).run(filenames, re.compile('sys'), 10)
+               for match in matches]
+    assert [(line, text) for filename, line, text, matches in results] == \
+        [(1, 'import sys\n')]
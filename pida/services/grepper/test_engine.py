@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+    :copyright: 2005-2010 by The PIDA Project
+    :license: GPL 2 or later (see README/COPYING/LICENSE)
+"""
+import re
+from .engine import GrepEngine, grep_file, required_literal
+
+
+def make_files(tmpdir, count):
+    files = []
+    for i in range(count):
+        path = tmpdir.join('file%d.txt' % i)
+        path.write('nothing\nfoo %d\nbar\nfoo again\n' % i)
+        files.append(str(path))
+    return files
+
+
+def test_grep_file(tmpdir):
+    path = tmpdir.join('test.txt')
+    path.write('a foo\nbar\nfoo foo\n')
+    results = grep_file(str(path), re.compile('foo'))
+    assert results == [
+        (str(path), 1, 'a foo\n', ['foo']),
+        (str(path), 3, 'foo foo\n', ['foo', 'foo']),
+    ]
+    assert len(grep_file(str(path), re.compile('foo'), limit=1)) == 1
+
+
+def test_grep_file_like_lines(tmpdir):
+    path = tmpdir.join('test.txt')
+    path.write('foo bar\nbar foo\n  \nlast foo')
+    def grep(pattern):
+        return [(line, matches) for filename, line, text, matches
+                in grep_file(str(path), re.compile(pattern))]
+    assert grep('^foo') == [(1, ['foo'])]
+    assert grep('foo$') == [(2, ['foo']), (4, ['foo'])]
+    # matches don't span lines
+    assert grep(r'bar\s+bar') == []
+    assert grep(r'(\w+) foo') == [(2, ['bar']), (4, ['last'])]
+    assert grep('nothing') == []
+
+
+def test_required_literal():
+    assert required_literal('foo') == 'foo'
+    assert required_literal(r'def \w+_test\(') == '_test('
+    assert required_literal('a|b') is None
+    assert required_literal('fo*') == 'f'
+    assert required_literal('foo', re.IGNORECASE) is None
+    assert required_literal('(?i)foo') is None
+    assert required_literal(u'foo') == 'foo'
+    assert required_literal(u'caf\xe9') is None
+
+
+def test_grep_file_unicode_pattern(tmpdir):
+    path = tmpdir.join('test.txt')
+    path.write('caf\xe9\n', mode='wb')
+    results = grep_file(str(path), re.compile(u'caf\xe9'))
+    assert [line for filename, linenumber, line, matches
+            in results] == ['caf\xe9\n']
+
+
+def test_grep_empty(tmpdir):
+    path = tmpdir.join('empty.txt')
+    path.write('')
+    assert grep_file(str(path), re.compile('foo')) == []
+
+
+def test_grep_binary(tmpdir):
+    path = tmpdir.join('test.bin')
+    path.write('foo\0bar')
+    assert grep_file(str(path), re.compile('foo')) == []
+
+
+def test_engine_pool(tmpdir):
+    files = make_files(tmpdir, 50)
+    engine = GrepEngine(processes=2, chunk_size=8)
+    engine.start()
+    try:
+        pool = engine._pool
+        for i in range(2):
+            results = [match for batch in
+                       engine.run(files, re.compile('foo'), 1000)
+                       for match in batch]
+            assert len(results) == 100
+            assert sorted(set(match[0] for match in results)) == \
+                   sorted(files)
+        # the workers are kept between searches
+        assert engine._pool is pool
+    finally:
+        engine.terminate()
+
+
+def test_engine_closed(tmpdir):
+    files = make_files(tmpdir, 50)
+    engine = GrepEngine(processes=2, chunk_size=4)
+    engine.start()
+    results = engine.run(files, re.compile('foo'), 1000)
+    count = len(next(results))
+    # a search running while the pool gets replaced finishes anyway
+    engine.close()
+    count += sum(len(batch) for batch in results)
+    assert count == 100
+
+
+def test_engine_limit(tmpdir):
+    files = make_files(tmpdir, 50)
+    for processes in (1, 2):
+        engine = GrepEngine(processes=processes, chunk_size=4)
+        engine.start()
+        try:
+            batches = list(engine.run(files, re.compile('foo'), 15))
+        finally:
+            engine.terminate()
+        assert sum(len(batch) for batch in batches) == 15
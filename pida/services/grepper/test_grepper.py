@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+    :copyright: 2005-2010 by The PIDA Project
+    :license: GPL 2 or later (see README/COPYING/LICENSE)
+"""
+import re
+
+from pida.core.projects import Project
+from pida.utils.testing.mock import Mock
+from .grepper import Grepper
+
+
+def make_grepper(tmpdir):
+    tmpdir.join('a.py').write('foo\n')
+    Project.create_blank_project_file('test', str(tmpdir))
+    project = Project(str(tmpdir))
+    boss = Mock()
+    boss.get_service.side_effect = KeyError
+    svc = Grepper(boss)
+    svc.current_project = project
+    svc.get_content_index = lambda project: None
+    return svc, project
+
+
+def list_files(svc, top):
+    return sorted(svc._list_files(str(top), re.compile('foo'), True, False))
+
+
+def test_list_files_stale_index(tmpdir):
+    svc, project = make_grepper(tmpdir)
+    # nothing indexed yet, the disk is walked
+    assert list_files(svc, tmpdir) == [str(tmpdir.join('a.py'))]
+
+    project.indexer.index(recrusive=True)
+    tmpdir.join('b.py').write('foo\n')
+    # the index is complete, new files only show up after a refresh
+    assert list_files(svc, tmpdir) == [str(tmpdir.join('a.py'))]
+    project.indexer.refresh()
+    assert list_files(svc, tmpdir) == [str(tmpdir.join('a.py')),
+                                       str(tmpdir.join('b.py'))]
+
+
+def test_list_files_loaded_index(tmpdir):
+    svc, project = make_grepper(tmpdir)
+    project.indexer.index(recrusive=True)
+    project.indexer.save_cache()
+    tmpdir.join('b.py').write('foo\n')
+    # a cache from an earlier session may miss new files
+    project.indexer = type(project.indexer)(project)
+    assert project.indexer.load_cache()
+    assert list_files(svc, tmpdir) == [str(tmpdir.join('a.py')),
+                                       str(tmpdir.join('b.py'))]
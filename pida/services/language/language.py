@@ -498,6 +498,14 @@ class LanguageCommandsConfig(CommandsConfig):
     def hide_language_prio(self):
         self.svc.show_language_prio(False)
 
+    def get_external_stats(self):
+        """
+        Returns the stats of the external processes of each language
+        plugin by its name
+        """
+        return dict((service.get_name(), service.jobserver.get_stats())
+                    for service in self.svc.get_external_services())
+
 
 class LanguageOptionsConfig(OptionsConfig):
 
@@ -509,6 +517,41 @@ class LanguageOptionsConfig(OptionsConfig):
             3,
             _('Expand all entries when searching the outliner after n chars'))
 
+        self.create_option(
+            'external_processes',
+            _('External processes'),
+            int,
+            0,
+            _('The number of processes each language plugin may run its '
+              'jobs in (0 uses the default of the plugin).'),
+            self.on_external_changed,
+        )
+
+        self.create_option(
+            'external_batch_size',
+            _('External results per batch'),
+            int,
+            0,
+            _('The number of results language plugins send back from their '
+              'external process at once (0 uses the default of the plugin).'),
+            self.on_external_changed,
+        )
+
+        self.create_option(
+            'external_flush_interval',
+            _('External flush interval'),
+            int,
+            0,
+            _('Milliseconds after which a language plugin sends back an '
+              'incomplete batch of results (0 uses the default of the '
+              'plugin).'),
+            self.on_external_changed,
+        )
+
+    def on_external_changed(self, option):
+        for service in self.svc.get_external_services():
+            service.jobserver.configure(**service.get_jobserver_settings())
+
 class ValidatorConfig(WindowConfig):
     key = ValidatorView.key
     label_text = ValidatorView.label_text
@@ -547,10 +590,14 @@ class LanguageEvents(EventsConfig):
                                 self.on_document_changed)
         self.subscribe_foreign('buffer', 'document-typchanged', 
                                 self.on_document_type)
+        self.subscribe_foreign('buffer', 'document-closed',
+                                self.on_document_closed)
+        self.subscribe_foreign('project', 'removed',
+                                self.on_project_removed)
         self.subscribe_foreign('plugins', 'plugin_started', 
-                                self.clear_all_documents)
+                                self.on_plugin_changed)
         self.subscribe_foreign('plugins', 'plugin_stopped', 
-                                self.clear_all_documents)
+                                self.on_plugin_changed)
 
 
     def create(self):
@@ -565,11 +612,23 @@ class LanguageEvents(EventsConfig):
         self.on_document_changed(
             document=self.svc.boss.get_service('buffer').get_current())
 
+    def on_plugin_changed(self, plugin):
+        # language plugins may get activated by the current document
+        self.on_refresh()
+
     def clear_all_documents(self, *args, **kwargs):
         for doc in self.svc.boss.get_service('buffer'). \
                     get_documents().itervalues():
             self.svc.clear_document_cache(doc)
 
+    def on_document_closed(self, document):
+        for service in self.svc.get_external_services():
+            service.jobserver.forget(document=document)
+
+    def on_project_removed(self, project):
+        for service in self.svc.get_external_services():
+            service.jobserver.forget(project=project)
+
     def on_document_type(self, document):
         self.svc.clear_document_cache(document)
         self.svc.on_buffer_changed(document)
@@ -697,6 +756,13 @@ class Language(LanguageService):
         if hasattr(self.boss.editor, 'show_documentation'):
             self.boss.editor.show_documentation()
 
+    def get_external_services(self):
+        """
+        Returns the running language plugins with external processes
+        """
+        return [service for service in self.boss.get_services()
+                if getattr(service, 'jobserver', None) is not None]
+
     def clear_document_cache(self, document):
         for k in ("_lng_outliner", "_lng_validator", "_lng_completer",
                  "_lng_definer", "_lnd_documentator" ,"_lnd_snipper"):
@@ -0,0 +1,2 @@
+# only used through its menu entry, see pida.core.servicemanager.LazyService
+triggers = {}
@@ -420,6 +420,8 @@ class Plugins(Service):
             start_list = self.opt('start_list')
         running_list = [plugin.get_name() for plugin in
                 self.boss.get_plugins()]
+        # plugins waiting for their first use count as running
+        running_list.extend(self.boss.servicemanager.get_lazy_plugins())
 
         loading_errors = []
 
@@ -436,8 +438,10 @@ class Plugins(Service):
                 if service_name not in start_list:
                     continue
                 try:
-                    plugin = self.boss.start_plugin(service_name)
-                    self.emit('plugin_started', plugin=plugin)
+                    plugin = self.boss.start_plugin(service_name, lazy=True)
+                    # lazy plugins emit plugin_started once activated
+                    if plugin is not None:
+                        self.emit('plugin_started', plugin=plugin)
                     plugin_item.enabled = True
                 except ServiceLoadingError, e:
                     self.log.error(e)
@@ -532,6 +536,8 @@ class Plugins(Service):
                 return
         running_list = [plugin.get_name() for plugin in
                 self.boss.get_plugins()]
+        # plugins waiting for their first use count as running
+        running_list.extend(self.boss.servicemanager.get_lazy_plugins())
         if item.plugin in running_list:
             self.stop_plugin(item.plugin)
         shutil.rmtree(item.directory, True)
@@ -599,6 +605,7 @@ class Plugins(Service):
             plugin.get_name() 
             for plugin in self.boss.get_plugins()
         ]
+        list.extend(self.boss.servicemanager.get_lazy_plugins())
         self.set_opt('start_list', list)
 
     def _get_item_markup(self, item):
@@ -12,7 +12,6 @@ from __future__ import with_statement
 import os
 import sys
 from collections import defaultdict
-from functools import partial
 
 import gtk
 
@@ -28,6 +27,7 @@ from pida.core.projects import Project
 from pida.ui.views import WindowConfig
 from pida.core.pdbus import DbusConfig, EXPORT
 from pida.core import environment
+from pida.utils.path import PathTrie, get_relative_path
 
 from pygtkhelpers.gthreads import AsyncTask, gcall
 
@@ -39,6 +39,7 @@ locale = Locale('project')
 _ = locale.gettext
 
 from .views import ProjectListView, ProjectSetupView
+from .refresh import RefreshRun
 
 LEXPORT = EXPORT(suffix='project')
 
@@ -69,7 +70,8 @@ def open_directory_dialog(parent, title, folder=''):
 class ProjectEventsConfig(EventsConfig):
 
     def create(self):
-        self.publish('project_switched', 'loaded')
+        self.publish('project_switched', 'loaded', 'removed',
+                     'index_updated')
 
     def subscribe_all_foreign(self):
         self.subscribe_foreign('editor', 'started',
@@ -79,10 +81,15 @@ class ProjectEventsConfig(EventsConfig):
             self.menu_deactivated)
         self.subscribe_foreign('buffer', 'document-saved',
             self.on_document_saved)
+        self.subscribe_foreign('filewatcher', 'files_changed',
+            self.on_files_changed)
 
     def on_document_saved(self, document):
         self.svc.update_index_file(document.filename)
 
+    def on_files_changed(self, changes):
+        self.svc.update_index_paths([change.path for change in changes])
+
     def editor_started(self):
         self.svc.set_last_project()
 
@@ -194,7 +201,8 @@ class ProjectActionsConfig(ActionsConfig):
             'project_refresh',
             TYPE_NORMAL,
             _('Update Project'),
-            _('Update the project caches'),
+            _('Update the project caches, with Shift the file index is '
+              'rebuilt completely'),
             gtk.STOCK_REFRESH,
             self.on_project_refresh,
         )
@@ -253,7 +261,9 @@ class ProjectActionsConfig(ActionsConfig):
         self._popupmenu.popup(None, None, center, 0, 0)
 
     def on_project_refresh(self, action):
-        self.svc.refresh_project()
+        state = gtk.get_current_event_state()
+        full = state is not None and bool(state & gtk.gdk.SHIFT_MASK)
+        self.svc.refresh_project(full=full)
 
 
 class ProjectWindowConfig(WindowConfig):
@@ -288,11 +298,27 @@ class ProjectFeaturesConfig(FeaturesConfig):
             ProjectWindowConfig)
 
     def do_refresh(self, project, callback):
-        project.indexer.index(recrusive=True, rebuild=True)
+        full = self.svc.take_full_refresh(project)
+        delta = project.indexer.refresh(rescan=full)
         project.indexer.save_cache()
+        # build the quick open search index outside of the main thread
+        project.indexer.search_index
+        self.svc.log.debug('refreshed file index of {project}: {delta!r}',
+                           project=project.name, delta=delta)
+        if delta:
+            gcall(self.svc.emit, 'index_updated', project=project,
+                  delta=delta)
+        if environment.is_debug():
+            entries, total, per_entry = project.indexer.memory_usage()
+            self.svc.log.debug('file index of {project}: {entries} entries, '
+                               '{total} bytes, {per_entry} bytes per entry',
+                               project=project.name, entries=entries,
+                               total=total, per_entry=per_entry)
         callback()
     
     do_refresh.priority = REFRESH_PRIORITY.FILECACHE
+    do_refresh.provides = 'filecache'
+    do_refresh.requires = ()
 
 class ProjectOptions(OptionsConfig):
 
@@ -344,6 +370,14 @@ class ProjectOptions(OptionsConfig):
             workspace=True
         )
 
+        self.create_option(
+            'build_jobs',
+            _('Parallel build actions'),
+            int,
+            1,
+            _('Number of build actions which may run at the same time'),
+        )
+
 class ProjectCommandsConfig(CommandsConfig):
 
     def add_directory(self, project_directory):
@@ -358,6 +392,9 @@ class ProjectCommandsConfig(CommandsConfig):
     def get_project_for_document(self, document):
         return self.svc.get_project_for_document(document)
 
+    def refresh_project(self, full=False):
+        self.svc.refresh_project(full=full)
+
 class ProjectDbusConfig(DbusConfig):
 
     @LEXPORT(in_signature='s')
@@ -391,9 +428,13 @@ class ProjectService(Service):
     def pre_start(self):
         self._current = None
         self._projects = []
+        # the projects by source directory, for get_project_for_document
+        self._project_roots = PathTrie()
 
     def start(self):
         self._update_tasks = {}
+        # projects whose next refresh rebuilds the file index completely
+        self._full_refresh = set()
         self._running_targets = defaultdict(list)
         self.set_current_project(None)
         ###
@@ -498,6 +539,7 @@ class ProjectService(Service):
             return
         if project not in self._projects:
             self._projects.append(project)
+            self._project_roots[project.source_directory] = project
             self.project_list.project_ol.append(project)
         self.emit('loaded', project=project)
         return project
@@ -512,9 +554,12 @@ class ProjectService(Service):
             % project.name
         ):
             self._projects.remove(project)
+            if self._project_roots.get(project.source_directory) is project:
+                del self._project_roots[project.source_directory]
             self.project_list.remove(project)
 
             self._save_options()
+            self.emit('removed', project=project)
             return True
 
     def execute_target(self, action, target, project=None):
@@ -541,6 +586,7 @@ class ProjectService(Service):
                 commandargs=[
                     'python',
                         '-m', 'pida.utils.puilder.execute',
+                        '-j', str(max(self.opt('build_jobs'), 1)),
                         target.name,
                 ],
                 cwd=project.source_directory,
@@ -581,17 +627,19 @@ class ProjectService(Service):
                 view=self.project_properties_view)
 
     def get_project_for_document(self, document):
-        matches = []
-        match = None
-        for project in self._projects:
-            match = project.get_relative_path_for(document.filename)
-            if match is not None:
-                matches.append((project, match))
-        if not matches:
-            return match
-        else:
-            shortest = min(matches, key=lambda x:len(x[1]))
-            return shortest[0], os.sep.join(shortest[1][-3:-1])
+        """
+        Returns the innermost project containing document and the path of
+        its directory inside of it, None if it's in no project
+        """
+        if document.filename is None:
+            return None
+        root, project = self._project_roots.longest_prefix(document.filename)
+        if project is None:
+            return None
+        relative = get_relative_path(root, document.filename)
+        if relative is None:
+            return None
+        return project, os.sep.join(relative[-3:-1])
     
     def get_project_name(self):
         if self._current:
@@ -605,47 +653,74 @@ class ProjectService(Service):
         if self._current:
             self._current.indexer.index_path(path)
 
-    def refresh_project(self):
+    def update_index_paths(self, paths):
+        """
+        Updates the index of the current project for changed paths in the
+        background
+        """
+        project = self._current
+        if project is None:
+            return
+
+        def work():
+            delta = project.indexer.update_paths(paths)
+            if delta:
+                project.indexer.save_cache()
+            return delta
+
+        def done(delta):
+            if delta:
+                self.emit('index_updated', project=project, delta=delta)
+
+        AsyncTask(work, done).start()
+
+    def refresh_project(self, full=False):
         """
         Updates the project cache database
+
+        A refresh requested while one is running starts again once it is
+        done.  A full refresh lists every directory of the file index
+        again, it finds files changed in place while the file watcher was
+        off.
         """
         if not self._current:
             return
-        if self._current in self._update_tasks:
-            self.notify_user(_("Update already running"), title=_("Project"))
+        if full:
+            self._full_refresh.add(self._current)
+        run = self._update_tasks.get(self._current)
+        if run is not None and run.request_again():
+            self.log.debug('refresh of {project} queued',
+                           project=self._current.name)
             return
 
         self.notify_user(_("Update started"), title=_("Project"))
+        self._start_refresh(self._current)
 
-        self._update_tasks[self._current] = AsyncTask(
-                work_callback=self._update_job)
-        self._update_tasks[self._current].start(self._current)
-
-    def _update_job(self, project):
-        not_recalled = self.features['project_refresh'][:]
-
-        for job in self.features['project_refresh']:
-            self.log.debug('Run update job: {job} of project {project_dir}',
-                           job=job,
-                           project_dir=project.source_directory)
-            def do_callback(job):
-                try:
-                    not_recalled.remove(job)
-                except ValueError:
-                    pass
-                if not len(not_recalled):
-                    self.log.debug('Update job done of {project_dir}',
-                                   project_dir=project.source_directory)
-                    gcall(self.notify_user, _("Update complete"), 
-                                           title=_("Project"))
-                    del self._update_tasks[project]
-
-            try:
-                job(project, partial(do_callback, job))
-            except Exception, e:
-                self.log.exception(e)
-                # in case of a exception, we make sure the callback is fired
-                do_callback(job)
+    def take_full_refresh(self, project):
+        """True once if a full refresh of project was requested"""
+        if project in self._full_refresh:
+            self._full_refresh.discard(project)
+            return True
+        return False
+
+    def _start_refresh(self, project):
+        run = self._update_tasks[project] = RefreshRun(
+            project, self.features['project_refresh'],
+            done=lambda run: gcall(self._refresh_done, project, run))
+        run.start()
+
+    def _refresh_done(self, project, run):
+        self.log.debug('refresh of {project} done in {time:.2f}s: {jobs}',
+                       project=project.name, time=run.total_time,
+                       jobs=', '.join('%s %.2fs' % item
+                                      for item in run.report()))
+        if self._update_tasks.get(project) is not run:
+            return
+        if run.again:
+            self._start_refresh(project)
+        else:
+            del self._update_tasks[project]
+            self.notify_user(_("Update complete"), title=_("Project"))
 
 
 
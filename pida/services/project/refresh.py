@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+    Scheduler for the project_refresh jobs
+
+    Jobs are the functions subscribed to project_refresh, called with the
+    project and a callback they call when they are done.  They may declare
+
+    * ``provides``, the name of what they build, e.g. 'filecache'
+    * ``requires``, the names of the jobs they need to be done first
+
+    Jobs without ``requires`` wait for all jobs with a higher priority,
+    like they did when the jobs ran one after another.  All others run
+    at the same time on a few worker threads.
+
+    :copyright: 2005-2010 by The PIDA Project
+    :license: GPL 2 or later (see README/COPYING/LICENSE)
+"""
+
+import time
+import threading
+
+from pida.core.log import Log
+from pida.core.projects import REFRESH_PRIORITY
+
+# jobs started at the same time
+MAX_WORKERS = 4
+
+
+def get_priority(job):
+    return getattr(job, 'priority', REFRESH_PRIORITY.NORMAL)
+
+
+def get_job_name(job):
+    config = getattr(job, 'im_self', None)
+    svc = getattr(config, 'svc', None)
+    if svc is not None:
+        return '%s.%s' % (svc.get_name(), job.__name__)
+    return getattr(job, '__name__', repr(job))
+
+
+def resolve_dependencies(jobs):
+    """Returns a dict of the jobs to the set of jobs they wait for"""
+    provided = {}
+    for job in jobs:
+        name = getattr(job, 'provides', None)
+        if name is not None:
+            provided[name] = job
+    rv = {}
+    for job in jobs:
+        requires = getattr(job, 'requires', None)
+        if requires is None:
+            rv[job] = set(other for other in jobs
+                          if get_priority(other) > get_priority(job))
+        else:
+            rv[job] = set(provided[name] for name in requires
+                          if name in provided)
+    return rv
+
+
+class RefreshRun(Log):
+    """
+    A single refresh of a project.
+
+    `done` is called with the run when all jobs called their callback, in
+    the thread of the last one.  Refreshes requested while it runs are
+    coalesced, see :meth:`request_again`.
+    """
+
+    def __init__(self, project, jobs, done=None, max_workers=MAX_WORKERS):
+        self.project = project
+        self.jobs = list(jobs)
+        self.done = done
+        self.max_workers = max_workers
+        self.dependencies = resolve_dependencies(self.jobs)
+        self.timings = {}
+        self.again = False
+        self.complete = False
+        self._started = {}
+        self._running = set()
+        self._finished = set()
+        self._lock = threading.Lock()
+
+    @property
+    def progress(self):
+        """Tuple of the number of finished jobs and all jobs"""
+        return len(self._finished), len(self.jobs)
+
+    def start(self):
+        self.start_time = time.time()
+        self._schedule()
+
+    def request_again(self):
+        """
+        Ask for another refresh after this one, returns False if the run
+        is already complete
+        """
+        with self._lock:
+            if self.complete:
+                return False
+            self.again = True
+            return True
+
+    def _schedule(self):
+        with self._lock:
+            if self.complete:
+                return
+            ready = []
+            for job in self.jobs:
+                if len(self._running) + len(ready) >= self.max_workers:
+                    break
+                if job not in self._started and \
+                   self.dependencies[job] <= self._finished:
+                    ready.append(job)
+                    self._started[job] = time.time()
+            self._running.update(ready)
+            finished = len(self._finished) == len(self.jobs)
+            if finished:
+                self.complete = True
+                self.total_time = time.time() - self.start_time
+        for job in ready:
+            self.log.debug('start refresh job {job} of {project}',
+                           job=get_job_name(job), project=self.project)
+            thread = threading.Thread(target=self._run_job, args=(job,))
+            thread.daemon = True
+            thread.start()
+        if finished and self.done is not None:
+            self.done(self)
+
+    def _run_job(self, job):
+        called = []
+
+        def callback():
+            if not called:
+                called.append(True)
+                self._job_done(job)
+
+        try:
+            job(self.project, callback)
+        except Exception as e:
+            self.log.exception(e)
+            # make sure the run doesn't hang
+            callback()
+
+    def _job_done(self, job):
+        with self._lock:
+            self._running.discard(job)
+            self._finished.add(job)
+            self.timings[job] = time.time() - self._started[job]
+            done, total = len(self._finished), len(self.jobs)
+        self.log.debug('refresh job {job} of {project} done in {time:.2f}s '
+                       '({done}/{total})', job=get_job_name(job),
+                       project=self.project, time=self.timings[job],
+                       done=done, total=total)
+        self._schedule()
+
+    def report(self):
+        """Returns the timing of every job, slowest first"""
+        return sorted(((get_job_name(job), timing)
+                       for job, timing in self.timings.iteritems()),
+                      key=lambda item: item[1], reverse=True)
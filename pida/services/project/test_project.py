@@ -7,6 +7,8 @@
 import os
 from pida.core.projects import Project
 from .project import ProjectService
+from pida.core.document import Document
+from pida.utils.path import PathTrie
 from pida.utils.testing.mock import Mock
 
 def test_loaded_event():
@@ -18,6 +20,7 @@ def test_loaded_event():
     project_service.start()
     #XXX: mock mimicing the result of project_service.pre_start
     project_service._projects = []
+    project_service._project_roots = PathTrie()
     project_service.project_list = Mock()
     project_service.project_list.project_ol = Mock()
 
@@ -72,6 +75,7 @@ def test_load_project(tmpdir, monkeypatch):
     boss = Mock()
     svc = ProjectService(boss)
     svc._projects = []
+    svc._project_roots = PathTrie()
     svc.log = boss.log
     svc.project_list = boss.project_list
     svc.events = boss.events
@@ -80,5 +84,31 @@ def test_load_project(tmpdir, monkeypatch):
     print svc.log.warn.call_args
     assert svc._projects
     assert svc.events.emit.called
+    assert svc._project_roots[str(tmpdir)] is svc._projects[0]
+
+def test_project_for_document(tmpdir):
+    outer = tmpdir.ensure('outer', dir=True)
+    inner = outer.ensure('lib', 'inner', dir=True)
+    for directory in outer, inner:
+        Project.create_blank_project_file(directory.basename, str(directory))
+    svc = ProjectService(Mock())
+    svc._projects = []
+    svc._project_roots = PathTrie()
+    svc.project_list = Mock()
+    svc.events = Mock()
+    outer_project = svc._load_project(str(outer))
+    inner_project = svc._load_project(str(inner))
+
+    def lookup(*parts):
+        return svc.get_project_for_document(
+            Document(None, str(tmpdir.join(*parts))))
+
+    assert lookup('outer', 'a', 'b', 'c', 'x.py') == (outer_project, 'b/c')
+    assert lookup('outer', 'x.py') == (outer_project, '')
+    # the innermost project wins
+    assert lookup('outer', 'lib', 'inner', 'a', 'x.py') == \
+        (inner_project, 'a')
+    assert lookup('outer2', 'x.py') is None
+    assert svc.get_project_for_document(Document(None)) is None
 
 # vim:set shiftwidth=4 tabstop=4 expandtab textwidth=79:
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+    :copyright: 2005-2010 by The PIDA Project
+    :license: GPL 2 or later (see README/COPYING/LICENSE)
+"""
+import time
+import threading
+
+from pida.core.projects import REFRESH_PRIORITY
+from .refresh import RefreshRun, resolve_dependencies
+
+
+class Recorder(object):
+
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+
+    def job(self, name, priority=REFRESH_PRIORITY.NORMAL, provides=None,
+            requires=None, delay=0.1, fail=False):
+        def job(project, callback):
+            with self.lock:
+                self.events.append(('start', name))
+            time.sleep(delay)
+            with self.lock:
+                self.events.append(('end', name))
+            if fail:
+                raise ValueError(name)
+            callback()
+        job.__name__ = name
+        job.priority = priority
+        if provides is not None:
+            job.provides = provides
+        if requires is not None:
+            job.requires = requires
+        return job
+
+    def done(self, run):
+        self.run = run
+        self.finished.set()
+
+    def index(self, event, name):
+        return self.events.index((event, name))
+
+
+def test_resolve_dependencies():
+    r = Recorder()
+    filecache = r.job('filecache', REFRESH_PRIORITY.FILECACHE,
+                      provides='filecache', requires=())
+    grepper = r.job('grepper', REFRESH_PRIORITY.POST_FILECACHE,
+                    requires=('filecache',))
+    gtags = r.job('gtags', REFRESH_PRIORITY.PRE_FILECACHE, requires=())
+    other = r.job('other', REFRESH_PRIORITY.NORMAL)
+    deps = resolve_dependencies([gtags, filecache, grepper, other])
+    assert deps[filecache] == set()
+    assert deps[gtags] == set()
+    assert deps[grepper] == set([filecache])
+    # undeclared jobs keep waiting for higher priorities
+    assert deps[other] == set([gtags, filecache, grepper])
+
+
+def test_run_concurrent():
+    r = Recorder()
+    jobs = [
+        r.job('gtags', REFRESH_PRIORITY.PRE_FILECACHE, requires=()),
+        r.job('filecache', REFRESH_PRIORITY.FILECACHE,
+              provides='filecache', requires=()),
+        r.job('grepper', REFRESH_PRIORITY.POST_FILECACHE,
+              requires=('filecache',)),
+        r.job('ctags', REFRESH_PRIORITY.POST_FILECACHE,
+              requires=('filecache',)),
+    ]
+    run = RefreshRun('project', jobs, done=r.done)
+    run.start()
+    assert r.finished.wait(5)
+    # independent jobs run at the same time
+    assert r.index('start', 'gtags') < r.index('end', 'filecache')
+    assert r.index('start', 'filecache') < r.index('end', 'gtags')
+    assert r.index('start', 'grepper') < r.index('end', 'ctags')
+    assert r.index('start', 'ctags') < r.index('end', 'grepper')
+    assert r.index('end', 'filecache') < r.index('start', 'grepper')
+    assert r.index('end', 'filecache') < r.index('start', 'ctags')
+    assert run.progress == (4, 4)
+    assert len(run.report()) == 4
+    assert r.run is run
+
+
+def test_run_max_workers():
+    r = Recorder()
+    jobs = [r.job(str(i), requires=()) for i in range(4)]
+    run = RefreshRun('project', jobs, done=r.done, max_workers=2)
+    run.start()
+    assert r.finished.wait(5)
+    first_end = min(r.index('end', '0'), r.index('end', '1'))
+    assert r.index('start', '2') > first_end
+    assert r.index('start', '3') > first_end
+
+
+def test_run_failing_job():
+    r = Recorder()
+    jobs = [
+        r.job('broken', provides='broken', requires=(), fail=True),
+        r.job('after', requires=('broken',)),
+    ]
+    run = RefreshRun('project', jobs, done=r.done)
+    run.start()
+    assert r.finished.wait(5)
+    assert ('end', 'after') in r.events
+
+
+def test_request_again():
+    r = Recorder()
+    run = RefreshRun('project', [r.job('slow', requires=())], done=r.done)
+    run.start()
+    assert run.request_again()
+    assert r.finished.wait(5)
+    assert run.again
+    assert not run.request_again()
+
+
+def test_no_jobs():
+    r = Recorder()
+    run = RefreshRun('project', [], done=r.done)
+    run.start()
+    assert r.finished.is_set()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+    Cached version control states of a workdir
+
+    :copyright: 2005-2010 by The PIDA Project
+    :license: GPL 2 or later (see README/COPYING/LICENSE)
+"""
+
+import os
+import threading
+
+from pida.core.log import Log
+
+
+class StatusCache(Log):
+    """
+    In memory cache of the version control states of a workdir.
+
+    One recursive status of the whole workdir fills the cache, later
+    updates only ask the vcs about the changed paths.  Until the first
+    status has finished the cache is not ready and callers have to ask
+    the workdir directly.
+
+    The blocking methods are meant to be run in a worker thread.
+    """
+
+    def __init__(self, workdir):
+        self.workdir = workdir
+        self.root = workdir.path.strpath
+        self._lock = threading.Lock()
+        # directory -> {basename: state}
+        self._states = {}
+        self.ready = False
+
+    def _collect(self, items, states):
+        for item in items:
+            path = item.abspath
+            states.setdefault(path.dirpath().strpath, {})[path.basename] = \
+                item.state
+
+    def refresh(self):
+        """Run a recursive status of the whole workdir, blocks"""
+        states = {}
+        try:
+            self._collect(self.workdir.status(recursive=True), states)
+        except Exception as err:
+            self.log.error("can't get the status of {root}: {err}",
+                           root=self.root, err=err)
+            return False
+        with self._lock:
+            self._states = states
+            self.ready = True
+        return True
+
+    def update_paths(self, paths):
+        """
+        Ask the vcs for the states of paths and their direct children,
+        blocks
+        """
+        paths = [os.path.normpath(path) for path in paths]
+        states = {}
+        try:
+            self._collect(self.workdir.status(paths=paths, recursive=False),
+                          states)
+        except Exception as err:
+            self.log.error("can't get the status of {paths}: {err}",
+                           paths=paths, err=err)
+            return
+        with self._lock:
+            for path in paths:
+                # forget the old states, deleted paths aren't reported
+                self._states.pop(path, None)
+                dirname, basename = os.path.split(path)
+                self._states.get(dirname, {}).pop(basename, None)
+            for dirname, children in states.iteritems():
+                self._states.setdefault(dirname, {}).update(children)
+
+    def get_state(self, path):
+        """Returns the cached state of path or None"""
+        dirname, basename = os.path.split(os.path.normpath(path))
+        with self._lock:
+            return self._states.get(dirname, {}).get(basename)
+
+    def list_file_states(self, path):
+        """
+        Returns a list of (name, directory, state) tuples for the children
+        of path or None if the cache isn't ready yet
+        """
+        path = os.path.normpath(path)
+        with self._lock:
+            if not self.ready:
+                return None
+            children = self._states.get(path, {})
+            return [(name, path, state)
+                    for name, state in children.iteritems()]
@@ -0,0 +1,66 @@
+from py.path import local
+
+from .statuscache import StatusCache
+
+
+class FakeItem(object):
+    def __init__(self, base, name, state):
+        self.abspath = local(base).join(name)
+        self.state = state
+
+
+class FakeWorkdir(object):
+    def __init__(self, path, states):
+        self.path = local(path)
+        self.states = states
+        self.calls = []
+
+    def status(self, paths=(), recursive=True):
+        self.calls.append((paths, recursive))
+        for name, state in sorted(self.states.items()):
+            item = FakeItem(self.path, name, state)
+            if recursive or any(item.abspath.strpath == path or
+                                item.abspath.dirpath().strpath == path
+                                for path in paths):
+                yield item
+
+
+def make_cache():
+    wd = FakeWorkdir('/repo', {
+        'a.py': 'clean',
+        'b.py': 'modified',
+        'sub': 'clean',
+        'sub/c.py': 'unknown',
+    })
+    return wd, StatusCache(wd)
+
+
+def test_not_ready():
+    wd, cache = make_cache()
+    assert cache.list_file_states('/repo') is None
+
+
+def test_refresh():
+    wd, cache = make_cache()
+    assert cache.refresh()
+    assert sorted(cache.list_file_states('/repo')) == [
+        ('a.py', '/repo', 'clean'),
+        ('b.py', '/repo', 'modified'),
+        ('sub', '/repo', 'clean'),
+    ]
+    assert cache.list_file_states('/repo/sub/') == [
+        ('c.py', '/repo/sub', 'unknown')]
+    assert cache.list_file_states('/repo/other') == []
+    assert wd.calls == [((), True)]
+
+
+def test_update_paths():
+    wd, cache = make_cache()
+    cache.refresh()
+    wd.states['a.py'] = 'modified'
+    del wd.states['b.py']
+    cache.update_paths(['/repo/a.py', '/repo/b.py'])
+    assert wd.calls[-1] == (['/repo/a.py', '/repo/b.py'], False)
+    assert cache.get_state('/repo/a.py') == 'modified'
+    assert cache.get_state('/repo/b.py') is None
+    assert cache.get_state('/repo/sub/c.py') == 'unknown'
@@ -0,0 +1,80 @@
+from py.path import local
+
+from .workdirs import WorkdirCache
+
+
+class FakeWorkdir(object):
+    def __init__(self, path):
+        self.path = local(path)
+
+
+class Opener(object):
+    """Opens workdirs at directories with a .hg directory"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, path):
+        self.calls.append(path)
+        for part in local(path).parts(reverse=True):
+            if part.join('.hg').check(dir=1):
+                return FakeWorkdir(part)
+
+
+def test_cached(tmpdir):
+    tmpdir.ensure('repo/.hg', dir=1)
+    tmpdir.ensure('repo/a/b', dir=1)
+    opener = Opener()
+    cache = WorkdirCache(opener)
+    repo = tmpdir.join('repo').strpath
+    wd = cache.get(tmpdir.join('repo/a/b').strpath)
+    assert wd.path.strpath == repo
+    assert cache.get(tmpdir.join('repo/a/file.py').strpath) is wd
+    assert cache.get(repo) is wd
+    assert len(opener.calls) == 1
+    assert cache.roots() == [repo]
+
+
+def test_unversioned(tmpdir):
+    opener = Opener()
+    cache = WorkdirCache(opener)
+    assert cache.get(tmpdir.strpath) is None
+    assert cache.get(tmpdir.strpath) is None
+    assert len(opener.calls) == 1
+    tmpdir.ensure('.hg', dir=1)
+    cache.on_path_changed(tmpdir.join('.hg').strpath)
+    assert cache.get_root(tmpdir.strpath) == tmpdir.strpath
+
+
+def test_vanished(tmpdir):
+    tmpdir.ensure('repo/.hg', dir=1)
+    tmpdir.ensure('repo/sub/.hg', dir=1)
+    opener = Opener()
+    cache = WorkdirCache(opener)
+    sub = tmpdir.join('repo/sub')
+    cache.get(tmpdir.join('repo').strpath)
+    cache.on_path_changed(sub.join('.hg').strpath)
+    assert cache.get_root(sub.join('x.py').strpath) == sub.strpath
+    sub.join('.hg').remove()
+    cache.on_path_changed(sub.join('.hg').strpath)
+    assert cache.get_root(sub.join('x.py').strpath) == \
+        tmpdir.join('repo').strpath
+
+
+def test_nested(tmpdir):
+    tmpdir.ensure('repo/.hg', dir=1)
+    tmpdir.ensure('repo/lib/sub/.hg', dir=1)
+    tmpdir.ensure('repo/lib/sub/pkg', dir=1)
+    opener = Opener()
+    cache = WorkdirCache(opener)
+    repo = tmpdir.join('repo').strpath
+    sub = tmpdir.join('repo/lib/sub').strpath
+    assert cache.get_root(tmpdir.join('repo/x.py').strpath) == repo
+    assert cache.get_root(tmpdir.join('repo/lib/sub/pkg/y.py').strpath) == sub
+    assert cache.get_root(tmpdir.join('repo/lib/z.py').strpath) == repo
+    assert len(opener.calls) == 2
+    # checked directories aren't probed again
+    assert cache.get_root(tmpdir.join('repo/lib/sub/pkg/a.py').strpath) == sub
+    assert cache.get_root(tmpdir.join('repo/lib/b.py').strpath) == repo
+    assert len(opener.calls) == 2
+    assert sorted(cache.roots()) == [repo, sub]
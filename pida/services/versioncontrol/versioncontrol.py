@@ -5,6 +5,7 @@
 """
 
 import gtk
+import gobject
 
 # PIDA Imports
 from pida.core.service import Service
@@ -12,6 +13,8 @@ from pida.core.features import FeaturesConfig
 from pida.core.commands import CommandsConfig
 from pida.core.events import EventsConfig
 from pida.core.actions import ActionsConfig
+from pida.core.projects import REFRESH_PRIORITY
+from pida.utils.path import PathTrie
 
 from pida.ui.views import WindowConfig
 from pida.ui.actions import PidaRememberToggle
@@ -32,6 +35,8 @@ from .views import (
     CommitViewer,
     DiffViewer,
 )
+from .statuscache import StatusCache
+from .workdirs import WorkdirCache
 
 try:
     from anyvc import workdir
@@ -66,6 +71,19 @@ class VersioncontrolFeaturesConfig(FeaturesConfig):
             VersioncontrolCommitWindowConfig)
         self.subscribe_foreign('window', 'window-config',
             VersioncontrolLogWindowConfig)
+        self.subscribe_foreign('project', 'project_refresh',
+            self.do_refresh)
+
+    def do_refresh(self, project, callback):
+        self.svc.workdirs.invalidate(project.source_directory)
+        cache = self.svc.get_status_cache(project.source_directory)
+        if cache is not None:
+            cache.refresh()
+        callback()
+
+    do_refresh.priority = REFRESH_PRIORITY.NORMAL
+    # only drops cached states, it doesn't need the file index
+    do_refresh.requires = ()
 
     @filehiddencheck.fhc(filehiddencheck.SCOPE_GLOBAL,
         _("Hide Ignored Files by Version Control"))
@@ -80,6 +98,10 @@ class VersionControlEvents(EventsConfig):
             self.svc.on_document_changed)
         self.subscribe_foreign('project', 'project_switched',
             self.svc.on_project_changed)
+        self.subscribe_foreign('buffer', 'document-saved',
+            self.svc.on_document_saved)
+        self.subscribe_foreign('filewatcher', 'files_changed',
+            self.svc.on_files_changed)
         self.subscribe_foreign('contexts', 'show-menu',
             self.on_contexts__show_menu)
         self.subscribe_foreign('contexts', 'menu-deactivated',
@@ -90,12 +112,12 @@ class VersionControlEvents(EventsConfig):
         if (context == 'file-menu'):
             path = kw['file_name']
             if path is not None:
-                under_vc = workdir.open(path) is not None
+                under_vc = self.svc.get_workdir(path) is not None
             self.svc.get_action('diff_for_file').set_visible(under_vc)
             self.svc.get_action('revert_for_file').set_visible(under_vc)
         elif (context == 'dir-menu'):
             path = kw['dir_name']
-            under_vc = workdir.open(path) is not None
+            under_vc = self.svc.get_workdir(path) is not None
             self.svc.get_action('diff_for_directory').set_visible(under_vc)
             self.svc.get_action('revert_for_dir').set_visible(under_vc)
         self.svc.get_action('more_vc_menu').set_visible(under_vc)
@@ -107,7 +129,7 @@ class VersionControlEvents(EventsConfig):
 class VersioncontrolCommandsConfig(CommandsConfig):
 
     def get_workdirmanager(self, path):
-        return workdir.open(path)
+        return self.svc.get_workdir(path)
 
     def list_file_states(self, path):
         return self.svc.list_file_states(path)
@@ -453,7 +475,14 @@ class Versioncontrol(Service):
     actions_config = VersionControlActions
     events_config = VersionControlEvents
 
+    # seconds to collect changed files before asking the vcs about them
+    STATUS_UPDATE_DELAY = 0.5
+
     def pre_start(self):
+        self.workdirs = WorkdirCache(workdir.open)
+        self._status_caches = PathTrie()
+        self._pending_paths = set()
+        self._pending_source = None
         self.on_document_changed(None)
         self.on_project_changed(None)
 
@@ -475,8 +504,77 @@ class Versioncontrol(Service):
     def ignored_file_checker(self, path, name, state):
         return not (state == "hidden" or state == "ignored")
 
+    def get_status_cache(self, path):
+        """
+        Returns the status cache of the workdir containing path or None
+        """
+        root, cache = self._status_caches.longest_prefix(path)
+        return cache
+
+    def get_workdir(self, path):
+        """
+        Returns the workdir containing path or None, known workdirs are
+        answered without touching the filesystem
+        """
+        return self.workdirs.get(path)
+
+    def refresh_status(self, path):
+        """
+        Refresh the status cache of the workdir containing path in the
+        background, creates the cache if needed
+        """
+        cache = self.get_status_cache(path)
+
+        def work():
+            if cache is not None:
+                cache.refresh()
+                return cache
+            wd = self.get_workdir(path)
+            if wd is None:
+                return None
+            new_cache = StatusCache(wd)
+            new_cache.refresh()
+            return new_cache
+
+        def done(new_cache):
+            if new_cache is not None and \
+               new_cache.root not in self._status_caches:
+                self._status_caches[new_cache.root] = new_cache
+
+        AsyncTask(work, done).start()
+
+    def update_status(self, paths):
+        """
+        Update the cached states of paths, changes are collected for a
+        moment so bursts of them only cost one status call
+        """
+        self._pending_paths.update(paths)
+        if self._pending_source is None:
+            self._pending_source = gobject.timeout_add(
+                int(self.STATUS_UPDATE_DELAY * 1000), self._flush_status)
+
+    def _flush_status(self):
+        self._pending_source = None
+        by_cache = {}
+        for path in self._pending_paths:
+            cache = self.get_status_cache(path)
+            if cache is not None:
+                by_cache.setdefault(cache, []).append(path)
+        self._pending_paths.clear()
+        for cache, paths in by_cache.iteritems():
+            AsyncTask(cache.update_paths).start(paths)
+        return False
+
     def list_file_states(self, path):
-        wd = workdir.open(path)
+        cache = self.get_status_cache(path)
+        if cache is not None:
+            states = cache.list_file_states(path)
+            if states is not None:
+                for item in states:
+                    yield item
+                return
+
+        wd = self.get_workdir(path)
 
         if wd is not None:
             for item in wd.status(paths=[path], recursive=False):
@@ -489,7 +587,7 @@ class Versioncontrol(Service):
         task.start(path)
 
     def _do_diff(self, path):
-        vc = workdir.open(path)
+        vc = self.get_workdir(path)
         if vc is None:
             return (None,)
         return vc.diff(paths=[path])
@@ -502,7 +600,7 @@ class Versioncontrol(Service):
         view.set_diff(diff)
 
     def execute(self, action, path, stock_id, **kw):
-        vc = workdir.open(path)
+        vc = self.get_workdir(path)
         if vc is None:
             return self.error_dlg(_('File or directory is not versioned.'))
         self._log.append_action(action.capitalize(), path, stock_id)
@@ -519,6 +617,7 @@ class Versioncontrol(Service):
                 },
                 data=path,
                 stock=stock_id)
+            self.refresh_status(path)
             self.boss.cmd('filemanager', 'refresh')
         AsyncTask(do, done).start()
 
@@ -529,7 +628,7 @@ class Versioncontrol(Service):
         self.execute('commit', path, gtk.STOCK_GO_UP, message=message)
 
     def commit_path_dialog(self, path):
-        vc = workdir.open(path)
+        vc = self.get_workdir(path)
         if vc is None:
             return self.error_dlg(_('File or directory is not versioned.'))
         self._commit.set_path(path)
@@ -550,11 +649,23 @@ class Versioncontrol(Service):
             self.get_action(action).set_sensitive(document is not None)
         self.current_document = document
 
+    def on_document_saved(self, document):
+        if document.filename:
+            self.update_status([document.filename])
+
+    def on_files_changed(self, changes):
+        for change in changes:
+            self.workdirs.on_path_changed(change.path)
+        self.update_status(change.path for change in changes)
+
     def on_project_changed(self, project):
         for action  in ['diff_project', 'revert_project', 'update_project',
         'commit_project']:
             self.get_action(action).set_sensitive(project is not None)
         self.current_project = project
+        if project is not None and \
+           self.get_status_cache(project.source_directory) is None:
+            self.refresh_status(project.source_directory)
 
     def show_log(self):
         self.boss.cmd('window', 'add_view', paned='Terminal', view=self._log)
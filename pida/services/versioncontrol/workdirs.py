@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+    Cache of the anyvc workdir handles
+
+    :copyright: 2005-2010 by The PIDA Project
+    :license: GPL 2 or later (see README/COPYING/LICENSE)
+"""
+
+import os
+import threading
+
+from pida.utils.path import PathTrie
+
+# directories whose appearance or removal may create or delete a workdir
+METADATA_DIRS = frozenset(['.git', '.hg', '.svn', '.bzr', '_darcs'])
+
+
+class WorkdirCache(object):
+    """
+    Remembers the workdirs opened so far by their root.
+
+    A path below a known root is answered from memory once the directories
+    between the root and the path were checked for nested repositories or
+    submodules, only paths outside of all known roots have to be probed by
+    the opener once.  Paths which aren't under version control are
+    remembered as well until :meth:`invalidate` is called.
+
+    :param opener: callable returning the workdir of a path or None,
+                   usually anyvc's workdir.open
+    """
+
+    def __init__(self, opener):
+        self.opener = opener
+        self._lock = threading.Lock()
+        self._roots = PathTrie()
+        self._unversioned = set()
+        # directories below a root checked for metadata of nested workdirs
+        self._checked = set()
+
+    def get(self, path):
+        """Returns the workdir containing path or None"""
+        path = os.path.normpath(path)
+        with self._lock:
+            root, outer = self._roots.longest_prefix(path)
+            if outer is None and path in self._unversioned:
+                return None
+        if outer is not None and not self._has_nested(root, path):
+            return outer
+        wd = self.opener(path)
+        if wd is None:
+            if outer is not None:
+                return outer
+            with self._lock:
+                self._unversioned.add(path)
+            return None
+        return self._add(wd)
+
+    def _has_nested(self, root, path):
+        """
+        If one of the directories between root and path which weren't
+        checked yet holds version control metadata
+        """
+        found = False
+        current = root
+        for part in path[len(root):].split(os.sep):
+            if not part:
+                continue
+            current = os.path.join(current, part)
+            with self._lock:
+                if current in self._checked:
+                    continue
+                self._checked.add(current)
+            if any(os.path.exists(os.path.join(current, name))
+                   for name in METADATA_DIRS):
+                found = True
+        return found
+
+    def _add(self, wd):
+        with self._lock:
+            root = wd.path.strpath
+            # keep the handle we already have for this root
+            if root in self._roots:
+                return self._roots[root]
+            self._roots[root] = wd
+            # paths below the new root may have been probed before it
+            # appeared
+            self._unversioned = set(
+                p for p in self._unversioned
+                if not (p == root or p.startswith(root + os.sep)))
+            return wd
+
+    def get_root(self, path):
+        """Returns the root of the workdir containing path or None"""
+        wd = self.get(path)
+        if wd is not None:
+            return wd.path.strpath
+
+    def roots(self):
+        with self._lock:
+            return [root for root, wd in self._roots.items()]
+
+    def invalidate(self, path=None):
+        """
+        Forget the unversioned paths and the workdirs whose metadata
+        vanished, below path or everywhere if path is None
+        """
+        with self._lock:
+            if path is None:
+                self._unversioned.clear()
+                self._checked.clear()
+                roots = self._roots.items()
+            else:
+                path = os.path.normpath(path)
+                prefix = path + os.sep
+                self._unversioned = set(
+                    p for p in self._unversioned
+                    if not (p == path or p.startswith(prefix)))
+                self._checked = set(
+                    p for p in self._checked
+                    if not (p == path or p.startswith(prefix)))
+                roots = [(root, wd) for root, wd in self._roots.items()
+                         if root == path or root.startswith(prefix)]
+            for root, wd in roots:
+                if not any(os.path.exists(os.path.join(root, name))
+                           for name in METADATA_DIRS):
+                    del self._roots[root]
+
+    def on_path_changed(self, path):
+        """
+        Called for changed files, invalidates if version control metadata
+        appeared or vanished
+        """
+        dirname, basename = os.path.split(os.path.normpath(path))
+        if basename not in METADATA_DIRS:
+            return
+        self.invalidate(dirname)
+        if os.path.exists(path):
+            # a new workdir, maybe nested in a known one
+            wd = self.opener(dirname)
+            if wd is not None:
+                self._add(wd)
@@ -72,7 +72,7 @@ class ActionWindowMapping(list):
         self._actions[config.key] = act
         self.svc.actions.set_value(keya, curshort)
         # make the shortcuts update to reflect change
-        self.svc.boss.get_service('shortcuts').update()
+        self._update_shortcuts()
 
     def remove(self, config):
         """Unregister a WindowConfig"""
@@ -83,7 +83,12 @@ class ActionWindowMapping(list):
         opt = self.svc.actions.get_option(self._genkey(config.key))
         self.svc.actions.remove_option(opt)
         #self.remove(config)
-        self.svc.boss.get_service('shortcuts').update()
+        self._update_shortcuts()
+
+    def _update_shortcuts(self):
+        # a lazy shortcuts service reads all actions once it gets activated
+        if self.svc.boss.servicemanager.is_activated('shortcuts'):
+            self.svc.boss.get_service('shortcuts').update()
 
 
 class WindowCommandsConfig(CommandsConfig):
@@ -400,6 +405,7 @@ class Window(Service):
     def pre_start(self):
         self._title_template = None
         self._last_focus = None
+        self._lazy_state = {}
         super(Window, self).pre_start()
         self.update_colors()
         self.restore_state(pre=True)
@@ -460,6 +466,10 @@ class Window(Service):
                     pass
             return
 
+        # keep the state of the lazy services until they get activated
+        self._lazy_state = data
+        self.boss.servicemanager.activate_views(data)
+
         for service in self.boss.get_services():
             name = service.get_name()
             info = data.get(name, {})
@@ -494,6 +504,9 @@ class Window(Service):
                     cur[action.get_name()] = action.props.active
             if cur:
                 data[service.get_name()] = cur
+        for name in self.boss.servicemanager.get_lazy_names():
+            if name in self._lazy_state:
+                data[name] = self._lazy_state[name]
 
         try:
             json.dump(data, self.state_config)
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+    Least recently used cache
+
+    :copyright: 2005-2010 by The PIDA Project
+    :license: GPL 2 or later (see README/COPYING/LICENSE)
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    Mapping which keeps only the `size` most recently used items.
+
+    It is safe to use from several threads.
+    """
+
+    def __init__(self, size=1024):
+        self.size = size
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def __getitem__(self, key):
+        with self._lock:
+            value = self._data.pop(key)
+            # move it to the end, the most recently used
+            self._data[key] = value
+            return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            if len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
@@ -68,6 +68,111 @@ def get_line_from_file(file_name, line=None, offset=None):
     else:
         raise ValueError('At least one of line or offset must be set')
 
+class PathTrie(object):
+    """
+    Maps absolute paths to values.
+
+    Finding the value of the longest known prefix of a path only walks
+    the components of that path, no matter how many paths are known.
+    """
+
+    # key of the value in a node, path components are never None
+    _VALUE = None
+
+    def __init__(self):
+        self._root = {}
+        self._len = 0
+
+    @staticmethod
+    def _parts(path):
+        return [part for part in os.path.normpath(path).split(os.sep) if part]
+
+    def _find(self, path):
+        node = self._root
+        for part in self._parts(path):
+            node = node.get(part)
+            if node is None:
+                return None
+        return node
+
+    def __len__(self):
+        return self._len
+
+    def __contains__(self, path):
+        node = self._find(path)
+        return node is not None and self._VALUE in node
+
+    def __getitem__(self, path):
+        node = self._find(path)
+        if node is None or self._VALUE not in node:
+            raise KeyError(path)
+        return node[self._VALUE]
+
+    def __setitem__(self, path, value):
+        node = self._root
+        for part in self._parts(path):
+            node = node.setdefault(part, {})
+        if self._VALUE not in node:
+            self._len += 1
+        node[self._VALUE] = value
+
+    def __delitem__(self, path):
+        parts = self._parts(path)
+        nodes = [self._root]
+        for part in parts:
+            node = nodes[-1].get(part)
+            if node is None:
+                raise KeyError(path)
+            nodes.append(node)
+        if self._VALUE not in nodes[-1]:
+            raise KeyError(path)
+        del nodes[-1][self._VALUE]
+        self._len -= 1
+        # drop the nodes which lead nowhere now
+        for i in xrange(len(parts), 0, -1):
+            if nodes[i]:
+                break
+            del nodes[i - 1][parts[i - 1]]
+
+    def get(self, path, default=None):
+        try:
+            return self[path]
+        except KeyError:
+            return default
+
+    def longest_prefix(self, path):
+        """
+        Returns (prefix, value) for the longest known path that is path
+        itself or one of its parents, (None, None) if there is none
+        """
+        node = self._root
+        found = None, None
+        current = os.sep
+        if self._VALUE in node:
+            found = current, node[self._VALUE]
+        for part in self._parts(path):
+            node = node.get(part)
+            if node is None:
+                break
+            current = os.path.join(current, part)
+            if self._VALUE in node:
+                found = current, node[self._VALUE]
+        return found
+
+    def items(self):
+        """Returns a list of all (path, value) pairs"""
+        result = []
+        stack = [(os.sep, self._root)]
+        while stack:
+            path, node = stack.pop()
+            for part, child in node.iteritems():
+                if part is self._VALUE:
+                    result.append((path, child))
+                else:
+                    stack.append((os.path.join(path, part), child))
+        return result
+
+
 if __name__ == '__main__':
     print get_relative_path('/a/b/c/d', '/a/b/c1/d1')
     print get_relative_path('/a/b/c/d', '/a/b/c/d/e/f')
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+    Up to date checks for puilder targets
+
+    Targets which declare their inputs are fingerprinted before they run,
+    together with all targets they use.  When the fingerprint matches the
+    one of the last successful run and all outputs exist, the target is
+    skipped and its output replayed.  Targets using a target without
+    inputs always run.
+
+    :copyright: 2005-2010 by The PIDA Project
+    :license: GPL 2 or later (see README/COPYING/LICENSE)
+"""
+
+import os
+import re
+import glob
+import hashlib
+import threading
+from json import dumps
+
+import py
+
+from pida.core.projects import Project
+from pida.utils import json
+
+
+def translate_glob(pattern):
+    """
+    Returns a regex for a glob pattern of slash separated paths, `*` and
+    `?` don't match a slash, `**/` matches any number of directories
+    """
+    i, n = 0, len(pattern)
+    rv = []
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            rv.append('(?:.*/)?')
+            i += 3
+            continue
+        elif pattern.startswith('**', i):
+            rv.append('.*')
+            i += 2
+            continue
+        elif c == '*':
+            rv.append('[^/]*')
+        elif c == '?':
+            rv.append('[^/]')
+        elif c == '[':
+            end = pattern.find(']', i + 2 if pattern[i + 1:i + 2] in '!]'
+                               else i + 1)
+            if end == -1:
+                rv.append(re.escape(c))
+            else:
+                chars = pattern[i + 1:end].replace('\\', '\\\\')
+                if chars.startswith('!'):
+                    chars = '^' + chars[1:]
+                rv.append('[%s]' % chars)
+                i = end
+        else:
+            rv.append(re.escape(c))
+        i += 1
+    return r'%s\Z' % ''.join(rv)
+
+
+def expand_inputs(directory, patterns):
+    """
+    Returns the sorted relative paths of the files below directory which
+    match one of the glob patterns, `**` matches any number of
+    directories
+    """
+    found = set()
+    for pattern in patterns:
+        if '**' in pattern:
+            regex = re.compile(translate_glob(pattern))
+            base = pattern.split('**', 1)[0]
+            top = os.path.join(directory, os.path.dirname(base))
+            for path, dirs, files in os.walk(top):
+                for name in files:
+                    relpath = os.path.relpath(os.path.join(path, name),
+                                              directory)
+                    if regex.match(relpath.replace(os.sep, '/')):
+                        found.add(relpath)
+        else:
+            for path in glob.glob(os.path.join(directory, pattern)):
+                if os.path.isfile(path):
+                    found.add(os.path.relpath(path, directory))
+    return sorted(found)
+
+
+def used_targets(build, target, seen=None):
+    """Returns target and all targets it uses, each once"""
+    if seen is None:
+        seen = set()
+    seen.add(target.name)
+    rv = [target]
+    for action in target.actions:
+        if action.type == 'target' and action.value not in seen:
+            for other in build.targets:
+                if other.name == action.value:
+                    rv.extend(used_targets(build, other, seen))
+                    break
+    return rv
+
+
+class BuildCache(object):
+    """
+    Fingerprints and output of the last successful run of the targets of
+    a project, kept in its meta dir.
+    """
+
+    def __init__(self, project_directory):
+        self.project_directory = project_directory
+        self.path = py.path.local(Project.data_dir_path(project_directory,
+                                                        'puilder',
+                                                        'cache.json'))
+        self.entries = json.load(self.path, fallback={})
+        self._lock = threading.Lock()
+
+    def fingerprint(self, build, target):
+        """
+        Returns the fingerprint of target, made from the actions and the
+        mtime and size of the inputs of target and all targets it uses.
+        None if one of them declares no inputs, target always runs then.
+        """
+        targets = used_targets(build, target)
+        if not all(used.inputs for used in targets):
+            return None
+        h = hashlib.sha1()
+        h.update(dumps([used.for_serialize() for used in targets],
+                       sort_keys=True))
+        for used in targets:
+            h.update('%s\0' % used.name)
+            for relpath in expand_inputs(self.project_directory,
+                                         used.inputs):
+                path = os.path.join(self.project_directory, relpath)
+                st = os.stat(path)
+                h.update('%s\0%r\0%d\0' % (relpath, st.st_mtime,
+                                             st.st_size))
+                if used.hash_inputs:
+                    with open(path, 'rb') as fp:
+                        h.update(hashlib.sha1(fp.read()).hexdigest())
+        return h.hexdigest()
+
+    def get_output(self, build, target, key):
+        """
+        Returns the cached output of target if it is up to date with the
+        fingerprint key and the outputs of target and all targets it uses
+        exist, otherwise None
+        """
+        entry = self.entries.get(target.name)
+        if key is None or entry is None or entry['key'] != key:
+            return None
+        for used in used_targets(build, target):
+            for output in used.outputs:
+                if not os.path.exists(os.path.join(self.project_directory,
+                                                   output)):
+                    return None
+        return entry['output']
+
+    def store(self, target, key, output):
+        """Remember a successful run of target"""
+        with self._lock:
+            self.entries[target.name] = {
+                'key': key,
+                'output': [unicode(data, 'utf-8', 'replace')
+                           if isinstance(data, str) else data
+                           for data in output],
+            }
+            Project.create_data_dir(self.project_directory, 'puilder')
+            json.dump(self.entries, self.path)
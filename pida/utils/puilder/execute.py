@@ -6,6 +6,8 @@
 
 
 import os, sys, traceback
+import threading
+from Queue import Queue
 from subprocess import Popen, PIPE, STDOUT
 from StringIO import StringIO
 from optparse import OptionParser
@@ -18,6 +20,7 @@ except ImportError:
 from pida.core.projects import Project
 
 from .model import Build
+from .cache import BuildCache, used_targets
 
 
 
@@ -58,16 +61,56 @@ class OutputBuffer(StringIO):
         return ''.join([repr(x) for x in self.buflist])
 
 
-def proc_communicate(proc, stdin=None, stdout=None, stderr=None):
+# serializes the output of actions running at the same time
+_output_lock = threading.Lock()
+
+
+class PrefixWriter(object):
+    """
+    File-like object which writes every line to stream with a prefix.
+    Used to tell apart the output of actions running at the same time,
+    incomplete lines are kept until they are finished or flushed.
+    """
+
+    def __init__(self, stream, prefix):
+        self.stream = stream
+        self.prefix = prefix
+        self._partial = ''
+
+    def write(self, data):
+        lines = (self._partial + data).split('\n')
+        self._partial = lines.pop()
+        if lines:
+            with _output_lock:
+                for line in lines:
+                    self.stream.write('%s%s\n' % (self.prefix, line))
+                self.stream.flush()
+
+    def flush(self):
+        if self._partial:
+            with _output_lock:
+                self.stream.write('%s%s\n' % (self.prefix, self._partial))
+                self.stream.flush()
+            self._partial = ''
+
+
+def proc_communicate(proc, stdin=None, stdout=None, stderr=None,
+                     streams=None):
     """
     Run the given process, piping input/output/errors to the given
     file-like objects (which need not be actual file objects, unlike
     the arguments passed to Popen).  Wait for process to terminate.
 
+    The output is echoed to the streams pair, sys.stdout and sys.stderr
+    by default.
+
     Note: this is taken from the posix version of
     subprocess.Popen.communicate, but made more general through the
     use of file-like objects.
     """
+    if streams is None:
+        streams = sys.stdout, sys.stderr
+    echo_out, echo_err = streams
     read_set = []
     write_set = []
     input_buffer = ''
@@ -118,8 +161,8 @@ def proc_communicate(proc, stdin=None, stdout=None, stderr=None):
                 read_set.remove(proc.stdout)
             if trans_nl:
                 data = proc._translate_newlines(data)
-            sys.stdout.write(data)
-            sys.stdout.flush()
+            echo_out.write(data)
+            echo_out.flush()
             stdout.write(data, fd=STDOUT)
 
         if proc.stderr in rlist:
@@ -129,8 +172,8 @@ def proc_communicate(proc, stdin=None, stdout=None, stderr=None):
                 read_set.remove(proc.stderr)
             if trans_nl:
                 data = proc._translate_newlines(data)
-            sys.stderr.write(data)
-            sys.stderr.flush()
+            echo_err.write(data)
+            echo_err.flush()
             stderr.write(data, fd=STDERR)
 
     try:
@@ -141,7 +184,7 @@ def proc_communicate(proc, stdin=None, stdout=None, stderr=None):
 
 
 
-def _execute_external(cmd, cwd):
+def _execute_external(cmd, cwd, streams=None):
 
     buffer = OutputBuffer()
 
@@ -152,7 +195,8 @@ def _execute_external(cmd, cwd):
         proc_communicate(
             proc,
             stdout=buffer,
-            stderr=buffer)
+            stderr=buffer,
+            streams=streams)
         #print buffer.dump()
         #print buffer.getvalue()
 
@@ -166,11 +210,11 @@ def _execute_external(cmd, cwd):
     return buffer, proc.returncode
 
 
-def execute_shell_action(project, build, action):
+def execute_shell_action(project, build, action, streams=None):
     """Execute a shell action"""
     cwd = action.options.get('cwd', project)
     cmd = action.value
-    output, returncode = _execute_external(cmd, cwd)
+    output, returncode = _execute_external(cmd, cwd, streams)
     return output, not returncode
 
 
@@ -183,24 +227,30 @@ def _execute_python(source_directory, build, value):
     }
     exec code in elocals, globals()
 
-def execute_python_action(project, build, action):
+# sys.stdout is swapped while a python action runs
+_python_lock = threading.Lock()
+
+def execute_python_action(project, build, action, streams=None):
     """Execute a python action"""
     s = StringIO()
-    oldout = sys.stdout
-    sys.stdout = s
-    try:
-        _execute_python(project, build, action.value)
-        success = True
-    except Exception, e:
-        traceback.print_exc(file=s)
-        success = False
+    with _python_lock:
+        oldout = sys.stdout
+        sys.stdout = s
+        try:
+            _execute_python(project, build, action.value)
+            success = True
+        except Exception, e:
+            traceback.print_exc(file=s)
+            success = False
+        finally:
+            sys.stdout = oldout
     s.seek(0)
     data = s.read()
-    sys.stdout = oldout
-    sys.stdout.write(data)
+    out = streams[0] if streams is not None else sys.stdout
+    out.write(data)
     return data, success
 
-def execute_external_action(project, build, action):
+def execute_external_action(project, build, action, streams=None):
     """Execute an external action"""
     cmd = '%s %s %s' % (
         action.options.get('system', 'make'),
@@ -208,7 +258,7 @@ def execute_external_action(project, build, action):
         action.value,
     )
     cwd = action.options.get('cwd', project)
-    data, returncode = _execute_external(cmd, cwd)
+    data, returncode = _execute_external(cmd, cwd, streams)
     return data, not returncode
 
 
@@ -292,40 +342,267 @@ def generate_execution_graph(build, target_name):
     return root
 
 
-def execute_action(build, action, project_directory):
-    return executors[action.type](project_directory, build, action)
+class BuildJob(object):
+    """
+    A single action of a target in the dependency graph of a build.
+    It can run as soon as all jobs in `dependencies` are finished.
+    """
 
+    def __init__(self, target, action, dependencies):
+        self.target = target
+        self.action = action
+        self.dependencies = set(dependencies)
+        self.dependents = []
+        for job in self.dependencies:
+            job.dependents.append(self)
 
-def execute_build(build, target_name, project_directory=None):
-    graph = generate_execution_graph(build, target_name)
-    for action in graph.actions:
-        if isinstance(action, CircularAction):
-            _info('--', 'Warning: Circular action ignored: %s' % action.target.name, '--')
+    def __repr__(self):
+        return '<BuildJob %s %r>' % (self.target.name, self.action)
+
+
+def generate_job_graph(build, target_name, cached=None):
+    """
+    Returns the jobs needed to build target_name in the order they would
+    run one after another, linked to the jobs they wait for.
+
+    Consecutive target actions of a target don't depend on each other, a
+    plain action waits for everything before it in its target.  Every
+    target is only built once, circular targets are ignored like in the
+    execution tree.
+
+    `cached` is called with every target before its jobs are generated,
+    if it returns True the target is left out.
+    """
+    jobs = []
+    finished = {}
+    circular = []
+
+    def visit(target, after, stack):
+        if target.name in finished:
+            return finished[target.name]
+        if target.name in stack:
+            circular.append(CircularAction(target))
+            return set()
+        if cached is not None and cached(target):
+            finished[target.name] = set(after)
+            return finished[target.name]
+        stack.append(target.name)
+        last = set(after)
+        pending = set()
+        for action in target.actions:
+            if action.type == 'target':
+                pending |= visit(_get_target(build, action.value), last,
+                                 stack)
+            else:
+                job = BuildJob(target, action, last | pending)
+                jobs.append(job)
+                last = set([job])
+                pending = set()
+        stack.pop()
+        finished[target.name] = last | pending
+        return finished[target.name]
+
+    visit(_get_target(build, target_name), set(), [])
+    return jobs, circular
+
+
+def execute_action(build, action, project_directory, streams=None):
+    return executors[action.type](project_directory, build, action,
+                                  streams=streams)
+
+
+def _result_text(result):
+    if hasattr(result, 'getvalue'):
+        return result.getvalue()
+    return result
+
+
+def _replay(output, stream):
+    """Writes the cached output of a target and returns it as result"""
+    buffer = OutputBuffer()
+    for data in output:
+        data = data.encode('utf-8') if isinstance(data, unicode) else data
+        stream.write(data)
+        buffer.write(data)
+    stream.flush()
+    return buffer
+
+
+def _execute_job(build, job, project_directory, streams, results):
+    try:
+        result, success = execute_action(build, job.action,
+                                          project_directory, streams)
+    except Exception:
+        result = traceback.format_exc()
+        streams[1].write(result)
+        success = False
+    for stream in streams:
+        if isinstance(stream, PrefixWriter):
+            stream.flush()
+    results.put((job, result, success))
+
+
+def execute_jobs(build, target_name, project_directory=None, jobs=2,
+                 cache=None):
+    """
+    Execute the job graph of target_name, running up to `jobs` actions
+    whose dependencies are done at the same time.  The output of every
+    action is prefixed with its target name.  Results are yielded as the
+    actions finish.
+
+    After an action failed no new actions are started, the running ones
+    are waited for before :class:`ActionBuildError` is raised.
+
+    Targets the :class:`BuildCache` cache knows to be up to date are
+    skipped and their output is replayed.
+    """
+    keys = {}
+    replays = []
+
+    def cached(target):
+        key = cache.fingerprint(build, target)
+        output = cache.get_output(build, target, key)
+        if output is not None:
+            replays.append((target, output))
+            return True
+        if key is not None:
+            keys[target.name] = target, key
+        return False
+
+    graph, circular = generate_job_graph(build, target_name,
+                                         cached if cache else None)
+    for action in circular:
+        _info('--', 'Warning: Circular action ignored: %s' % action.target.name, '--')
+    stdout, stderr = sys.stdout, sys.stderr
+    for target, output in replays:
+        prefix = '[%s] ' % target.name
+        _info('%sUp to date' % prefix)
+        yield _replay(output, PrefixWriter(stdout, prefix))
+    # a target is stored in the cache once the jobs of all targets its
+    # build uses are done, the output of used targets which were up to
+    # date comes first
+    remaining = {}
+    outputs = {}
+    job_targets = dict((job, []) for job in graph)
+    for name, (target, key) in keys.items():
+        used = set(other.name for other in used_targets(build, target))
+        outputs[name] = [text for replayed, output in replays
+                         if replayed.name in used for text in output]
+        remaining[name] = 0
+        for job in graph:
+            if job.target.name in used:
+                job_targets[job].append(name)
+                remaining[name] += 1
+        if not remaining[name]:
+            cache.store(target, key, outputs[name])
+    waiting = dict((job, len(job.dependencies)) for job in graph)
+    ready = [job for job in graph if not job.dependencies]
+    results = Queue()
+    running = 0
+    failed = False
+    while ready or running:
+        while ready and running < jobs and not failed:
+            job = ready.pop(0)
+            prefix = '[%s] ' % job.target.name
+            _info('%sExecuting: [%s] %s' % (prefix, job.action.type,
+                                           job.action.value))
+            streams = (PrefixWriter(stdout, prefix),
+                       PrefixWriter(stderr, prefix))
+            thread = threading.Thread(target=_execute_job,
+                args=(build, job, project_directory, streams, results))
+            thread.daemon = True
+            thread.start()
+            running += 1
+        if not running:
+            break
+        job, result, success = results.get()
+        running -= 1
+        if not success:
+            if not job.action.options.get('ignore_fail'):
+                _info('[%s] Error in action' % job.target.name)
+                failed = True
+                continue
+            _info('[%s] Ignoring error in action' % job.target.name)
+        for name in job_targets[job]:
+            outputs[name].append(_result_text(result))
+            remaining[name] -= 1
+            if not remaining[name]:
+                target, key = keys[name]
+                cache.store(target, key, outputs[name])
+        for dependent in job.dependents:
+            waiting[dependent] -= 1
+            if not waiting[dependent]:
+                ready.append(dependent)
+        yield result
+    if failed:
+        raise ActionBuildError()
+
+
+def _execute_node(build, node, project_directory, cache):
+    """Execute a node of the execution tree, depth first"""
+    if node.action is not None:
+        action = node.action
+        _info('Executing: [%s]' % action.type, '--', action.value, '--')
+        result, success = execute_action(build, action, project_directory)
+        if success:
+            yield result
+        elif action.options['ignore_fail']:
+            _info('--', 'Ignoring error in action', '--')
+            yield result
         else:
-            _info('Executing: [%s]' % action.type, '--', action.value, '--')
-            result, success = execute_action(build, action, project_directory)
-            if success:
-                yield result
-            elif action.options['ignore_fail']:
-                _info('--', 'Ignoring error in action', '--')
+            raise ActionBuildError()
+    elif node.circular:
+        _info('--', 'Warning: Circular action ignored: %s' % node.target.name, '--')
+    else:
+        key = None
+        if cache is not None:
+            key = cache.fingerprint(build, node.target)
+            output = cache.get_output(build, node.target, key)
+            if output is not None:
+                _info('Up to date: %s' % node.target.name, '--')
+                yield _replay(output, sys.stdout)
+                return
+        results = []
+        for child in node.children:
+            for result in _execute_node(build, child, project_directory,
+                                        cache):
+                results.append(_result_text(result))
                 yield result
-            else:
-                raise ActionBuildError()
+        if key is not None:
+            cache.store(node.target, key, results)
+
+
+def execute_build(build, target_name, project_directory=None, jobs=1,
+                  cache=None):
+    if jobs > 1:
+        for result in execute_jobs(build, target_name, project_directory,
+                                   jobs, cache):
+            yield result
+        return
+    graph = generate_execution_graph(build, target_name)
+    for result in _execute_node(build, graph, project_directory, cache):
+        yield result
 
 
-def execute_target(project_file, target_name, project_directory=None):
+def execute_target(project_file, target_name, project_directory=None, jobs=1,
+                   use_cache=False):
     build = Build.loadf(project_file)
-    return execute_build(build, target_name, project_directory)
+    cache = None
+    if use_cache and project_directory is not None:
+        cache = BuildCache(project_directory)
+    return execute_build(build, target_name, project_directory, jobs, cache)
 
 
-def execute_project(project_directory, target_name, project_file=None):
+def execute_project(project_directory, target_name, project_file=None,
+                    jobs=1, use_cache=True):
     _info('Working dir: %s' % project_directory)
     if not project_file:
         project_file = Project.data_dir_path(project_directory, 'project.json')
     _info('Build file path: %s' % project_file, '--')
     sys.path.insert(0, project_directory)
     try:
-        for action in execute_target(project_file, target_name, project_directory):
+        for action in execute_target(project_file, target_name,
+                                     project_directory, jobs, use_cache):
             pass
         _info('--', 'Build completed.')
     except ActionBuildError:
@@ -355,6 +632,11 @@ def main():
     parser.add_option('-s', '--script', dest='script',
                       help='name of the script file',
                      default='.pida-metadata/project.json')
+    parser.add_option('-j', '--jobs', dest='jobs', type='int', default=1,
+                      help='number of actions to run at the same time')
+    parser.add_option('-B', '--always-make', dest='always_make',
+                      action='store_true',
+                      help='execute all targets, even up to date ones')
     opts, args = parser.parse_args(sys.argv)
 
     project_directory = os.getcwd()
@@ -365,7 +647,8 @@ def main():
         return 0
 
     target_name = args[1]
-    execute_project(project_directory, target_name, opts.script)
+    execute_project(project_directory, target_name, opts.script, opts.jobs,
+                    not opts.always_make)
 
 
 if __name__ == '__main__':
@@ -104,13 +104,27 @@ class Target(object):
         self.is_default = False
         self.actions = []
         #self.dependencies = []
+        # globs of the files the target reads, targets without are
+        # always executed
+        self.inputs = []
+        # files the target creates, it is run again if one is missing
+        self.outputs = []
+        # compare the content of the inputs, not only mtime and size
+        self.hash_inputs = False
 
     def for_serialize(self):
-        return {
+        rv = {
             'actions': [a.for_serialize() for a in self.actions],
             #'dependencies': [d.for_serialize() for d in self.dependencies],
             'name': self.name,
         }
+        if self.inputs:
+            rv['inputs'] = list(self.inputs)
+        if self.outputs:
+            rv['outputs'] = list(self.outputs)
+        if self.hash_inputs:
+            rv['hash_inputs'] = True
+        return rv
 
     @classmethod
     def from_serialize(cls, data):
@@ -118,6 +132,9 @@ class Target(object):
         t.name = data.get('name', 'unnamed')
         for act in data.get('actions', ()):
             t.actions.append(Action.from_serialize(act))
+        t.inputs = list(data.get('inputs', ()))
+        t.outputs = list(data.get('outputs', ()))
+        t.hash_inputs = data.get('hash_inputs', False)
         return t
 
     def create_new_action(self):
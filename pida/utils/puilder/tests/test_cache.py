@@ -0,0 +1,255 @@
+import re
+from json import dumps
+
+from ..model import Build
+from ..cache import BuildCache, expand_inputs, translate_glob
+from ..execute import execute_build
+
+t = dict(
+    targets = [
+        dict(
+            name = 'docs',
+            inputs = ['docs/*.txt'],
+            outputs = ['out.html'],
+            actions = [
+                dict(type='shell', value='echo run >> runs; touch out.html',
+                     options={}),
+                dict(type='shell', value='echo built', options={}),
+            ],
+        ),
+        dict(
+            name = 'all',
+            actions = [
+                dict(type='target', value='docs', options={}),
+                dict(type='shell', value='echo all', options={}),
+            ],
+        ),
+    ],
+    options = {}
+)
+
+
+def make_build():
+    return Build.loads(dumps(t))
+
+
+def make_tree(tmpdir):
+    tmpdir.ensure('docs/index.txt').write('index')
+    tmpdir.ensure('docs/deep/more.txt').write('more')
+    tmpdir.ensure('src/pkg/mod.py')
+    tmpdir.ensure('src/top.py')
+    return str(tmpdir)
+
+
+def run(tmpdir, target='docs', jobs=1):
+    b = make_build()
+    cache = BuildCache(str(tmpdir))
+    return [r.getvalue() for r in execute_build(b, target, str(tmpdir),
+                                                jobs, cache)]
+
+
+def test_serialize_inputs():
+    b = make_build()
+    data = b.targets[0].for_serialize()
+    assert data['inputs'] == ['docs/*.txt']
+    assert data['outputs'] == ['out.html']
+    assert 'inputs' not in b.targets[1].for_serialize()
+
+
+def test_expand_inputs(tmpdir):
+    directory = make_tree(tmpdir)
+    assert expand_inputs(directory, ['docs/*.txt']) == ['docs/index.txt']
+    assert expand_inputs(directory, ['src/**/*.py']) == ['src/pkg/mod.py',
+                                                          'src/top.py']
+    assert expand_inputs(directory, ['**/*.txt', 'docs/index.txt']) == \
+        ['docs/deep/more.txt', 'docs/index.txt']
+
+
+def test_expand_inputs_segments(tmpdir):
+    tmpdir.ensure('src/test_top.py')
+    tmpdir.ensure('src/pkg/test_nested.py')
+    tmpdir.ensure('src/pkg/other.py')
+    tmpdir.ensure('a/b/y.c')
+    tmpdir.ensure('a/x/b/y.c')
+    tmpdir.ensure('a/x/b/deep/z.c')
+    tmpdir.ensure('a/xb/y.c')
+    directory = str(tmpdir)
+    assert expand_inputs(directory, ['src/**/test_*.py']) == \
+        ['src/pkg/test_nested.py', 'src/test_top.py']
+    assert expand_inputs(directory, ['a/**/b/*.c']) == \
+        ['a/b/y.c', 'a/x/b/y.c']
+    assert expand_inputs(directory, ['a/**']) == \
+        ['a/b/y.c', 'a/x/b/deep/z.c', 'a/x/b/y.c', 'a/xb/y.c']
+
+
+def test_translate_glob():
+    def match(pattern, path):
+        return re.match(translate_glob(pattern), path) is not None
+    assert match('*.py', 'a.py')
+    assert not match('*.py', 'a/b.py')
+    assert match('**/b.py', 'b.py')
+    assert match('**/b.py', 'a/c/b.py')
+    assert not match('**/b.py', 'ab.py')
+    assert match('file?.[ch]', 'file1.c')
+    assert not match('file?.[!ch]', 'file1.c')
+
+
+def test_fingerprint(tmpdir):
+    directory = make_tree(tmpdir)
+    b = make_build()
+    cache = BuildCache(directory)
+    key = cache.fingerprint(b, b.targets[0])
+    assert key == cache.fingerprint(b, b.targets[0])
+    assert cache.fingerprint(b, b.targets[1]) is None
+    tmpdir.join('docs/index.txt').write('changed index')
+    assert cache.fingerprint(b, b.targets[0]) != key
+    key = cache.fingerprint(b, b.targets[0])
+    b.targets[0].actions[1].value = 'echo other'
+    assert cache.fingerprint(b, b.targets[0]) != key
+
+
+def test_skip_up_to_date(tmpdir):
+    make_tree(tmpdir)
+    assert run(tmpdir) == ['', 'built\n']
+    # replayed from the cache
+    assert run(tmpdir) == ['built\n']
+    assert tmpdir.join('runs').read() == 'run\n'
+    tmpdir.join('docs/index.txt').write('changed index')
+    run(tmpdir)
+    assert tmpdir.join('runs').read() == 'run\nrun\n'
+
+
+def test_missing_output(tmpdir):
+    make_tree(tmpdir)
+    run(tmpdir)
+    tmpdir.join('out.html').remove()
+    run(tmpdir)
+    assert tmpdir.join('runs').read() == 'run\nrun\n'
+
+
+def test_skip_subtarget(tmpdir):
+    make_tree(tmpdir)
+    run(tmpdir)
+    assert run(tmpdir, 'all') == ['built\n', 'all\n']
+    assert tmpdir.join('runs').read() == 'run\n'
+
+
+def test_skip_parallel(tmpdir):
+    make_tree(tmpdir)
+    assert sorted(run(tmpdir, 'all', jobs=2)) == ['', 'all\n', 'built\n']
+    assert sorted(run(tmpdir, 'all', jobs=2)) == ['all\n', 'built\n']
+    assert tmpdir.join('runs').read() == 'run\n'
+
+
+nested = dict(
+    targets = [
+        dict(
+            name = 'sub',
+            inputs = ['sub.txt'],
+            actions = [
+                dict(type='shell', value='echo sub >> runs; cat sub.txt',
+                     options={}),
+            ],
+        ),
+        dict(
+            name = 'plain',
+            actions = [
+                dict(type='shell', value='echo plain >> runs', options={}),
+            ],
+        ),
+        dict(
+            name = 'all',
+            inputs = ['top.txt'],
+            actions = [
+                dict(type='target', value='sub', options={}),
+                dict(type='shell', value='echo all', options={}),
+            ],
+        ),
+        dict(
+            name = 'mixed',
+            inputs = ['top.txt'],
+            actions = [
+                dict(type='target', value='plain', options={}),
+                dict(type='shell', value='echo mixed', options={}),
+            ],
+        ),
+    ],
+    options = {}
+)
+
+
+def run_nested(tmpdir, target, jobs):
+    b = Build.loads(dumps(nested))
+    cache = BuildCache(str(tmpdir))
+    output = ''.join(r.getvalue() for r in execute_build(b, target,
+                                                         str(tmpdir), jobs,
+                                                         cache))
+    return sorted(output.splitlines())
+
+
+def test_subtarget_inputs(tmpdir):
+    for jobs in 1, 2:
+        directory = tmpdir.mkdir('j%d' % jobs)
+        directory.join('top.txt').write('top')
+        directory.join('sub.txt').write('one\n')
+        assert run_nested(directory, 'all', jobs) == ['all', 'one']
+        assert run_nested(directory, 'all', jobs) == ['all', 'one']
+        assert directory.join('runs').read() == 'sub\n'
+        # only the input of the used target changed
+        directory.join('sub.txt').write('two\n')
+        assert run_nested(directory, 'all', jobs) == ['all', 'two']
+        assert directory.join('runs').read() == 'sub\nsub\n'
+
+
+def test_subtarget_without_inputs(tmpdir):
+    tmpdir.join('top.txt').write('top')
+    b = Build.loads(dumps(nested))
+    cache = BuildCache(str(tmpdir))
+    assert cache.fingerprint(b, b.targets[3]) is None
+    for jobs in 1, 2, 1:
+        run_nested(tmpdir, 'mixed', jobs)
+    assert tmpdir.join('runs').read() == 'plain\n' * 3
+
+
+shared = dict(
+    targets = [
+        dict(
+            name = 'sub',
+            inputs = ['sub.txt'],
+            actions = [
+                dict(type='shell', value='echo sub >> runs; cat sub.txt',
+                     options={}),
+            ],
+        ),
+        dict(
+            name = 'wrap',
+            inputs = ['top.txt'],
+            actions = [
+                dict(type='target', value='sub', options={}),
+            ],
+        ),
+        dict(
+            name = 'both',
+            actions = [
+                dict(type='target', value='sub', options={}),
+                dict(type='target', value='wrap', options={}),
+            ],
+        ),
+    ],
+    options = {}
+)
+
+
+def test_parallel_shared_subtarget(tmpdir):
+    tmpdir.join('top.txt').write('top')
+    tmpdir.join('sub.txt').write('one\n')
+    b = Build.loads(dumps(shared))
+    list(execute_build(b, 'both', str(tmpdir), 2, BuildCache(str(tmpdir))))
+    # wrap only uses a target built for both, it is stored anyway
+    entries = BuildCache(str(tmpdir)).entries
+    assert entries['wrap']['output'] == entries['sub']['output'] == ['one\n']
+    # and stored right away once sub is up to date
+    tmpdir.join('top.txt').write('changed')
+    list(execute_build(b, 'wrap', str(tmpdir), 2, BuildCache(str(tmpdir))))
+    assert BuildCache(str(tmpdir)).entries['wrap']['output'] == ['one\n']
+    assert tmpdir.join('runs').read() == 'sub\n'
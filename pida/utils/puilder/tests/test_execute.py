@@ -0,0 +1,178 @@
+from json import dumps
+from StringIO import StringIO
+
+import py
+
+from ..model import Build
+from ..execute import generate_job_graph, execute_build, ActionBuildError, \
+                      PrefixWriter
+
+t = dict(
+    targets = [
+        dict(
+            name = 'all',
+            actions = [
+                dict(type='shell', value='echo prepare', options={}),
+                dict(type='target', value='lint', options={}),
+                dict(type='target', value='tests', options={}),
+                dict(type='shell', value='echo done', options={}),
+            ],
+        ),
+        dict(
+            name = 'lint',
+            actions = [
+                dict(type='shell', value='sleep 0.3; echo lint', options={}),
+            ],
+        ),
+        dict(
+            name = 'tests',
+            actions = [
+                dict(type='target', value='lint', options={}),
+                dict(type='shell', value='sleep 0.3; echo tests', options={}),
+            ],
+        ),
+        dict(
+            name = 'slow',
+            actions = [
+                dict(type='target', value='lint', options={}),
+                dict(type='target', value='docs', options={}),
+            ],
+        ),
+        dict(
+            name = 'docs',
+            actions = [
+                dict(type='shell', value='sleep 0.3; echo docs', options={}),
+            ],
+        ),
+        dict(
+            name = 'fail',
+            actions = [
+                dict(type='target', value='broken', options={}),
+                dict(type='shell', value='echo never', options={}),
+            ],
+        ),
+        dict(
+            name = 'broken',
+            actions = [
+                dict(type='shell', value='exit 1',
+                     options={'ignore_fail': False}),
+            ],
+        ),
+        dict(
+            name = 'ignored',
+            actions = [
+                dict(type='shell', value='exit 1',
+                     options={'ignore_fail': True}),
+                dict(type='shell', value='echo after', options={}),
+            ],
+        ),
+        dict(
+            name = 'circle',
+            actions = [
+                dict(type='target', value='circle', options={}),
+                dict(type='shell', value='echo circle', options={}),
+            ],
+        ),
+    ],
+    options = {}
+)
+
+def make_build():
+    return Build.loads(dumps(t))
+
+
+def names(jobs):
+    return [job.action.value for job in jobs]
+
+
+def test_job_graph():
+    b = make_build()
+    jobs, circular = generate_job_graph(b, 'all')
+    assert not circular
+    # lint is only built once
+    assert names(jobs) == ['echo prepare', 'sleep 0.3; echo lint',
+                           'sleep 0.3; echo tests', 'echo done']
+    prepare, lint, tests, done = jobs
+    assert lint.dependencies == set([prepare])
+    assert tests.dependencies == set([prepare, lint])
+    assert done.dependencies == set([prepare, lint, tests])
+
+
+def test_job_graph_independent():
+    b = make_build()
+    jobs, circular = generate_job_graph(b, 'slow')
+    assert [job.dependencies for job in jobs] == [set(), set()]
+
+
+def test_job_graph_circular():
+    b = make_build()
+    jobs, circular = generate_job_graph(b, 'circle')
+    assert names(jobs) == ['echo circle']
+    assert circular[0].target.name == 'circle'
+
+
+def test_execute_parallel():
+    b = make_build()
+    res = list(execute_build(b, 'slow', jobs=2))
+    assert sorted(r.getvalue() for r in res) == ['docs\n', 'lint\n']
+
+
+def test_execute_parallel_overlap(tmpdir):
+    log = tmpdir.join('log')
+    action = 'echo start %s >> ' + str(log) + '; sleep 0.3; echo end %s >> ' + \
+             str(log)
+    b = Build.loads(dumps(dict(
+        targets = [
+            dict(name='slow', actions=[
+                dict(type='target', value='lint', options={}),
+                dict(type='target', value='docs', options={}),
+            ]),
+            dict(name='lint', actions=[
+                dict(type='shell', value=action % ('lint', 'lint'),
+                     options={}),
+            ]),
+            dict(name='docs', actions=[
+                dict(type='shell', value=action % ('docs', 'docs'),
+                     options={}),
+            ]),
+        ],
+        options = {}
+    )))
+    list(execute_build(b, 'slow', jobs=2))
+    r = log.read().splitlines()
+    # both actions started before either of them ended
+    assert r.index('start docs') < r.index('end lint')
+    assert r.index('start lint') < r.index('end docs')
+
+
+def test_execute_parallel_order():
+    b = make_build()
+    res = list(execute_build(b, 'all', jobs=4))
+    assert [r.getvalue() for r in res] == ['prepare\n', 'lint\n',
+                                           'tests\n', 'done\n']
+
+
+def test_execute_parallel_failure():
+    b = make_build()
+    res = []
+    with py.test.raises(ActionBuildError):
+        for r in execute_build(b, 'fail', jobs=2):
+            res.append(r)
+    assert res == []
+
+
+def test_execute_parallel_ignore_fail():
+    b = make_build()
+    res = list(execute_build(b, 'ignored', jobs=2))
+    assert res[-1].getvalue() == 'after\n'
+
+
+def test_prefix_writer():
+    out = StringIO()
+    writer = PrefixWriter(out, '[lint] ')
+    writer.write('one\ntw')
+    assert out.getvalue() == '[lint] one\n'
+    writer.write('o\n')
+    writer.write('three')
+    writer.flush()
+    assert out.getvalue() == '[lint] one\n[lint] two\n[lint] three\n'
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+    pida.utils.search
+    ~~~~~~~~~~~~~~~~~
+
+    Trigram index and fuzzy scoring for fast substring searches
+
+    :copyright: 2005-2010 by The PIDA Project
+    :license: GPL 2 or later (see README/COPYING/LICENSE)
+"""
+
+import re
+from array import array
+
+
+def trigrams(text):
+    """Returns the set of lowercased trigrams of text"""
+    text = text.lower()
+    return set(text[i:i + 3] for i in xrange(len(text) - 2))
+
+
+class TrigramIndex(object):
+    """
+    Maps trigrams to posting lists of the keys whose text contains them.
+
+    Lookups only return candidates, a key is returned if its text contains
+    all trigrams of the query, which is necessary but not sufficient for a
+    substring match.  Callers have to verify the candidates.
+
+    Posting lists are append only arrays of integer ids, removed keys leave
+    holes that get dropped by :meth:`compact`.
+
+    With `chars` every distinct character gets a posting list as well, so
+    :meth:`subsequence_candidates` can narrow down fuzzy matches.
+    """
+
+    # stop intersecting once the next posting list is this many times
+    # larger than the current candidate set, verifying is cheaper then
+    INTERSECT_RATIO = 8
+
+    def __init__(self, chars=False):
+        self.chars = chars
+        self._postings = {}
+        self._keys = []
+        self._ids = {}
+        self._removed = 0
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, key):
+        return key in self._ids
+
+    def add(self, key, text):
+        if key in self._ids:
+            self.remove(key)
+        id_ = len(self._keys)
+        self._keys.append(key)
+        self._ids[key] = id_
+        postings = self._postings
+        grams = trigrams(text)
+        if self.chars:
+            # single characters never clash with the trigrams
+            grams.update(text.lower())
+        for trigram in grams:
+            posting = postings.get(trigram)
+            if posting is None:
+                posting = postings[trigram] = array('l')
+            posting.append(id_)
+
+    def remove(self, key):
+        id_ = self._ids.pop(key, None)
+        if id_ is None:
+            return
+        self._keys[id_] = None
+        self._removed += 1
+        if self._removed > len(self._ids):
+            self.compact()
+
+    def compact(self):
+        """Drop the ids of removed keys from the posting lists"""
+        keys = self._keys
+        for trigram, posting in self._postings.items():
+            alive = array('l', (id_ for id_ in posting
+                                if keys[id_] is not None))
+            if alive:
+                self._postings[trigram] = alive
+            else:
+                del self._postings[trigram]
+        self._removed = 0
+
+    def get_state(self):
+        """Returns the index as plain data for marshal"""
+        self.compact()
+        return self._keys, dict((trigram, posting.tostring()) for
+                                trigram, posting in self._postings.iteritems())
+
+    @classmethod
+    def from_state(cls, state, chars=False):
+        """Create an index from the result of :meth:`get_state`"""
+        index = cls(chars)
+        keys, postings = state
+        index._keys = list(keys)
+        index._ids = dict((key, id_) for id_, key in enumerate(keys)
+                          if key is not None)
+        for trigram, data in postings.iteritems():
+            posting = index._postings[trigram] = array('l')
+            posting.fromstring(data)
+        return index
+
+    def candidates(self, query):
+        """
+        Returns the keys which may contain query as a substring or None if
+        the query is too short to narrow anything down.
+        """
+        ids = self._intersect(trigrams(query))
+        if ids is None:
+            return None
+        keys = self._keys
+        return [keys[id_] for id_ in ids if keys[id_] is not None]
+
+    def subsequence_candidates(self, query):
+        """
+        Returns the keys which contain every character of query, which is
+        necessary for query being a subsequence of their text, or None if
+        the index has no character postings.  The keys come in the order
+        they were added.
+        """
+        if not self.chars:
+            return None
+        ids = self._intersect(set(query.lower()))
+        if ids is None:
+            return None
+        keys = self._keys
+        return [keys[id_] for id_ in sorted(ids) if keys[id_] is not None]
+
+    def _intersect(self, wanted):
+        """Returns the set of ids in the posting lists of all of wanted"""
+        if not wanted:
+            return None
+        postings = []
+        for gram in wanted:
+            posting = self._postings.get(gram)
+            if posting is None:
+                return set()
+            postings.append(posting)
+        postings.sort(key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            if len(posting) > self.INTERSECT_RATIO * len(result):
+                break
+            result.intersection_update(posting)
+            if not result:
+                break
+        return result
+
+
+_BOUNDARY = '/\\_-. '
+
+
+def fuzzy_score(pattern, path, basename_start=None):
+    """
+    Score how well pattern matches path, higher is better.
+
+    Substring matches beat subsequence matches, matches in the basename and
+    at word boundaries beat others, shorter paths beat longer ones.
+    Returns None if pattern is not a subsequence of path.
+
+    :param pattern: lowercased search pattern
+    :param path: the (relative) path to match against
+    :param basename_start: index where the basename starts in path
+    """
+    lower = path.lower()
+    if basename_start is None:
+        basename_start = lower.rfind('/') + 1
+    penalty = len(path) / 10.0
+    idx = lower.rfind(pattern)
+    if idx >= 0:
+        score = 100.0
+        if idx >= basename_start:
+            score += 50
+            if idx == basename_start:
+                score += 25
+        if idx == 0 or lower[idx - 1] in _BOUNDARY:
+            score += 10
+        return score - penalty
+
+    score = 0.0
+    last = -1
+    for char in pattern:
+        idx = lower.find(char, last + 1)
+        if idx < 0:
+            return None
+        if idx == last + 1:
+            score += 3
+        elif idx == 0 or lower[idx - 1] in _BOUNDARY:
+            score += 2
+        else:
+            score -= min(idx - last, 10) / 5.0
+        if idx >= basename_start:
+            score += 1
+        last = idx
+    return score - penalty
+
+
+def fuzzy_regex(pattern):
+    """Compile a case insensitive regex matching pattern as subsequence"""
+    return re.compile('.*?'.join(re.escape(char) for char in pattern),
+                      re.IGNORECASE)
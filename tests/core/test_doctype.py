@@ -1,5 +1,5 @@
 
-from pida.core.doctype import DocType, TypeManager
+from pida.core.doctype import DocType, TypeManager, GlobMatcher
 #from pida.core.testing import test, assert_equal, assert_notequal
 
 #from pida.utils.testing.mock import Mock
@@ -86,3 +86,45 @@ class DoctypeTest(TestCase):
                          self.doctypes['Makefile'])
         self.assertEqual(self.doctypes.type_by_filename('Makefile.in'),
                          self.doctypes['Makefile'])
+        self.assertEqual(self.doctypes.type_by_filename('/src/Makefile'),
+                         self.doctypes['Makefile'])
+        self.assertEqual(self.doctypes.type_by_filename('/src.c/README'),
+                         None)
+        self.assertEqual(self.doctypes.type_by_filename('/src/x.f95'),
+                         self.doctypes['Fortran'])
+
+    def test_types_by_filename(self):
+        self.build_doctypes()
+        types = self.doctypes.types_by_filename('/src/Makefile.in')
+        self.assertTrue(self.doctypes['Makefile'] in types)
+        self.assertEqual(self.doctypes.types_by_filename('LICENSE'), [])
+
+    def test_add_clears_cache(self):
+        self.build_doctypes()
+        self.assertEqual(self.doctypes.type_by_filename('x.pidatest'), None)
+        doctype = DocType('PidaTest', 'Pida Test', aliases=[],
+                          extensions=['*.pidatest'])
+        self.doctypes.add(doctype)
+        self.assertEqual(self.doctypes.type_by_filename('x.pidatest'),
+                         doctype)
+
+
+class GlobMatcherTest(TestCase):
+
+    def test_longest(self):
+        matcher = GlobMatcher(['*.gz', '*.tar.gz', 'Makefile', '[Mm]akefile*',
+                               '*.f9[05]'])
+        self.assertEqual(matcher.best('x.tar.gz'), '*.tar.gz')
+        self.assertEqual(matcher.best('x.gz'), '*.gz')
+        self.assertEqual(matcher.best('Makefile'), '[Mm]akefile*')
+        self.assertEqual(matcher.best('x.f90'), '*.f9[05]')
+        self.assertEqual(matcher.best('x.f91'), None)
+        self.assertEqual(sorted(matcher.matches('x.tar.gz')),
+                         ['*.gz', '*.tar.gz'])
+
+    def test_many_patterns(self):
+        globs = ['file%d?.txt' % i for i in range(300)]
+        matcher = GlobMatcher(globs)
+        self.assertEqual(matcher.best('file2991.txt'), 'file299?.txt')
+        self.assertEqual(matcher.best('file11.txt'), 'file1?.txt')
+        self.assertEqual(matcher.best('file1.txt'), None)
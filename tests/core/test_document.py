@@ -1,6 +1,7 @@
 
 import os
 from pida.core.document import Document as document_class
+from pida.utils.testing.mock import Mock
 #from pida.core.testing import test, assert_equal, assert_notequal
 
 def document(*k, **kw):
@@ -87,3 +88,42 @@ def test_unicode_knows():
     assert unicode(doc) == doc.basename
 
 
+
+def test_stat_cached(tmpdir):
+    file = tmpdir.join('file.txt')
+    file.write('data')
+    doc = document(filename=str(file))
+    assert doc.filesize == 4
+    file.write('more data')
+    assert doc.filesize == 4
+    doc.invalidate()
+    assert doc.filesize == 9
+
+def test_stat_expires(tmpdir, monkeypatch):
+    file = tmpdir.join('file.txt')
+    file.write('data')
+    doc = document(filename=str(file))
+    assert doc.filesize == 4
+    file.write('more data')
+    monkeypatch.setattr(document_class, 'STAT_CACHE_TIME', -1)
+    assert doc.filesize == 9
+
+def test_project_cached():
+    boss = Mock()
+    boss.cmd.return_value = ('project', 'src')
+    doc = document_class(boss, filename='/tmp/src/test.py')
+    assert doc.project == 'project'
+    assert doc.project_relative_path == 'src'
+    assert boss.cmd.call_count == 1
+    doc.invalidate()
+    boss.cmd.return_value = None
+    assert doc.project is None
+    assert boss.cmd.call_count == 2
+
+def test_rename_invalidates(tmpdir):
+    tmpdir.join('a.txt').write('a')
+    tmpdir.join('b.txt').write('bb')
+    doc = document(filename=str(tmpdir.join('a.txt')))
+    assert doc.filesize == 1
+    doc.filename = str(tmpdir.join('b.txt'))
+    assert doc.filesize == 2
@@ -1,10 +1,12 @@
 import os
+import time
+import py
 #from pida.core.doctype import DocType
 #from pida.core.testing import test, assert_equal, assert_notequal
 from pida.utils.languages import OutlineItem, ValidationError, Definition, \
     Suggestion, Documentation
 from pida.core.languages import (Validator, Outliner, External, JobServer,
-    ExternalProxy,
+    ExternalProxy, ResultBatcher,
     Documentator, Definer, Completer, LanguageService)
 from pida.core.document import Document
 
@@ -165,3 +167,126 @@ def test_definer(svc, doc):
             assert isinstance(v, Definition)
             assert i - 3 == v.offset
             assert "run %s" % (i - 3) == v.line
+
+
+def test_jobserver_affinity(svc, doc):
+    outliner = svc.outliner_factory(svc, doc)
+    validator = svc.validator_factory(svc, doc)
+    pids = set()
+    for proxy in (outliner, validator, outliner):
+        pids.add(list(proxy.run())[0])
+    # outliner and validator are spread over both processes
+    assert len(pids) == 2
+    stats = svc.jobserver.get_stats()
+    assert len(stats) == 2
+    assert sum(s['done'] for s in stats) == 3
+    assert all(s['alive'] and not s['running'] for s in stats)
+
+
+def test_jobserver_cancel(svc, doc):
+    outliner = svc.outliner_factory(svc, doc)
+    results = outliner.run()
+    next(results)
+    svc.jobserver.cancel(outliner)
+    assert list(results) == []
+    stats = svc.jobserver.get_stats()
+    assert sum(s['cancelled'] for s in stats) == 1
+
+
+def test_jobserver_close(svc, doc):
+    outliner = svc.outliner_factory(svc, doc)
+    results = outliner.run()
+    next(results)
+    results.close()
+    del results
+    stats = svc.jobserver.get_stats()
+    assert sum(s['cancelled'] for s in stats) == 1
+    assert sum(s['failed'] for s in stats) == 0
+    assert all(s['alive'] for s in stats)
+
+
+def test_jobserver_respawn(svc, doc):
+    outliner = svc.outliner_factory(svc, doc)
+    pid = list(outliner.run())[0]
+    process = svc.jobserver.get_process(outliner)
+    process.manager._process.terminate()
+    process.manager._process.join()
+    assert list(outliner.run())[0] != pid
+    key = JobServer.get_affinity_key(outliner)
+    respawned = svc.jobserver._affinity[key]
+    assert respawned is not process
+    assert key in respawned.keys
+    assert respawned is svc.jobserver.get_process(outliner)
+
+
+def test_jobserver_forget(svc, doc):
+    outliner = svc.outliner_factory(svc, doc)
+    list(outliner.run())
+    process = svc.jobserver.get_process(outliner)
+    key = JobServer.get_affinity_key(outliner)
+    assert key in process.keys
+    assert id(doc) in process.instances
+    svc.jobserver.forget(document=doc)
+    assert key not in process.keys
+    assert key not in svc.jobserver._affinity
+    assert id(doc) not in process.instances
+    assert process.load == (0, 0)
+
+
+def test_jobserver_configure(svc, doc):
+    assert svc.get_jobserver_settings() == {
+        'max_processes': 2, 'batch_size': None, 'flush_interval': None}
+    svc.jobserver.configure(max_processes=3)
+    assert svc.jobserver.max_processes == 3
+    assert svc.jobserver.batch_size == MyExternal.batch_size
+    svc.jobserver.configure(batch_size=7, flush_interval=0.01)
+    assert svc.jobserver.batch_size == 7
+    assert svc.jobserver.flush_interval == 0.01
+    outliner = svc.outliner_factory(svc, doc)
+    assert len(list(outliner.run())) == 51
+    svc.jobserver.configure()
+    assert svc.jobserver.batch_size == MyExternal.batch_size
+    assert svc.jobserver.flush_interval == MyExternal.flush_interval
+
+
+def test_result_batcher():
+    batcher = ResultBatcher(xrange(120), batch_size=50)
+    assert [len(batcher.next_batch()) for i in range(4)] == [50, 50, 20, 0]
+
+
+def test_result_batcher_flush():
+    def slow():
+        yield 1
+        time.sleep(0.1)
+        yield 2
+        yield 3
+    batcher = ResultBatcher(slow(), flush_interval=0.05)
+    # flushed while the generator is busy
+    assert batcher.next_batch() == [1]
+    assert batcher.next_batch() == [2, 3]
+    assert batcher.next_batch() == []
+
+
+def test_result_batcher_close():
+    produced = []
+    def endless():
+        while True:
+            produced.append(True)
+            yield len(produced)
+    batcher = ResultBatcher(endless(), batch_size=5)
+    assert batcher.next_batch() == [1, 2, 3, 4, 5]
+    batcher.close()
+    time.sleep(0.3)
+    count = len(produced)
+    time.sleep(0.2)
+    assert len(produced) == count
+
+
+def test_result_batcher_error():
+    def broken():
+        yield 1
+        raise ValueError()
+    batcher = ResultBatcher(broken())
+    assert batcher.next_batch() == [1]
+    py.test.raises(ValueError, batcher.next_batch)
+    assert batcher.next_batch() == []
@@ -1,4 +1,5 @@
 from pida.core.projects import Project, DATA_DIR
+from pida.core import indexer
 from pida.core.indexer import Result
 import os
 
@@ -277,3 +278,178 @@ def test_query(project, tmpdir):
         'src/source2.h',
         'src/test2',
     ]
+
+
+def test_cache_journal(project, tmpdir):
+    from pida.core.indexer import Indexer, CACHE_NAME, JOURNAL_NAME
+    make_project_files(tmpdir)
+    project.indexer.index(recrusive=True, rebuild=True)
+    project.indexer.save_cache()
+    journal = tmpdir.join(DATA_DIR, JOURNAL_NAME)
+    assert tmpdir.join(DATA_DIR, CACHE_NAME).check()
+    assert not journal.check()
+
+    # a single change only gets appended to the journal
+    tmpdir.ensure('src/new.c')
+    project.indexer.index_path(str(tmpdir.join('src/new.c')),
+                               update_shortcuts=True)
+    tmpdir.join('lib', 'bla').remove(rec=True)
+    project.indexer.index('lib', recrusive=True)
+    project.indexer.save_cache()
+    assert journal.check()
+
+    indexer = Indexer(project)
+    assert indexer.load_cache()
+    assert sorted(indexer.cache['paths']) == \
+           sorted(project.indexer.cache['paths'])
+    assert indexer.cache['files']['src/new.c'].doctype == 'C'
+    assert 'lib/bla' not in indexer.cache['paths']
+    assert 'new.c' in indexer.cache['dirs']['src'].children
+
+    # a rebuild compacts the journal into the snapshot
+    indexer.index(recrusive=True, rebuild=True)
+    indexer.save_cache()
+    assert not journal.check()
+
+
+def test_cache_old_format(project, tmpdir):
+    tmpdir.join(DATA_DIR, 'FILECACHE').write('garbage')
+    assert not project.indexer.load_cache()
+    assert not tmpdir.join(DATA_DIR, 'FILECACHE').check()
+
+
+def test_memory_usage(project, tmpdir):
+    make_project_files(tmpdir)
+    project.indexer.index(recrusive=True)
+    entries, total, per_entry = project.indexer.memory_usage()
+    assert entries == len(project.indexer.cache['paths'])
+    assert per_entry * entries <= total
+    # files don't carry a children dict
+    assert project.indexer.cache['files']['LICENSE'].children is None
+    assert not hasattr(project.indexer.cache['files']['LICENSE'], '__dict__')
+
+
+def test_scan_tree(tmpdir):
+    from pida.core.indexer import scan_tree
+    make_project_files(tmpdir)
+    tmpdir.join('src', 'link').mksymlinkto(tmpdir.join('lib'))
+
+    records, listings = scan_tree(str(tmpdir), '')
+    paths = dict((record[0], record) for record in records)
+    assert paths['src'][1:3] == (True, False)
+    assert paths['src/source.c'][1:3] == (False, True)
+    assert paths['src/source.c'][4] == 'C'
+    # symlinked directories are indexed but not walked
+    assert paths['src/link'][1]
+    assert 'src/link/readme' not in paths
+    assert listings['lib'] == set(['Makefile', 'readme', 'bla', 'CVS'])
+
+    records, listings = scan_tree(str(tmpdir), '', recursive=False)
+    assert listings.keys() == ['']
+    assert 'src/source.c' not in [record[0] for record in records]
+
+
+def test_refresh(project, tmpdir):
+    make_project_files(tmpdir)
+    delta = project.indexer.refresh()
+    c = project.indexer.cache
+    assert 'src/source.c' in delta.added
+    assert 'lib/bla/readme' in delta.added
+    assert 'src/source.c' in c['files']
+
+    # nothing changed
+    assert not project.indexer.refresh()
+
+    tmpdir.ensure('src/test2/new.c')
+    tmpdir.join('lib', 'bla').remove(rec=True)
+    tmpdir.join('LICENSE').remove()
+    tmpdir.ensure('LICENSE')
+    tmpdir.join('LICENSE').setmtime(1)
+    tmpdir.ensure('docs/index.rst')
+    delta = project.indexer.refresh()
+    assert delta.added == set(['src/test2/new.c', 'docs', 'docs/index.rst'])
+    assert delta.removed == set(['lib/bla', 'lib/bla/readme'])
+    assert delta.modified == set(['LICENSE'])
+    assert len(c['filenames']['readme']) == 1
+    assert 'bla' not in c['dirnames']
+    assert 'new.c' in c['dirs']['src/test2'].children
+    assert 'docs/index.rst' in c['files']
+
+    # files changed in place only show up in a rescan
+    tmpdir.join('src', 'source.c').setmtime(1)
+    assert not project.indexer.refresh()
+    delta = project.indexer.refresh(rescan=True)
+    assert delta.modified == set(['src/source.c'])
+    assert not delta.added and not delta.removed
+    assert c['files']['src/source.c'].mtime == 1
+
+
+def test_refresh_dir_replaced(project, tmpdir):
+    tmpdir.ensure('a/b/c.py')
+    tmpdir.ensure('a/d.py')
+    project.indexer.refresh()
+    c = project.indexer.cache
+    tmpdir.join('a').remove(rec=True)
+    tmpdir.ensure('a')
+    delta = project.indexer.refresh()
+    assert delta.removed == set(['a/b', 'a/b/c.py', 'a/d.py'])
+    assert delta.modified == set(['a'])
+    assert 'a' in c['files']
+    assert not [path for path in c['paths'] if path.startswith('a/')]
+    assert [x.relpath for x in project.indexer.search('c.py')] == []
+    assert project.indexer.get_files('a') == ['a']
+
+
+def test_update_paths(project, tmpdir):
+    make_project_files(tmpdir)
+    project.indexer.refresh()
+    c = project.indexer.cache
+
+    tmpdir.ensure('src/test2/new.c')
+    tmpdir.join('lib', 'bla').remove(rec=True)
+    tmpdir.join('LICENSE').setmtime(1)
+    tmpdir.ensure('docs/index.rst')
+    # changes nobody told the indexer about stay unnoticed
+    tmpdir.join('src/source.c').setmtime(1)
+    delta = project.indexer.update_paths([
+        str(tmpdir.join('src/test2/new.c')),
+        str(tmpdir.join('lib/bla')),
+        str(tmpdir.join('LICENSE')),
+        str(tmpdir.join('docs')),
+    ])
+    assert delta.added == set(['src/test2/new.c', 'docs', 'docs/index.rst'])
+    assert delta.removed == set(['lib/bla', 'lib/bla/readme'])
+    assert delta.modified == set(['LICENSE'])
+    assert 'docs/index.rst' in c['files']
+    assert c['files']['src/source.c'].mtime != 1
+
+
+def test_search(project, tmpdir, monkeypatch):
+    make_project_files(tmpdir)
+    project.indexer.index(recrusive=True)
+
+    def search(text, **kw):
+        return [x.relpath for x in project.indexer.search(text, **kw)]
+
+    assert search('source2') == ['src/source2.c', 'src/source2.h']
+    assert search('src source.c')[0] == 'src/source.c'
+    # subsequence matches come after substring matches
+    assert search('sh') == ['src/skript.sh', 'src/source2.h']
+    assert search('rdme') == ['lib/readme', 'lib/bla/readme']
+    assert search('readme', limit=1) == ['lib/readme']
+    assert search('rdme', limit=1) == ['lib/readme']
+    assert search('readme', test=lambda info: 'bla' in info.relpath) == \
+           ['lib/bla/readme']
+    assert search('rdme', is_stopped=lambda: True) == []
+    # the verify limit only applies once there are enough matches
+    monkeypatch.setattr(indexer, 'FUZZY_VERIFY_LIMIT', 0)
+    assert search('rdme') == ['lib/readme', 'lib/bla/readme']
+    assert len(search('rdme', limit=1)) == 1
+
+    # the index follows changes
+    tmpdir.ensure('src/source3.c')
+    tmpdir.join('src', 'source2.h').remove()
+    project.indexer.refresh()
+    assert search('source') == ['src/source.c', 'src/source2.c',
+                                'src/source3.c']
+
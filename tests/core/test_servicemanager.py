@@ -162,3 +162,99 @@ class TestServiceManager(object):
         service = self.sm._loader.get_one('testservice')
         assert service.get_name() == 'testservice'
 
+
+
+lazy_test_service = '''
+from pida.core.service import Service as BaseService
+from pida.core.events import EventsConfig
+
+class Events(EventsConfig):
+
+    def create(self):
+        self.publish('ping')
+
+    def subscribe_all_foreign(self):
+        for service, event in self.svc.listen:
+            self.subscribe_foreign(service, event, self.svc.on_event)
+
+class TestService(BaseService):
+    events_config = Events
+    listen = %r
+
+    def create_all(self):
+        self.events = self.events_config(self)
+        self.received = []
+
+    def subscribe_all(self):
+        self.events.subscribe_all_foreign()
+
+    def on_event(self, **kw):
+        self.received.append(kw)
+
+Service = TestService
+'''
+
+
+class FakeBoss(object):
+
+    def __init__(self):
+        self.servicemanager = ServiceManager(self, lazy=True)
+
+    def get_service(self, name):
+        return self.servicemanager.get_service(name)
+
+
+class TestLazyActivation(object):
+
+    def setup_method(self, method):
+        self.p = p = PseudoPackage('lazy_' + method.__name__)
+        gen(p, 'eager', service=lazy_test_service % ((),))
+        spath = gen(p, 'lazy',
+                    service=lazy_test_service % ([('eager', 'ping')],))
+        with open(join(spath, '__init__.py'), 'w') as f:
+            f.write("triggers = {'events': [('eager', 'ping')]}\n")
+        self.sm = FakeBoss().servicemanager
+        #XXX internal hack
+        self.sm._services = p.loader
+        self.sm._actions_cache = {'lazy': []}
+        self.module = p.mod.__name__ + '.lazy.lazy'
+
+    def teardown_method(self, method):
+        self.p.clean()
+
+    def test_not_imported(self):
+        self.sm.activate_services()
+        assert len(self.sm) == 1
+        assert self.sm.get_lazy_names() == ['lazy']
+        assert not self.sm.is_activated('lazy')
+        assert self.module not in sys.modules
+
+    def test_get_service_activates(self):
+        self.sm.activate_services()
+        self.sm.start_services()
+        lazy = self.sm.get_service('lazy')
+        assert lazy.started
+        assert self.sm.is_activated('lazy')
+        assert self.sm.get_lazy_names() == []
+
+    def test_event_trigger(self):
+        self.sm.activate_services()
+        eager = self.sm.get_service('eager')
+        eager.emit('ping', value=1)
+        lazy = self.sm.get_service('lazy')
+        # the triggering event reaches the new service exactly once
+        assert lazy.received == [{'value': 1}]
+        eager.emit('ping', value=2)
+        assert lazy.received == [{'value': 1}, {'value': 2}]
+
+    def test_uncached_is_eager(self):
+        self.sm._actions_cache = {}
+        self.sm._cache_actions = lambda svc: None
+        self.sm.activate_services()
+        assert self.sm.is_activated('lazy')
+        assert self.sm.get_lazy_names() == []
+
+    def test_not_lazy(self):
+        self.sm.lazy = False
+        self.sm.activate_services()
+        assert len(self.sm) == 2
@@ -0,0 +1,96 @@
+import json
+
+from pida.core.environment import parser
+from pida.core.startup import StartupTracer
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def traced():
+    clock = FakeClock()
+    tracer = StartupTracer(clock)
+    tracer.enable()
+    with tracer.span('register services', 'phase'):
+        with tracer.span('buffer', 'import', 'buffer'):
+            clock.now += 0.5
+        with tracer.span('project', 'import', 'project'):
+            clock.now += 0.25
+    with tracer.span('create services', 'phase'):
+        with tracer.span('buffer', 'create', 'buffer'):
+            clock.now += 1
+    with tracer.span('rope', 'plugin'):
+        with tracer.span('rope', 'start', 'rope'):
+            clock.now += 0.125
+    tracer.finish()
+    clock.now += 10
+    return tracer
+
+
+def test_disabled():
+    tracer = StartupTracer()
+    with tracer.span('buffer', 'create', 'buffer'):
+        pass
+    assert tracer.spans == []
+
+
+def test_services():
+    tracer = traced()
+    services = tracer.get_services()
+    assert [name for name, steps in services] == ['buffer', 'project', 'rope']
+    assert services[0][1] == {'import': 0.5, 'create': 1}
+    assert tracer.get_spans('phase') == [('register services', 0.75),
+                                         ('create services', 1)]
+    assert tracer.total == 1.875
+
+
+def test_report():
+    report = traced().report()
+    assert 'Startup took 1.875s' in report
+    assert 'register services' in report
+    assert 'Plugins:' in report
+    lines = report.splitlines()
+    buffer_line = [line for line in lines if line.strip().startswith('buffer')]
+    assert buffer_line[0].split() == ['buffer', '0.500', '1.000', '-', '1.500']
+
+
+def test_report_lazy():
+    tracer = traced()
+    tracer.mark_lazy('help')
+    tracer.mark_lazy('manhole')
+    with tracer.span('help', 'activate', 'help'):
+        pass
+    lines = tracer.report().splitlines()
+    assert 'Started eagerly: 3, lazily: 2 (1 activated)' in lines
+    assert '  lazy: help*, manhole' in lines
+
+
+def test_chrome_trace():
+    trace = traced().chrome_trace()
+    # has to survive the round trip
+    events = json.loads(json.dumps(trace))['traceEvents']
+    spans = [event for event in events if event['ph'] == 'X']
+    assert len(spans) == 7
+    create = [event for event in spans if event['cat'] == 'create'][0]
+    assert create['ts'] == 750000
+    assert create['dur'] == 1000000
+    assert create['args'] == {'service': 'buffer'}
+    threads = [event for event in events if event['ph'] == 'M']
+    assert len(threads) == 1
+
+
+def test_trace_startup_options():
+    opts = parser.parse_args(['--trace-startup', 'foo.py'])
+    assert opts.startup_trace
+    assert opts.startup_trace_json is None
+    assert opts.files == ['foo.py']
+    opts = parser.parse_args(['--trace-startup-json', 'trace.json'])
+    assert not opts.startup_trace
+    assert opts.startup_trace_json == 'trace.json'
+    assert opts.files == []
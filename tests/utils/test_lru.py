@@ -0,0 +1,21 @@
+from pida.utils.lru import LRUCache
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache['a'] = 1
+    cache['b'] = 2
+    assert cache['a'] == 1
+    cache['c'] = 3
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert len(cache) == 2
+
+
+def test_get_and_clear():
+    cache = LRUCache(2)
+    cache['a'] = None
+    assert cache['a'] is None
+    assert cache.get('b', 5) == 5
+    cache.clear()
+    assert len(cache) == 0
@@ -1,6 +1,6 @@
 import os.path
 from unittest import TestCase
-from pida.utils.path import get_line_from_file, get_relative_path
+from pida.utils.path import get_line_from_file, get_relative_path, PathTrie
 
 
 class TestPath(TestCase):
@@ -39,3 +39,37 @@ class TestPath(TestCase):
                          'e 2')
         self.assertEqual(get_line_from_file(fname, offset=150),
                          'it in up to the caller to do so')
+
+
+class TestPathTrie(TestCase):
+
+    def setUp(self):
+        self.trie = PathTrie()
+        self.trie['/a/b'] = 1
+        self.trie['/a/b/c/d'] = 2
+        self.trie['/x'] = 3
+
+    def test_lookup(self):
+        self.assertEqual(len(self.trie), 3)
+        self.assertEqual(self.trie['/a/b/'], 1)
+        self.assertTrue('/a/b/c/d' in self.trie)
+        self.assertFalse('/a/b/c' in self.trie)
+        self.assertEqual(self.trie.get('/a'), None)
+        self.assertRaises(KeyError, lambda: self.trie['/a/b/c'])
+
+    def test_longest_prefix(self):
+        self.assertEqual(self.trie.longest_prefix('/a/b/c/d/e.py'),
+                         ('/a/b/c/d', 2))
+        self.assertEqual(self.trie.longest_prefix('/a/b/c'), ('/a/b', 1))
+        self.assertEqual(self.trie.longest_prefix('/a/bc'), (None, None))
+        self.assertEqual(self.trie.longest_prefix('/'), (None, None))
+
+    def test_delete(self):
+        del self.trie['/a/b/c/d']
+        self.assertEqual(len(self.trie), 2)
+        self.assertEqual(self.trie.longest_prefix('/a/b/c/d/e.py'),
+                         ('/a/b', 1))
+        del self.trie['/a/b']
+        self.assertEqual(self.trie._root.keys(), ['x'])
+        self.assertRaises(KeyError, self.trie.__delitem__, '/a/b')
+        self.assertEqual(self.trie.items(), [('/x', 3)])
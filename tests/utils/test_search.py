@@ -0,0 +1,73 @@
+from pida.utils.search import TrigramIndex, trigrams, fuzzy_score
+
+
+def make_index():
+    index = TrigramIndex()
+    index.add('a', 'src/Main.py')
+    index.add('b', 'src/util.py')
+    index.add('c', 'docs/main.rst')
+    return index
+
+
+def test_trigrams():
+    assert trigrams('Abcd') == set(['abc', 'bcd'])
+    assert trigrams('ab') == set()
+
+
+def test_candidates():
+    index = make_index()
+    assert sorted(index.candidates('main')) == ['a', 'c']
+    assert sorted(index.candidates('.py')) == ['a', 'b']
+    assert index.candidates('nothing') == []
+    # too short to narrow anything down
+    assert index.candidates('ma') is None
+
+
+def test_subsequence_candidates():
+    index = make_index()
+    assert index.subsequence_candidates('mpy') is None
+    index = TrigramIndex(chars=True)
+    index.add('a', 'src/Main.py')
+    index.add('b', 'src/util.py')
+    index.add('c', 'docs/main.rst')
+    assert index.subsequence_candidates('MPY') == ['a']
+    assert index.subsequence_candidates('sm') == ['a', 'c']
+    assert index.subsequence_candidates('xz') == []
+    # the characters don't disturb trigram lookups
+    assert sorted(index.candidates('main')) == ['a', 'c']
+
+
+def test_remove():
+    index = make_index()
+    index.remove('a')
+    assert index.candidates('main') == ['c']
+    assert 'a' not in index
+    index.add('a', 'src/other.py')
+    assert index.candidates('main') == ['c']
+    assert sorted(index.candidates('.py')) == ['a', 'b']
+    index.compact()
+    assert sorted(index.candidates('.py')) == ['a', 'b']
+
+
+def test_state():
+    index = make_index()
+    index.remove('b')
+    copy = TrigramIndex.from_state(index.get_state())
+    assert len(copy) == 2
+    assert sorted(copy.candidates('main')) == ['a', 'c']
+    assert copy.candidates('util') == []
+    copy.add('b', 'src/util.py')
+    assert copy.candidates('util') == ['b']
+
+
+def test_fuzzy_score():
+    assert fuzzy_score('xyz', 'src/main.py') is None
+    # substring beats subsequence
+    assert fuzzy_score('main', 'src/main.py') > \
+           fuzzy_score('mnpy', 'src/main.py')
+    # basename beats directory
+    assert fuzzy_score('main', 'src/main.py') > \
+           fuzzy_score('main', 'main/foo.py')
+    # shorter paths win
+    assert fuzzy_score('main', 'src/main.py') > \
+           fuzzy_score('main', 'src/deeper/main.py')
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+    Measures parsing a large ctags file and ordering the outline parents
+    first, compared to the list based ordering used before.
+
+    Without arguments a tag file like the one of a generated C file is
+    written, otherwise the given tag file is used.
+
+    :copyright: 2005-2010 by The PIDA Project
+    :license: GPL 2 or later (see README/COPYING/LICENSE)
+"""
+import os
+import sys
+import time
+import tempfile
+from optparse import OptionParser
+
+import py
+root = py.path.local(__file__).dirpath().dirpath()
+sys.path.insert(0, str(root))
+sys.path.insert(0, str(root.join('pida-plugins')))
+
+from ctags.ctags import CtagsOutliner, parent_first
+
+
+def write_tagfile(path, count, members=20):
+    """Writes count tags, structs with members, sorted by name like ctags"""
+    lines = []
+    for i in xrange(0, count, members + 1):
+        struct = 'struct_%d' % i
+        lines.append('%s\tgenerated.c\t%d;"\tkind:s\n' % (struct, i))
+        for j in xrange(members):
+            lines.append('field_%d\tgenerated.c\t%d;"\tkind:m\tstruct:%s\n'
+                         % (j, i + j + 1, struct))
+    lines.sort()
+    with open(path, 'w') as fp:
+        fp.write('!_TAG_FILE_SORTED\t1\t/0=unsorted, 1=sorted/\n')
+        fp.writelines(lines)
+
+
+def list_parent_first(items):
+    """The ordering of the outliner before, quadratic"""
+    items = list(items)
+
+    def pop_parent_first(item):
+        p = item.parent
+        if p is not None and p in items:
+            for i in pop_parent_first(p):
+                yield i
+        else:
+            items.remove(item)
+            yield item
+    while len(items) != 0:
+        item = items[0]
+        for x in pop_parent_first(item):
+            yield x
+
+
+def bench(func, *args):
+    start = time.time()
+    rv = func(*args)
+    return time.time() - start, rv
+
+
+def main():
+    parser = OptionParser(usage='%prog [options] [tagfile]')
+    parser.add_option('-n', '--tags', type='int', default=20000)
+    parser.add_option('--skip-list', action='store_true',
+                      help="don't measure the old ordering, it's slow")
+    opts, args = parser.parse_args()
+    if args:
+        tagfile = args[0]
+    else:
+        h, tagfile = tempfile.mkstemp()
+        os.close(h)
+        write_tagfile(tagfile, opts.tags)
+
+    try:
+        outliner = CtagsOutliner(None, document=None)
+        took, tags = bench(outliner._parse_tagfile, tagfile)
+        items = list(tags)
+        print '%d tags' % len(items)
+        print 'parse tag file:         %8.3fs' % took
+        took, ordered = bench(lambda: list(parent_first(items)))
+        print 'parent first, dict:     %8.3fs' % took
+        if not opts.skip_list:
+            took, old = bench(lambda: list(list_parent_first(items)))
+            print 'parent first, list:     %8.3fs' % took
+            assert old == ordered
+    finally:
+        if not args:
+            os.unlink(tagfile)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+    Measures the doctype detection of the indexer, compared to matching
+    every glob with fnmatch like it was done before.
+
+    Without arguments synthetic paths are used, otherwise the files below
+    the given directory.
+
+    :copyright: 2005-2010 by The PIDA Project
+    :license: GPL 2 or later (see README/COPYING/LICENSE)
+"""
+import os
+import sys
+import time
+import random
+from glob import fnmatch
+from optparse import OptionParser
+
+import py
+sys.path.insert(0, str(py.path.local(__file__).dirpath().dirpath()))
+
+from pida.core.doctype import TypeManager
+from pida.services.language.deflang import DEFMAPPING
+
+EXTENSIONS = ['py', 'c', 'h', 'txt', 'xml', 'js', 'html', 'in', 'rst', 'o',
+              'png', 'sh', 'cpp', 'css', 'pyc', '']
+
+
+def fnmatch_type(doctypes, filename):
+    name = os.path.basename(filename)
+    best_glob = ''
+    for glob in doctypes._globs:
+        if fnmatch.fnmatch(name, glob) and len(glob) > len(best_glob):
+            best_glob = glob
+    if best_glob:
+        return doctypes._globs[best_glob][0]
+
+
+def synthetic_paths(count):
+    random.seed(0)
+    return ['/project/dir%d/file%d.%s' % (i % 1000, i,
+                                          random.choice(EXTENSIONS))
+            for i in xrange(count)]
+
+
+def tree_paths(top):
+    for base, dirs, files in os.walk(top):
+        for name in files:
+            yield os.path.join(base, name)
+
+
+def bench(lookup, paths):
+    start = time.time()
+    for path in paths:
+        lookup(path)
+    return time.time() - start
+
+
+def main():
+    parser = OptionParser(usage='%prog [options] [directory]')
+    parser.add_option('-n', '--files', type='int', default=100000)
+    parser.add_option('--skip-fnmatch', action='store_true',
+                      help="don't measure the fnmatch loop, it's slow")
+    opts, args = parser.parse_args()
+    if args:
+        paths = list(tree_paths(args[0]))
+    else:
+        paths = synthetic_paths(opts.files)
+
+    doctypes = TypeManager()
+    doctypes._parse_map(DEFMAPPING)
+    print '%d files, %d globs' % (len(paths), len(doctypes._globs))
+    cold = bench(doctypes.type_by_filename, paths)
+    print 'type_by_filename, cold cache: %8.3fs' % cold
+    warm = bench(doctypes.type_by_filename, paths)
+    print 'type_by_filename, warm cache: %8.3fs' % warm
+    if not opts.skip_fnmatch:
+        lookup = lambda path: fnmatch_type(doctypes, path)
+        print 'fnmatch over all globs:       %8.3fs' % bench(lookup, paths)
+
+
+if __name__ == '__main__':
+    main()
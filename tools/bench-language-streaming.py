@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+    Measures how many results per second an external language plugin can
+    stream back through the JobServer for different batch sizes.
+
+    A batch size of 1 behaves like the old one round trip per item
+    protocol.
+
+    :copyright: 2005-2010 by The PIDA Project
+    :license: GPL 2 or later (see README/COPYING/LICENSE)
+"""
+import sys
+import time
+from optparse import OptionParser
+
+import py
+sys.path.insert(0, str(py.path.local(__file__).dirpath().dirpath()))
+
+from pida.core.document import Document
+from pida.core.languages import External, JobServer, Outliner, ExternalProxy
+from pida.utils.languages import OutlineItem
+
+
+class BenchOutliner(Outliner):
+
+    items = 10000
+
+    def run(self):
+        for i in xrange(self.items):
+            yield OutlineItem(name="item %s" % i, line=i)
+
+
+class BenchProxy(ExternalProxy):
+    mytype = 'outliner'
+    _uuid = 'bench'
+
+
+class BenchExternal(External):
+    outliner = BenchOutliner
+
+
+def bench(batch_size, items, rounds):
+    BenchOutliner.items = items
+    jobserver = JobServer(None, BenchExternal, max_processes=1,
+                          batch_size=batch_size)
+    document = Document(None, __file__)
+    proxy = BenchProxy(None, document)
+    try:
+        # warm up, starts the process
+        list(jobserver.run(proxy))
+        start = time.time()
+        for i in xrange(rounds):
+            count = len(list(jobserver.run(proxy)))
+            assert count == items
+        return items * rounds / (time.time() - start)
+    finally:
+        jobserver.stop()
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('-n', '--items', type='int', default=10000)
+    parser.add_option('-r', '--rounds', type='int', default=3)
+    parser.add_option('-b', '--batch-size', type='int', action='append',
+                      dest='batch_sizes')
+    opts, args = parser.parse_args()
+    for batch_size in opts.batch_sizes or (1, 10, 50, 200):
+        rate = bench(batch_size, opts.items, opts.rounds)
+        print '%5d items/batch: %10.0f items/s' % (batch_size, rate)
+
+
+if __name__ == '__main__':
+    main()